@@ -0,0 +1,141 @@
+"""
+WhatsApp API Sender - Adaptive Concurrency Module
+Ajuste automático (AIMD) do número de envios simultâneos por instância do gateway
+"""
+
+import math
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+from rate_limiter import rate_limit_key
+
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_TARGET_P95 = 5.0  # segundos
+LATENCY_WINDOW = 20  # respostas usadas no cálculo do p95
+
+
+class AIMDConcurrencyLimiter:
+    """
+    Limite de envios em andamento ajustado pelo retorno do gateway.
+
+    - Aumento aditivo: enquanto o p95 da latência recente fica abaixo de
+      ``target_p95`` e o limite está todo em uso, sobe ~1 a cada ``limit``
+      respostas boas.
+    - Redução multiplicativa: timeout ou 5xx multiplica o limite por
+      ``decrease_factor``. Respostas de envios que começaram antes da última
+      redução não reduzem de novo (uma rajada de timeouts conta uma vez).
+
+    O limite de taxa (``rate_limit_per_minute``) continua valendo por cima.
+    """
+
+    def __init__(self, max_limit: int = DEFAULT_MAX_IN_FLIGHT, target_p95: float = DEFAULT_TARGET_P95,
+                 min_limit: int = 1, initial: int = 1, decrease_factor: float = 0.5,
+                 window: int = LATENCY_WINDOW, clock: Callable[[], float] = time.monotonic):
+        self.logger = logging.getLogger(__name__)
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.target_p95 = target_p95
+        self.decrease_factor = decrease_factor
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.in_flight = 0
+        self._latencies = deque(maxlen=window)
+        self._last_decrease = 0.0
+        self._changed: Optional[asyncio.Condition] = None
+        self._loop = None
+        self.clock = clock
+
+    def _condition(self) -> asyncio.Condition:
+        # Criada sob demanda para ficar presa ao loop que usa o limitador
+        loop = asyncio.get_running_loop()
+        if self._changed is None or self._loop is not loop:
+            self._changed = asyncio.Condition()
+            self._loop = loop
+        return self._changed
+
+    @property
+    def p95(self) -> Optional[float]:
+        if not self._latencies:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+
+    async def acquire(self) -> float:
+        """
+        Espera uma vaga de envio em andamento
+
+        Returns:
+            Horário (monotonic) de início, a ser devolvido em ``release``
+        """
+        condition = self._condition()
+        async with condition:
+            await condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return self.clock()
+
+    async def release(self, started_at: float, ok: bool, overloaded: bool = False) -> None:
+        """
+        Devolve a vaga e ajusta o limite
+
+        Args:
+            started_at: Valor retornado por ``acquire``
+            ok: Se o envio teve sucesso
+            overloaded: Timeout ou resposta 5xx do gateway
+        """
+        latency = self.clock() - started_at
+        condition = self._condition()
+        async with condition:
+            saturated = self.in_flight >= int(self.limit)
+            self.in_flight -= 1
+            if overloaded:
+                self._decrease(started_at)
+            elif ok:
+                self._latencies.append(latency)
+                p95 = self.p95
+                if p95 is not None and p95 > self.target_p95:
+                    self._decrease(started_at)
+                elif saturated and self.limit < self.max_limit:
+                    # Só cresce quando o limite atual está de fato sendo usado
+                    self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            condition.notify_all()
+
+    def _decrease(self, started_at: float) -> None:
+        if started_at < self._last_decrease:
+            return  # Já reduzido por causa desta mesma leva de envios
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self._last_decrease = self.clock()
+        self._latencies.clear()
+        if int(self.limit) != previous:
+            self.logger.warning(f"📉 Gateway sobrecarregado: envios simultâneos {previous} → {int(self.limit)}")
+
+    def stats(self) -> Dict[str, Any]:
+        p95 = self.p95
+        return {
+            'limit': int(self.limit),
+            'in_flight': self.in_flight,
+            'p95': round(p95, 3) if p95 is not None else None,
+            'target_p95': self.target_p95
+        }
+
+
+_limiters: Dict[str, AIMDConcurrencyLimiter] = {}
+
+
+def get_concurrency_limiter(config: Dict[str, Any]) -> AIMDConcurrencyLimiter:
+    """
+    Limitador da instância do gateway, compartilhado por todas as campanhas do processo
+
+    Chaves do config.json: ``max_in_flight`` (teto de envios simultâneos) e
+    ``target_latency_p95`` (segundos).
+    """
+    key = rate_limit_key(config)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = AIMDConcurrencyLimiter(
+            int(config.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT)),
+            float(config.get('target_latency_p95', DEFAULT_TARGET_P95))
+        )
+    return limiter
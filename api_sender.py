@@ -10,9 +10,62 @@ import csv
 import mimetypes
 import json
 import time
+import threading
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+
+from send_watchdog import SendWatchdog, SendStuckError, SendAbandonedError
+from rate_limiter import create_rate_limiter
+from sequence_compiler import CompiledSequence, CompiledStep
+from multipart_stream import MultipartStream
+
+
+class ObservedSession(requests.Session):
+    """
+    Session que anota, para o envio em andamento na thread atual, o último
+    status HTTP e se houve timeout. Usado para medir a saúde do gateway.
+    """
+    
+    def __init__(self):
+        super().__init__()
+        self.observer = threading.local()
+    
+    def send(self, request, **kwargs):
+        outcome = getattr(self.observer, 'outcome', None)
+        if outcome is not None and outcome.get('abandoned'):
+            # Envio abandonado pelo watchdog: nenhuma nova tentativa sai daqui
+            raise SendAbandonedError(request.url)
+        try:
+            response = super().send(request, **kwargs)
+        except requests.exceptions.Timeout:
+            if outcome is not None:
+                outcome['timed_out'] = True
+            raise
+        if outcome is not None:
+            if outcome.get('abandoned'):
+                response.close()
+                raise SendAbandonedError(request.url)
+            outcome['status'] = response.status_code
+        return response
+
+
+# Deadlines padrão (conexão, leitura) em segundos, por tipo de mensagem
+DEFAULT_TIMEOUTS = {
+    'text': (5, 30),
+    'media': (10, 120)
+}
+
+# Ajustes por provider
+PROVIDER_TIMEOUTS = {
+    'waha': {'media': (10, 60)}
+}
+
+# Tempo máximo de um envio completo (incluindo retentativas) antes do watchdog abandoná-lo
+DEFAULT_SEND_BUDGETS = {
+    'text': 60,
+    'media': 300
+}
 
 
 class WhatsAppAPISender:
@@ -30,7 +83,12 @@ class WhatsAppAPISender:
         """
         self.config = config
         self.logger = logging.getLogger(__name__)
-        self.session = requests.Session()
+        self.session = ObservedSession()
+        self.watchdog = SendWatchdog()
+        self._local = threading.local()
+        self._log_lock = threading.Lock()
+        # Limite da instância compartilhado com os outros processos que enviam por ela
+        self.rate_limiter = create_rate_limiter(config)
         self.log_filename = f"log_envios_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
         
         # Configurar headers da sessão
@@ -64,7 +122,34 @@ class WhatsAppAPISender:
             headers['apikey'] = token
         
         self.session.headers.update(headers)
-        self.session.timeout = self.config.get('timeout', 30)
+        # requests.Session ignora um atributo "timeout"; os deadlines são
+        # passados explicitamente em cada chamada via self._timeout()
+        self.timeouts = self._resolve_timeouts(provider)
+        self.send_budgets = {**DEFAULT_SEND_BUDGETS, **self.config.get('send_budget', {})}
+    
+    def _resolve_timeouts(self, provider: str) -> Dict[str, Tuple[float, float]]:
+        """
+        Monta os deadlines (conexão, leitura) por tipo de mensagem
+        
+        Ordem de precedência: config['timeouts'] > config['timeout'] (leitura
+        de texto, formato antigo) > ajustes do provider > padrão.
+        """
+        timeouts = {**DEFAULT_TIMEOUTS, **PROVIDER_TIMEOUTS.get(provider, {})}
+        
+        if 'timeout' in self.config:
+            timeouts['text'] = (timeouts['text'][0], float(self.config['timeout']))
+        
+        for kind, value in self.config.get('timeouts', {}).items():
+            if isinstance(value, (list, tuple)):
+                timeouts[kind] = (float(value[0]), float(value[1]))
+            else:
+                timeouts[kind] = (timeouts.get(kind, DEFAULT_TIMEOUTS['text'])[0], float(value))
+        
+        return timeouts
+    
+    def _timeout(self, kind: str) -> Tuple[float, float]:
+        """Deadline (conexão, leitura) para o tipo de mensagem"""
+        return self.timeouts.get(kind, self.timeouts['text'])
     
     def _init_log_file(self):
         """Inicializa o arquivo de log CSV"""
@@ -88,10 +173,18 @@ class WhatsAppAPISender:
         try:
             timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
             provider = self.config.get('provider', 'unknown')
+            # Na thread de um envio: o resultado só vale se o watchdog ainda não o abandonou
+            outcome = getattr(self.session.observer, 'outcome', None)
             
-            with open(self.log_filename, 'a', newline='', encoding='utf-8') as file:
-                writer = csv.writer(file)
-                writer.writerow([timestamp, numero, status, detalhes, provider])
+            with self._log_lock:
+                if outcome is not None:
+                    if outcome.get('abandoned'):
+                        self.logger.warning(f"Resultado tardio descartado para {numero}: {status}")
+                        return
+                    outcome['logged'] = True
+                with open(self.log_filename, 'a', newline='', encoding='utf-8') as file:
+                    writer = csv.writer(file)
+                    writer.writerow([timestamp, numero, status, detalhes, provider])
         except Exception as e:
             self.logger.error(f"Erro ao escrever no log: {e}")
     
@@ -99,6 +192,14 @@ class WhatsAppAPISender:
         """
         Envia uma mensagem via API do WhatsApp
         
+        Antes do envio, espera uma ficha do limitador da instância
+        (``rate_limit_per_minute``), que vale para todos os processos.
+        O envio roda sob o watchdog: se exceder o orçamento do seu tipo, é
+        abandonado, marcado como retentável (``last_send_retryable``) e conta
+        como falha. Não há reenvio automático: a requisição que estava no ar
+        pode ter chegado ao gateway, e reenviar duplicaria a mensagem; quem
+        decide reenviar é o usuário.
+        
         Args:
             numero: Número de telefone com DDI (ex: +5521999998888)
             mensagem: Texto da mensagem
@@ -107,6 +208,89 @@ class WhatsAppAPISender:
         Returns:
             bool: True se enviado com sucesso, False caso contrário
         """
+        kind = 'media' if caminho_midia else 'text'
+        return self._guarded_send(kind, numero, self._dispatch_message, numero, mensagem, caminho_midia)
+    
+    def send_compiled(self, numero: str, mensagem: str, step: CompiledStep,
+                      compiled: CompiledSequence, take_token: bool = True) -> bool:
+        """
+        Envia um passo de uma sequência compilada (``compile_sequence``)
+        
+        Endpoint, campos fixos, MIME e tamanho da mídia já foram resolvidos e
+        verificados na compilação; aqui só entram o número e o texto do contato.
+        Mesmo limite de taxa, watchdog e resultado de ``send_message``.
+        
+        Args:
+            numero: Número de telefone com DDI
+            mensagem: Texto (ou legenda) já renderizado para o contato
+            step: Passo compilado
+            compiled: Sequência compilada à qual o passo pertence
+            take_token: False quando o chamador já consumiu a ficha do limitador
+                (o ``CampaignRunner`` espera por ela no loop, onde parar/pausar interrompe)
+            
+        Returns:
+            bool: True se enviado com sucesso, False caso contrário
+        """
+        return self._guarded_send(step.kind, numero, self._dispatch_compiled, numero, mensagem, step, compiled,
+                                  take_token=take_token)
+    
+    def _guarded_send(self, kind: str, numero: str, dispatch, *args, take_token: bool = True) -> bool:
+        """Limite de taxa + watchdog + resultado detalhado em volta de um envio"""
+        outcome = {'abandoned': False, 'retryable': False, 'timed_out': False, 'status': None}
+        self._local.outcome = outcome
+        if take_token and self.rate_limiter is not None:
+            wait = self.rate_limiter.available_in()
+            if wait > 1:
+                self.logger.info(f"🚦 Limite da instância atingido; aguardando {wait:.1f}s")
+            self.rate_limiter.acquire()
+        
+        def observed_dispatch(*args):
+            # Roda na thread do watchdog: a sessão anota status/timeout neste envio
+            self.session.observer.outcome = outcome
+            try:
+                return dispatch(*args)
+            finally:
+                self.session.observer.outcome = None
+        
+        def abandon() -> bool:
+            # Mesmo lock do CSV: ou o envio já gravou o resultado, ou não grava mais nada
+            with self._log_lock:
+                if outcome.get('logged'):
+                    return False
+                outcome['abandoned'] = True
+                return True
+        
+        try:
+            return self.watchdog.run(
+                observed_dispatch, float(self.send_budgets.get(kind, DEFAULT_SEND_BUDGETS[kind])),
+                f"Envio de {kind} para {numero}", *args, on_abandon=abandon
+            )
+        except SendStuckError as e:
+            outcome['timed_out'] = True
+            outcome['retryable'] = True
+            self.log_result(numero, 'erro', f'{e} (retentável; entrega não confirmada, sem reenvio automático)')
+            return False
+    
+    @property
+    def last_send_outcome(self) -> Dict[str, Any]:
+        """
+        Resultado detalhado do último envio feito pela thread atual:
+        ``abandoned`` (pelo watchdog), ``retryable`` (abandonado sem resultado:
+        pode ser reenviado pelo usuário), ``timed_out`` e ``status`` HTTP
+        """
+        return getattr(self._local, 'outcome',
+                       {'abandoned': False, 'retryable': False, 'timed_out': False, 'status': None})
+    
+    @property
+    def last_send_abandoned(self) -> bool:
+        return self.last_send_outcome['abandoned']
+    
+    @property
+    def last_send_retryable(self) -> bool:
+        return self.last_send_outcome['retryable']
+    
+    def _dispatch_message(self, numero: str, mensagem: str, caminho_midia: str = '') -> bool:
+        """Encaminha o envio para o método do provider configurado"""
         try:
             provider = self.config.get('provider', '').lower()
             
@@ -130,6 +314,59 @@ class WhatsAppAPISender:
             self.log_result(numero, 'erro', str(e))
             return False
     
+    def _dispatch_compiled(self, numero: str, mensagem: str, step: CompiledStep,
+                           compiled: CompiledSequence) -> bool:
+        """Faz o POST de um passo compilado e avalia a resposta com a regra do provider"""
+        payload = step.payload(compiled.format_number(numero), mensagem)
+        attempts = compiled.media_attempts if step.is_media else 1
+        try:
+            for tentativa in range(attempts):
+                if step.is_media:
+                    response = self._post_multipart(step.url, payload, step.file_field, step.path,
+                                                    self._timeout('media'), step.mime_type, step.filename)
+                else:
+                    response = self.session.post(step.url, json=payload, timeout=self._timeout('text'))
+                
+                if response.status_code >= 500 and tentativa < attempts - 1:
+                    wait_time = (tentativa + 1) * 5  # 5s, 10s
+                    self.logger.warning(f"Erro do servidor ({response.status_code}); nova tentativa em {wait_time}s")
+                    time.sleep(wait_time)
+                    continue
+                break
+            
+            try:
+                result = response.json() if response.content else {}
+            except ValueError:
+                result = {}
+            if not isinstance(result, dict):
+                result = {}
+            
+            if compiled.is_success(response.status_code, result):
+                detalhes = f'Mídia enviada: {step.filename}' if step.is_media else 'Mensagem de texto enviada'
+                self.log_result(numero, 'sucesso', detalhes)
+                return True
+            error_msg = result.get('message') or result.get('error') or f'HTTP {response.status_code}'
+            self.log_result(numero, 'erro', str(error_msg))
+            return False
+        
+        except Exception as e:
+            self.logger.error(f"Erro no envio para {numero}: {e}")
+            self.log_result(numero, 'erro', str(e))
+            return False
+    
+    def _post_multipart(self, url: str, fields: Dict[str, Any], file_field: str, path: str,
+                        timeout, mime_type: Optional[str] = None, filename: Optional[str] = None):
+        """
+        POST multipart com o arquivo lido do disco em blocos (``MultipartStream``)
+        
+        O corpo tem Content-Length calculado antes e não é montado em memória;
+        cada retentativa relê o arquivo do início.
+        """
+        if mime_type is None:
+            mime_type, _ = mimetypes.guess_type(path)
+        body = MultipartStream({k: str(v) for k, v in fields.items()}, file_field, path, filename, mime_type)
+        return self.session.post(url, data=body, headers=body.headers, timeout=timeout)
+    
     def _send_via_waha(self, numero: str, mensagem: str, caminho_midia: str = '') -> bool:
         """Envia mensagem via API WAHA"""
         base_url = self.config.get('base_url', '')
@@ -164,7 +401,7 @@ class WhatsAppAPISender:
                 print(f"🔍 [WAHA DEBUG] Payload: {payload}")
                 
                 print(f"🔍 [WAHA DEBUG] Fazendo requisição POST...")
-                response = self.session.post(url, json=payload)
+                response = self.session.post(url, json=payload, timeout=self._timeout('text'))
                 print(f"🔍 [WAHA DEBUG] Status Code: {response.status_code}")
                 print(f"🔍 [WAHA DEBUG] Response Headers: {dict(response.headers)}")
                 
@@ -223,35 +460,28 @@ class WhatsAppAPISender:
             
             url = f"{base_url}{endpoint}"
             
-            # Preparar arquivos para upload
-            with open(caminho_midia, 'rb') as file:
-                files = {'file': file}
-                data = {
-                    'chatId': f"{numero}@c.us",
-                    'caption': caption,
-                    'session': instance_id
-                }
-                
-                # Enviar sem Content-Type header para upload de arquivo
-                headers = self.session.headers.copy()
-                if 'Content-Type' in headers:
-                    del headers['Content-Type']
-                
-                response = requests.post(url, files=files, data=data, headers=headers, timeout=60)
-                
-                if response.status_code in [200, 201]:  # 200 OK ou 201 Created
-                    result = response.json()
-                    # Para WAHA, se retornou 201 com dados da mensagem, é sucesso
-                    if response.status_code == 201 or result.get('success', False):
-                        self.log_result(numero, 'sucesso', f'Mídia enviada: {os.path.basename(caminho_midia)}')
-                        return True
-                    else:
-                        error_msg = result.get('message', 'Erro ao enviar mídia')
-                        self.log_result(numero, 'erro', error_msg)
-                        return False
+            # Campos do formulário; o arquivo vai em streaming no corpo multipart
+            data = {
+                'chatId': f"{numero}@c.us",
+                'caption': caption,
+                'session': instance_id
+            }
+            
+            response = self._post_multipart(url, data, 'file', caminho_midia, self._timeout('media'), mime_type)
+            
+            if response.status_code in [200, 201]:  # 200 OK ou 201 Created
+                result = response.json()
+                # Para WAHA, se retornou 201 com dados da mensagem, é sucesso
+                if response.status_code == 201 or result.get('success', False):
+                    self.log_result(numero, 'sucesso', f'Mídia enviada: {os.path.basename(caminho_midia)}')
+                    return True
                 else:
-                    self.log_result(numero, 'erro', f'HTTP {response.status_code} ao enviar mídia')
+                    error_msg = result.get('message', 'Erro ao enviar mídia')
+                    self.log_result(numero, 'erro', error_msg)
                     return False
+            else:
+                self.log_result(numero, 'erro', f'HTTP {response.status_code} ao enviar mídia')
+                return False
                     
         except Exception as e:
             self.logger.error(f"Erro ao enviar mídia WAHA para {numero}: {e}")
@@ -270,14 +500,12 @@ class WhatsAppAPISender:
                 # Enviar arquivo
                 url = f"{base_url}/sendFile"
                 
-                with open(caminho_midia, 'rb') as file:
-                    files = {'file': file}
-                    data = {
-                        'phone': numero_limpo,
-                        'body': mensagem
-                    }
-                    
-                    response = self.session.post(url, files=files, data=data)
+                data = {
+                    'phone': numero_limpo,
+                    'body': mensagem
+                }
+                
+                response = self._post_multipart(url, data, 'file', caminho_midia, self._timeout('media'))
             else:
                 # Enviar texto
                 url = f"{base_url}/sendMessage"
@@ -286,7 +514,7 @@ class WhatsAppAPISender:
                     "body": mensagem
                 }
                 
-                response = self.session.post(url, json=payload)
+                response = self.session.post(url, json=payload, timeout=self._timeout('text'))
             
             if response.status_code == 200:
                 result = response.json()
@@ -319,14 +547,12 @@ class WhatsAppAPISender:
                 # Para Z-API, geralmente precisa fazer upload primeiro
                 url = f"{base_url}/instances/{instance_id}/token/{token}/send-document"
                 
-                with open(caminho_midia, 'rb') as file:
-                    files = {'file': file}
-                    data = {
-                        'phone': numero_limpo,
-                        'message': mensagem
-                    }
-                    
-                    response = self.session.post(url, files=files, data=data)
+                data = {
+                    'phone': numero_limpo,
+                    'message': mensagem
+                }
+                
+                response = self._post_multipart(url, data, 'file', caminho_midia, self._timeout('media'))
             else:
                 # Enviar texto
                 url = f"{base_url}/instances/{instance_id}/token/{token}/send-text"
@@ -335,7 +561,7 @@ class WhatsAppAPISender:
                     "message": mensagem
                 }
                 
-                response = self.session.post(url, json=payload)
+                response = self.session.post(url, json=payload, timeout=self._timeout('text'))
             
             if response.status_code == 200:
                 result = response.json()
@@ -367,15 +593,13 @@ class WhatsAppAPISender:
                 # Enviar documento
                 url = f"{base_url}/messages/document"
                 
-                with open(caminho_midia, 'rb') as file:
-                    files = {'document': file}
-                    data = {
-                        'token': token,
-                        'to': numero_limpo,
-                        'caption': mensagem
-                    }
-                    
-                    response = self.session.post(url, files=files, data=data)
+                data = {
+                    'token': token,
+                    'to': numero_limpo,
+                    'caption': mensagem
+                }
+                
+                response = self._post_multipart(url, data, 'document', caminho_midia, self._timeout('media'))
             else:
                 # Enviar texto
                 url = f"{base_url}/messages/chat"
@@ -385,7 +609,7 @@ class WhatsAppAPISender:
                     "body": mensagem
                 }
                 
-                response = self.session.post(url, json=payload)
+                response = self.session.post(url, json=payload, timeout=self._timeout('text'))
             
             if response.status_code == 200:
                 result = response.json()
@@ -417,14 +641,12 @@ class WhatsAppAPISender:
                 endpoint = self.config.get('media_endpoint', '/send-media')
                 url = f"{base_url}{endpoint}"
                 
-                with open(caminho_midia, 'rb') as file:
-                    files = {'file': file}
-                    data = {
-                        'phone': numero_limpo,
-                        'message': mensagem
-                    }
-                    
-                    response = self.session.post(url, files=files, data=data)
+                data = {
+                    'phone': numero_limpo,
+                    'message': mensagem
+                }
+                
+                response = self._post_multipart(url, data, 'file', caminho_midia, self._timeout('media'))
             else:
                 # Envio de texto genérico
                 endpoint = self.config.get('text_endpoint', '/send-message')
@@ -434,7 +656,7 @@ class WhatsAppAPISender:
                     "message": mensagem
                 }
                 
-                response = self.session.post(url, json=payload)
+                response = self.session.post(url, json=payload, timeout=self._timeout('text'))
             
             if response.status_code == 200:
                 self.log_result(numero, 'sucesso', 'Mensagem enviada (genérico)')
@@ -481,7 +703,7 @@ class WhatsAppAPISender:
                 print(f"🔍 [EVOLUTION DEBUG] Payload: {payload}")
                 
                 print(f"🔍 [EVOLUTION DEBUG] Fazendo requisição POST...")
-                response = self.session.post(url, json=payload)
+                response = self.session.post(url, json=payload, timeout=self._timeout('text'))
                 print(f"🔍 [EVOLUTION DEBUG] Status Code: {response.status_code}")
                 print(f"🔍 [EVOLUTION DEBUG] Response Headers: {dict(response.headers)}")
                 
@@ -523,7 +745,9 @@ class WhatsAppAPISender:
     def _send_media_evolution_api(self, numero: str, caption: str, caminho_midia: str, base_url: str, instance_id: str) -> bool:
         """Envia arquivo de mídia via Evolution API com retry logic avançado"""
         max_tentativas = 3
-        timeouts = [30, 60, 120]  # Timeouts progressivos
+        # Timeouts de leitura progressivos (1/4, 1/2 e o total do orçamento de mídia)
+        connect_timeout, read_timeout = self._timeout('media')
+        timeouts = [(connect_timeout, read_timeout * f) for f in (0.25, 0.5, 1.0)]
         
         # Validações iniciais
         if not os.path.exists(caminho_midia):
@@ -548,96 +772,88 @@ class WhatsAppAPISender:
                 print(f"🔗 [MÍDIA] URL: {url}")
                 print(f"📎 [MÍDIA] Tipo: {media_type} | Tamanho: {tamanho_mb:.1f}MB")
                 
-                # Preparar dados para upload
-                with open(caminho_midia, 'rb') as file:
-                    files = {'attachment': file}
-                    data = {
-                        'number': numero,
-                        'caption': caption,
-                        'mediatype': media_type
-                    }
-                    
-                    # Headers otimizados para upload
-                    headers = self.session.headers.copy()
-                    if 'Content-Type' in headers:
-                        del headers['Content-Type']
-                    
-                    timeout = timeouts[min(tentativa, len(timeouts) - 1)]
-                    print(f"⏱️  [MÍDIA] Timeout: {timeout}s")
-                    
-                    response = requests.post(url, files=files, data=data, 
-                                           headers=headers, timeout=timeout)
-                    
-                    print(f"📡 [MÍDIA] Status: {response.status_code}")
-                    
-                    # Verificar resposta
-                    if response.status_code in [200, 201]:
-                        try:
-                            result = response.json()
-                            print(f"📋 [MÍDIA] Resposta: {result}")
+                # Campos do formulário; o arquivo vai em streaming no corpo multipart
+                data = {
+                    'number': numero,
+                    'caption': caption,
+                    'mediatype': media_type
+                }
+                
+                timeout = timeouts[min(tentativa, len(timeouts) - 1)]
+                print(f"⏱️  [MÍDIA] Timeout: {timeout[1]:.0f}s")
+                
+                response = self._post_multipart(url, data, 'attachment', caminho_midia, timeout, mime_type)
+                
+                print(f"📡 [MÍDIA] Status: {response.status_code}")
+                
+                # Verificar resposta
+                if response.status_code in [200, 201]:
+                    try:
+                        result = response.json()
+                        print(f"📋 [MÍDIA] Resposta: {result}")
+                        
+                        # Verificar sucesso da Evolution API
+                        if result.get('key') or result.get('messageId') or result.get('id'):
+                            print(f"✅ [MÍDIA] Mídia enviada com sucesso!")
+                            self.log_result(numero, 'sucesso', 
+                                          f'Mídia enviada: {os.path.basename(caminho_midia)} ({tamanho_mb:.1f}MB)')
+                            return True
+                        else:
+                            error_msg = result.get('message', 'Resposta sem ID válido')
+                            print(f"⚠️  [MÍDIA] Falha na API: {error_msg}")
                             
-                            # Verificar sucesso da Evolution API
-                            if result.get('key') or result.get('messageId') or result.get('id'):
-                                print(f"✅ [MÍDIA] Mídia enviada com sucesso!")
-                                self.log_result(numero, 'sucesso', 
-                                              f'Mídia enviada: {os.path.basename(caminho_midia)} ({tamanho_mb:.1f}MB)')
-                                return True
-                            else:
-                                error_msg = result.get('message', 'Resposta sem ID válido')
-                                print(f"⚠️  [MÍDIA] Falha na API: {error_msg}")
-                                
-                                if tentativa < max_tentativas - 1:
-                                    print(f"🔄 [MÍDIA] Tentando novamente em 3s...")
-                                    import time
-                                    time.sleep(3)
-                                    continue
-                                else:
-                                    self.log_result(numero, 'erro', error_msg)
-                                    return False
-                                    
-                        except json.JSONDecodeError as json_error:
-                            print(f"⚠️  [MÍDIA] Erro JSON: {json_error}")
                             if tentativa < max_tentativas - 1:
-                                print(f"🔄 [MÍDIA] Tentando novamente...")
+                                print(f"🔄 [MÍDIA] Tentando novamente em 3s...")
                                 import time
-                                time.sleep(2)
+                                time.sleep(3)
                                 continue
                             else:
-                                self.log_result(numero, 'erro', f'Erro JSON: {json_error}')
+                                self.log_result(numero, 'erro', error_msg)
                                 return False
-                    
-                    elif response.status_code == 401:
-                        print(f"🔐 [MÍDIA] Erro de autenticação (401)")
-                        self.log_result(numero, 'erro', 'Token de API inválido')
-                        return False  # Não tentar novamente para erro de auth
-                    
-                    elif response.status_code == 413:
-                        print(f"📏 [MÍDIA] Arquivo muito grande (413)")
-                        self.log_result(numero, 'erro', 'Arquivo excede limite do servidor')
-                        return False  # Não tentar novamente para arquivo grande
-                    
-                    elif response.status_code in [500, 502, 503, 504]:
-                        print(f"🔧 [MÍDIA] Erro do servidor ({response.status_code})")
-                        if tentativa < max_tentativas - 1:
-                            wait_time = (tentativa + 1) * 5  # 5s, 10s, 15s
-                            print(f"⏳ [MÍDIA] Aguardando {wait_time}s antes de tentar novamente...")
-                            import time
-                            time.sleep(wait_time)
-                            continue
-                        else:
-                            self.log_result(numero, 'erro', f'Erro servidor: HTTP {response.status_code}')
-                            return False
-                    
-                    else:
-                        print(f"❌ [MÍDIA] HTTP {response.status_code}")
+                                
+                    except json.JSONDecodeError as json_error:
+                        print(f"⚠️  [MÍDIA] Erro JSON: {json_error}")
                         if tentativa < max_tentativas - 1:
                             print(f"🔄 [MÍDIA] Tentando novamente...")
                             import time
                             time.sleep(2)
                             continue
                         else:
-                            self.log_result(numero, 'erro', f'HTTP {response.status_code}')
+                            self.log_result(numero, 'erro', f'Erro JSON: {json_error}')
                             return False
+                
+                elif response.status_code == 401:
+                    print(f"🔐 [MÍDIA] Erro de autenticação (401)")
+                    self.log_result(numero, 'erro', 'Token de API inválido')
+                    return False  # Não tentar novamente para erro de auth
+                
+                elif response.status_code == 413:
+                    print(f"📏 [MÍDIA] Arquivo muito grande (413)")
+                    self.log_result(numero, 'erro', 'Arquivo excede limite do servidor')
+                    return False  # Não tentar novamente para arquivo grande
+                
+                elif response.status_code in [500, 502, 503, 504]:
+                    print(f"🔧 [MÍDIA] Erro do servidor ({response.status_code})")
+                    if tentativa < max_tentativas - 1:
+                        wait_time = (tentativa + 1) * 5  # 5s, 10s, 15s
+                        print(f"⏳ [MÍDIA] Aguardando {wait_time}s antes de tentar novamente...")
+                        import time
+                        time.sleep(wait_time)
+                        continue
+                    else:
+                        self.log_result(numero, 'erro', f'Erro servidor: HTTP {response.status_code}')
+                        return False
+                
+                else:
+                    print(f"❌ [MÍDIA] HTTP {response.status_code}")
+                    if tentativa < max_tentativas - 1:
+                        print(f"🔄 [MÍDIA] Tentando novamente...")
+                        import time
+                        time.sleep(2)
+                        continue
+                    else:
+                        self.log_result(numero, 'erro', f'HTTP {response.status_code}')
+                        return False
                             
             except requests.exceptions.Timeout:
                 print(f"⏰ [MÍDIA] Timeout na tentativa {tentativa + 1}")
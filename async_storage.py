@@ -0,0 +1,138 @@
+"""
+WhatsApp API Sender - Async Storage Module
+E/S de arquivos para as rotas assíncronas: pool de threads limitado,
+gravação atômica (arquivo temporário + rename) e cache de JSON em memória
+"""
+
+import os
+import copy
+import stat
+import json
+import asyncio
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+DEFAULT_WORKERS = 4
+
+_MISSING = object()
+
+
+def write_atomic(path: str, write: Callable[[str], None]) -> None:
+    """
+    Grava ``path`` sem deixar arquivo pela metade: ``write(temp)`` gera o
+    conteúdo num temporário do mesmo diretório, que substitui o destino
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix=os.path.splitext(path)[1])
+    os.close(fd)
+    try:
+        write(temp_path)
+        if not os.path.exists(temp_path) or os.path.getsize(temp_path) == 0:
+            raise IOError(f"Nada foi gravado para {path}")
+        # mkstemp cria com 0600: mantém as permissões do arquivo substituído
+        mode = stat.S_IMODE(os.stat(path).st_mode) if os.path.exists(path) else 0o644
+        os.chmod(temp_path, mode)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def _write_json_file(path: str, text: str) -> None:
+    def write(temp_path: str) -> None:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+    write_atomic(path, write)
+
+
+def _read_json_file(path: str) -> Any:
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+class AsyncStorage:
+    """
+    Acesso a disco fora do event loop, num pool próprio (``max_workers``
+    threads), para não disputar o executor padrão usado pelos envios.
+
+    JSON lido fica em cache até ser regravado por ``write_json`` (ou
+    ``invalidate``); cada leitura devolve uma cópia. Gravações no mesmo
+    arquivo são serializadas; leituras nunca esperam por gravações.
+    """
+
+    def __init__(self, max_workers: int = DEFAULT_WORKERS):
+        self.logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='storage')
+        self._cache: Dict[str, Any] = {}
+        self._generations: Dict[str, int] = {}  # Incrementado a cada gravação/invalidação
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+
+    async def run(self, fn: Callable, *args) -> Any:
+        """Executa uma função bloqueante no pool de E/S"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+
+    async def read_json(self, path: str, default: Any = _MISSING) -> Any:
+        """
+        JSON de ``path`` (do cache, se já lido)
+
+        Raises:
+            FileNotFoundError: Arquivo inexistente e sem ``default``
+            json.JSONDecodeError: JSON inválido
+        """
+        key = os.path.abspath(path)
+        if key in self._cache:
+            return copy.deepcopy(self._cache[key])
+        generation = self._generations.get(key, 0)
+        try:
+            data = await self.run(_read_json_file, key)
+        except FileNotFoundError:
+            if default is _MISSING:
+                raise
+            return default
+        # Uma gravação durante a leitura torna o conteúdo lido antigo: não vai para o cache
+        if self._generations.get(key, 0) == generation:
+            self._cache[key] = data
+            return copy.deepcopy(data)
+        return data
+
+    async def write_json(self, path: str, data: Any, indent: int = 2) -> None:
+        """Grava JSON de forma atômica e atualiza o cache"""
+        key = os.path.abspath(path)
+        text = json.dumps(data, ensure_ascii=False, indent=indent)
+        lock = self._write_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            self.invalidate(key)
+            await self.run(_write_json_file, key, text)
+            self._cache[key] = copy.deepcopy(data)
+
+    async def write_file(self, path: str, write: Callable[[str], None]) -> None:
+        """Gera um arquivo qualquer de forma atômica (``write`` recebe o caminho temporário)"""
+        key = os.path.abspath(path)
+        lock = self._write_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            self.invalidate(key)
+            await self.run(write_atomic, key, write)
+            self.invalidate(key)
+
+    async def listdir(self, path: str) -> List[str]:
+        try:
+            return await self.run(os.listdir, path)
+        except FileNotFoundError:
+            return []
+
+    def invalidate(self, path: str) -> None:
+        key = os.path.abspath(path)
+        self._cache.pop(key, None)
+        self._generations[key] = self._generations.get(key, 0) + 1
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False)
+
+
+storage = AsyncStorage()
@@ -0,0 +1,265 @@
+"""
+WhatsApp API Sender - Background Jobs Module
+Importação e validação de contatos em processos separados (ProcessPoolExecutor),
+com progresso consultável e resultados entregues em lotes ao servidor
+"""
+
+import time
+import uuid
+import queue
+import asyncio
+import logging
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils import iter_contact_batches, load_sheet_contacts, resolve_sheet_names, validate_phone_number
+
+BATCH_SIZE = 2000
+MAX_FINISHED_JOBS = 50  # Jobs concluídos mantidos para consulta
+POLL_SECONDS = 0.5
+
+QUEUED = 'queued'
+RUNNING = 'running'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+logger = logging.getLogger(__name__)
+
+
+def _import_worker(results, file_path: str, sheet_name: str, batch_size: int) -> int:
+    """
+    Roda no processo do pool, uma aba por chamada: envia ('total', n),
+    ('batch', lote) e por fim ('done', (aba, quantidade, erro))
+    """
+    count = 0
+    try:
+        for batch in iter_contact_batches(file_path, batch_size, lambda total: results.put(('total', total)),
+                                          sheet_name):
+            count += len(batch)
+            results.put(('batch', batch))
+    except ValueError as e:
+        # Aba sem a coluna Numero (ou vazia): as demais seguem
+        results.put(('done', (sheet_name, count, str(e))))
+        return count
+    results.put(('done', (sheet_name, count, None)))
+    return count
+
+
+def _validate_worker(numbers: List[str]) -> List[Optional[str]]:
+    """Roda no processo do pool: número formatado (E.164) ou None, na mesma ordem"""
+    return [validate_phone_number(number) for number in numbers]
+
+
+class BackgroundJob:
+    """Estado de um job, serializado por ``to_dict()`` em /api/jobs/<id>"""
+
+    def __init__(self, kind: str, description: str = ''):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.description = description
+        self.status = QUEUED
+        self.done = 0
+        self.total: Optional[int] = None
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.task: Optional[asyncio.Task] = None
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (COMPLETED, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        percent = None
+        if self.total:
+            percent = round(min(self.done / self.total, 1.0) * 100, 1)
+        elif self.status == COMPLETED:
+            percent = 100.0
+        return {
+            'job_id': self.id,
+            'kind': self.kind,
+            'description': self.description,
+            'status': self.status,
+            'progress': {'done': self.done, 'total': self.total, 'percent': percent},
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'finished_at': self.finished_at
+        }
+
+
+class JobManager:
+    """
+    Jobs pesados fora do processo do servidor.
+
+    O trabalho de CPU (openpyxl, regex de validação) roda no pool de
+    processos; o loop do servidor só recebe os lotes prontos e os aplica ao
+    estado, então status, proxy e QR continuam respondendo durante uma
+    importação grande.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, batch_size: int = BATCH_SIZE):
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+        self.jobs: 'OrderedDict[str, BackgroundJob]' = OrderedDict()
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._mp_manager = None
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._pool
+
+    def _result_queue(self):
+        # Fila de um Manager: pode ser passada como argumento para o pool
+        if self._mp_manager is None:
+            self._mp_manager = multiprocessing.Manager()
+        return self._mp_manager.Queue()
+
+    def get(self, job_id: str) -> Optional[BackgroundJob]:
+        return self.jobs.get(job_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        return [job.to_dict() for job in reversed(self.jobs.values())]
+
+    def submit(self, kind: str, work: Callable[[BackgroundJob], Awaitable[Any]],
+               description: str = '') -> BackgroundJob:
+        """
+        Agenda ``work(job)`` no loop atual; o retorno vira ``job.result``
+
+        Returns:
+            O job criado (``job.id`` é o identificador da API)
+        """
+        job = BackgroundJob(kind, description)
+        self.jobs[job.id] = job
+        self._prune()
+        job.task = asyncio.get_running_loop().create_task(self._run(job, work))
+        return job
+
+    async def _run(self, job: BackgroundJob, work: Callable[[BackgroundJob], Awaitable[Any]]) -> None:
+        job.status = RUNNING
+        try:
+            job.result = await work(job)
+            job.status = COMPLETED
+        except Exception as e:
+            logger.error(f"Job {job.kind} {job.id} falhou: {e}")
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished_at = time.time()
+
+    def _prune(self) -> None:
+        finished = [job_id for job_id, job in self.jobs.items() if job.finished]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self.jobs[job_id]
+
+    async def import_contacts(self, job: BackgroundJob, file_path: str,
+                              on_batch: Callable[[List[Dict[str, str]]], None],
+                              sheets: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Lê as abas da planilha em paralelo no pool e entrega cada lote a
+        ``on_batch`` no loop (lotes de abas diferentes podem se intercalar)
+
+        Returns:
+            ``total`` importado, contagem por aba (``sheets``) e abas ignoradas (``skipped``)
+
+        Raises:
+            ValueError: Aba inexistente ou nenhuma aba com a coluna Numero
+        """
+        loop = asyncio.get_running_loop()
+        sheet_names = await loop.run_in_executor(None, resolve_sheet_names, file_path, sheets)
+
+        results = self._result_queue()
+        futures = [asyncio.wrap_future(self.pool.submit(_import_worker, results, file_path, name, self.batch_size))
+                   for name in sheet_names]
+        counts: Dict[str, int] = {}
+        skipped: Dict[str, str] = {}
+        job.total = 0
+        while len(counts) + len(skipped) < len(sheet_names):
+            try:
+                kind, payload = await loop.run_in_executor(None, results.get, True, POLL_SECONDS)
+            except queue.Empty:
+                if all(future.done() for future in futures):
+                    for future in futures:
+                        future.result()  # Propaga o erro do processo (arquivo inválido, etc.)
+                    raise RuntimeError('Importação terminou sem concluir a leitura')
+                continue
+            if kind == 'total':
+                job.total += payload
+            elif kind == 'batch':
+                on_batch(payload)
+                job.done += len(payload)
+            else:
+                name, count, error = payload
+                if error:
+                    skipped[name] = error
+                else:
+                    counts[name] = count
+
+        await asyncio.gather(*futures)
+        if not counts:
+            raise ValueError(next(iter(skipped.values())))
+        return {'total': sum(counts.values()), 'sheets': counts, 'skipped': skipped}
+
+    async def load_contacts(self, file_path: str, sheets: Optional[List[str]] = None) -> List[Dict[str, str]]:
+        """
+        Mesmo resultado de ``load_contacts_from_excel`` (abas em ordem, com
+        ``aba``), mas lido em paralelo no pool compartilhado e aguardado sem
+        bloquear o loop
+
+        Raises:
+            FileNotFoundError: Se o arquivo não for encontrado
+            ValueError: Aba inexistente ou nenhuma aba com a coluna Numero
+        """
+        loop = asyncio.get_running_loop()
+        sheet_names = await loop.run_in_executor(None, resolve_sheet_names, file_path, sheets)
+        futures = [asyncio.wrap_future(self.pool.submit(load_sheet_contacts, file_path, name))
+                   for name in sheet_names]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+
+        contacts: List[Dict[str, str]] = []
+        errors = []
+        for name, result in zip(sheet_names, results):
+            if isinstance(result, ValueError):
+                logger.warning(f"Aba '{name}' ignorada: {result}")
+                errors.append(result)
+            elif isinstance(result, BaseException):
+                raise result
+            else:
+                contacts.extend(result)
+        if errors and len(errors) == len(sheet_names):
+            raise errors[0]
+        return contacts
+
+    async def validate_numbers(self, job: BackgroundJob, numbers: List[str],
+                               on_batch: Callable[[int, List[Optional[str]]], None]) -> int:
+        """
+        Valida os números em lotes no pool; ``on_batch(início, resultados)``
+        é chamado na ordem dos lotes
+
+        Returns:
+            Quantidade de números processados
+        """
+        job.total = len(numbers)
+        futures = [(start, asyncio.wrap_future(self.pool.submit(
+            _validate_worker, numbers[start:start + self.batch_size])))
+            for start in range(0, len(numbers), self.batch_size)]
+        for start, future in futures:
+            on_batch(start, await future)
+            job.done = min(start + self.batch_size, len(numbers))
+        return len(numbers)
+
+    def shutdown(self) -> None:
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self._mp_manager is not None:
+            self._mp_manager.shutdown()
+            self._mp_manager = None
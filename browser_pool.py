@@ -0,0 +1,274 @@
+"""
+WhatsApp API Sender - Browser Pool Module
+Pool de navegadores headless mantidos "aquecidos" no dashboard do WAHA
+"""
+
+import asyncio
+import base64
+import logging
+import time
+from typing import Optional, Tuple
+
+from async_storage import write_atomic
+
+# Configuração do logger
+logger = logging.getLogger(__name__)
+
+WAHA_DASHBOARD_URL = 'http://localhost:3000/dashboard/'
+
+# Seletores possíveis para o QR code, em ordem de preferência
+QR_SELECTORS = [
+    'canvas',  # QR code geralmente é renderizado em canvas
+    '[data-testid="qr-code"]',
+    '.qr-code',
+    '#qr-code',
+    'img[alt*="QR"]',
+    'img[src*="qr"]',
+    'svg',  # QR code pode ser SVG
+    '.p-image',  # PrimeVue image component
+    '[role="img"]'  # Elementos com role de imagem
+]
+
+
+def _write_debug_files(full_screenshot: bytes, page_content: str) -> None:
+    """Grava os arquivos de depuração de uma captura sem QR (roda no executor)"""
+    def write_png(temp_path: str) -> None:
+        with open(temp_path, 'wb') as f:
+            f.write(full_screenshot)
+
+    def write_html(temp_path: str) -> None:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(page_content)
+
+    # Atômico: capturas paralelas podem gravar os mesmos arquivos
+    write_atomic('debug_full_page.png', write_png)
+    write_atomic('debug_page_content.html', write_html)
+
+
+class WAHADashboardPool:
+    """
+    Mantém um Chromium headless de longa duração com páginas já carregadas no
+    dashboard do WAHA, evitando lançar um navegador novo a cada captura.
+
+    A última captura válida fica em cache por ``cache_ttl`` segundos.
+    Capturas sem ``force`` compartilham a que estiver em andamento; capturas
+    forçadas rodam em paralelo, cada uma numa página do pool (até
+    ``pool_size`` ao mesmo tempo).
+    """
+
+    def __init__(self, dashboard_url: str = WAHA_DASHBOARD_URL, pool_size: int = 1,
+                 cache_ttl: float = 15.0, wait_timeout: int = 15000):
+        self.dashboard_url = dashboard_url
+        self.pool_size = max(1, pool_size)
+        self.cache_ttl = cache_ttl
+        self.wait_timeout = wait_timeout
+
+        self.playwright = None
+        self.browser = None
+        self.context = None
+        self.pages: Optional[asyncio.Queue] = None
+        self.lock = asyncio.Lock()
+        self._page_count = 0  # Páginas vivas do pool: livres na fila ou em uso
+        self._shared_capture: Optional[asyncio.Future] = None
+
+        self._cached_qr: Optional[str] = None
+        self._cached_at = 0.0
+
+    async def _ensure_started(self) -> None:
+        """Inicia o navegador e aquece as páginas do pool, se necessário"""
+        async with self.lock:
+            if self.browser and self.browser.is_connected():
+                return
+
+            from playwright.async_api import async_playwright
+
+            if self.playwright:
+                # Navegador caiu: encerrar o Playwright anterior antes de relançar
+                logger.warning("Navegador do pool desconectado, reiniciando...")
+                try:
+                    await self.playwright.stop()
+                except Exception as e:
+                    logger.debug(f"Erro ao encerrar o Playwright anterior: {e}")
+                self.playwright = None
+                self.browser = None
+                self.context = None
+                self.pages = None
+                self._page_count = 0
+
+            logger.info("Iniciando pool de navegador para o dashboard WAHA...")
+            self.playwright = await async_playwright().start()
+            self.browser = await self.playwright.chromium.launch(headless=True)
+            self.context = await self.browser.new_context(
+                viewport={'width': 1280, 'height': 720}
+            )
+            self.pages = asyncio.Queue()
+            for _ in range(self.pool_size):
+                self.pages.put_nowait(await self._new_warm_page())
+                self._page_count += 1
+            logger.info(f"Pool de navegador pronto com {self.pool_size} página(s)")
+
+    async def _new_warm_page(self):
+        """Abre uma página no dashboard e aguarda a SPA terminar de carregar"""
+        page = await self.context.new_page()
+        try:
+            await page.goto(self.dashboard_url, wait_until='networkidle')
+        except BaseException:
+            await self._discard_page(page)
+            raise
+        try:
+            await page.wait_for_selector('#loading-body', state='hidden', timeout=self.wait_timeout)
+        except Exception:
+            pass  # Se não encontrar o loading, continua
+        return page
+
+    def _cache_valid(self) -> bool:
+        return self._cached_qr is not None and (time.monotonic() - self._cached_at) < self.cache_ttl
+
+    async def capture_qr(self, force: bool = False) -> Tuple[str, Optional[str]]:
+        """
+        Captura o QR code do dashboard WAHA
+
+        Args:
+            force: Ignorar o cache e capturar novamente
+
+        Returns:
+            Tupla (qr_base64, nota); a nota é preenchida quando o QR específico
+            não foi encontrado e foi capturada a área central da página
+        """
+        if not force and self._cache_valid():
+            return self._cached_qr, None
+        if force:
+            return await self._capture()
+
+        # Quem chega durante uma captura reaproveita o resultado dela
+        if self._shared_capture is None or self._shared_capture.done():
+            self._shared_capture = asyncio.ensure_future(self._capture())
+        return await asyncio.shield(self._shared_capture)
+
+    async def _capture(self) -> Tuple[str, Optional[str]]:
+        """Captura numa página livre do pool; outras capturas usam as demais páginas"""
+        await self._ensure_started()
+        pages = self.pages
+        page = await self._acquire_page(pages)
+        try:
+            qr_base64, note = await self._capture_from_page(page)
+        except Exception:
+            # Página em estado ruim: descartar (não volta ao pool) e tentar repor uma nova
+            await self._replace_page(pages, page)
+            raise
+        except BaseException:
+            await self._discard_page(page)
+            self._forget_page(pages)
+            raise
+        pages.put_nowait(page)
+
+        if note is None:
+            self._cached_qr = qr_base64
+            self._cached_at = time.monotonic()
+        return qr_base64, note
+
+    async def _acquire_page(self, pages: asyncio.Queue):
+        """Pega uma página livre; se o pool perdeu páginas numa falha, abre outra em vez de esperar"""
+        if pages.empty() and self._page_count < self.pool_size:
+            self._page_count += 1
+            try:
+                return await self._new_warm_page()
+            except BaseException:
+                self._forget_page(pages)
+                raise
+        return await pages.get()
+
+    async def _capture_from_page(self, page) -> Tuple[str, Optional[str]]:
+        """Aguarda o QR aparecer (por evento, sem esperas fixas) e captura"""
+        if page.is_closed():
+            raise RuntimeError("Página do pool foi fechada")
+
+        qr_element = None
+        try:
+            # Uma única espera pela união dos seletores
+            await page.wait_for_selector(', '.join(QR_SELECTORS), state='visible',
+                                         timeout=self.wait_timeout)
+            # Consultas instantâneas respeitando a ordem de preferência
+            for selector in QR_SELECTORS:
+                qr_element = await page.query_selector(selector)
+                if qr_element:
+                    break
+        except Exception:
+            qr_element = None
+
+        if qr_element:
+            screenshot_bytes = await qr_element.screenshot()
+            return base64.b64encode(screenshot_bytes).decode('utf-8'), None
+
+        # Se não encontrar QR code específico, capturar página completa para debug
+        full_screenshot = await page.screenshot(full_page=True)
+
+        # Capturar área central da página
+        screenshot_bytes = await page.screenshot(
+            clip={'x': 400, 'y': 200, 'width': 400, 'height': 400}
+        )
+
+        page_content = await page.content()
+        await asyncio.get_running_loop().run_in_executor(
+            None, _write_debug_files, full_screenshot, page_content
+        )
+
+        # Recarregar para que a próxima tentativa parta de um estado limpo
+        try:
+            await page.reload(wait_until='networkidle')
+        except Exception:
+            pass
+
+        note = ('QR code específico não encontrado, capturada área central. '
+                'Debug: debug_full_page.png e debug_page_content.html salvos')
+        return base64.b64encode(screenshot_bytes).decode('utf-8'), note
+
+    async def _replace_page(self, pages: asyncio.Queue, page) -> None:
+        """Troca uma página em estado ruim por uma aquecida; se falhar, a próxima captura tenta de novo"""
+        await self._discard_page(page)
+        if pages is not self.pages:
+            return  # Pool reiniciado ou encerrado durante a captura
+        try:
+            pages.put_nowait(await self._new_warm_page())
+        except Exception as e:
+            self._forget_page(pages)
+            logger.warning(f"Não foi possível repor a página do pool: {e}")
+        except BaseException:
+            self._forget_page(pages)
+            raise
+
+    def _forget_page(self, pages: asyncio.Queue) -> None:
+        """Conta uma página perdida, se ela ainda era do pool atual"""
+        if pages is self.pages:
+            self._page_count -= 1
+
+    async def _discard_page(self, page) -> None:
+        try:
+            if not page.is_closed():
+                await page.close()
+        except Exception:
+            pass
+
+    def invalidate(self) -> None:
+        """Descarta o QR em cache (ex.: após iniciar ou reiniciar a sessão)"""
+        self._cached_qr = None
+        self._cached_at = 0.0
+
+    async def close(self) -> None:
+        """Encerra o navegador e o Playwright"""
+        async with self.lock:
+            if self.browser and self.browser.is_connected():
+                await self.browser.close()
+            if self.playwright:
+                await self.playwright.stop()
+            self.browser = None
+            self.context = None
+            self.pages = None
+            self._page_count = 0
+            self.playwright = None
+            self.invalidate()
+            logger.info("Pool de navegador do dashboard WAHA encerrado.")
+
+
+# Singleton instance
+waha_dashboard_pool = WAHADashboardPool()
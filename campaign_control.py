@@ -0,0 +1,172 @@
+"""
+WhatsApp API Sender - Campaign Control Module
+Controle de pausa, parada e retomada de campanhas com esperas interrompíveis
+"""
+
+import time
+import asyncio
+import threading
+from typing import Dict, Optional, Tuple
+
+RUNNING = 'running'
+PAUSED = 'paused'
+STOPPED = 'stopped'
+
+
+class CampaignControl:
+    """
+    Estado de execução de uma campanha, compartilhado entre a thread de envio
+    e a interface.
+
+    Todas as esperas do envio devem passar por ``wait()``: pausar ou parar
+    acorda a thread imediatamente, sem esperar o fim de um ``time.sleep``.
+    A posição (contato, passo) do próximo envio fica em ``position`` para
+    que a campanha possa ser retomada exatamente de onde parou. Quando vários
+    contatos estão em andamento ao mesmo tempo, ``position`` aponta o próximo
+    contato a iniciar e ``pending`` guarda o próximo passo de cada contato
+    já iniciado.
+    """
+
+    def __init__(self, position: Tuple[int, int] = (0, 0),
+                 pending: Optional[Dict[int, int]] = None):
+        self._cond = threading.Condition()
+        self.state = RUNNING
+        self.position = position
+        self.pending: Dict[int, int] = dict(pending or {})
+
+    @property
+    def is_stopped(self) -> bool:
+        return self.state == STOPPED
+
+    @property
+    def is_paused(self) -> bool:
+        return self.state == PAUSED
+
+    def _set_state(self, state: str) -> None:
+        with self._cond:
+            if self.state != STOPPED:
+                self.state = state
+            self._cond.notify_all()
+
+    def pause(self) -> None:
+        self._set_state(PAUSED)
+
+    def resume(self) -> None:
+        self._set_state(RUNNING)
+
+    def stop(self) -> None:
+        self._set_state(STOPPED)
+
+    def mark(self, contact_idx: int, step_idx: int) -> None:
+        """Registra a posição do próximo envio"""
+        self.position = (contact_idx, step_idx)
+
+    def mark_step(self, contact_idx: int, step_idx: Optional[int]) -> None:
+        """Registra o próximo passo de um contato em andamento (None = concluído)"""
+        if step_idx is None:
+            self.pending.pop(contact_idx, None)
+        else:
+            self.pending[contact_idx] = step_idx
+
+    def resume_position(self) -> Tuple[int, int]:
+        """Primeiro (contato, passo) ainda não enviado"""
+        if self.pending:
+            return min(self.pending.items())
+        return self.position
+
+    def checkpoint(self) -> bool:
+        """
+        Bloqueia enquanto a campanha estiver pausada
+
+        Returns:
+            False se a campanha foi parada, True para continuar
+        """
+        with self._cond:
+            while self.state == PAUSED:
+                self._cond.wait()
+            return self.state != STOPPED
+
+    def wait(self, seconds: float) -> bool:
+        """
+        Espera ``seconds`` segundos de campanha ativa
+
+        O tempo não corre enquanto a campanha está pausada; parar interrompe
+        a espera na hora.
+
+        Returns:
+            False se a campanha foi parada durante a espera, True caso contrário
+        """
+        remaining = max(0.0, seconds)
+        with self._cond:
+            while True:
+                if self.state == STOPPED:
+                    return False
+                if self.state == PAUSED:
+                    self._cond.wait()
+                    continue
+                if remaining <= 0:
+                    return True
+                started = time.monotonic()
+                self._cond.wait(remaining)
+                # Se foi pausado no meio, desconta só o tempo que ficou rodando
+                remaining -= time.monotonic() - started
+
+
+class AsyncCampaignControl(CampaignControl):
+    """
+    Variante de ``CampaignControl`` para campanhas que rodam como task asyncio.
+
+    ``checkpoint()`` e ``wait()`` são corrotinas; ``pause``/``resume``/``stop``
+    podem ser chamados do loop ou de outra thread (o aviso é repassado ao
+    loop dono da campanha).
+    """
+
+    def __init__(self, position: Tuple[int, int] = (0, 0),
+                 pending: Optional[Dict[int, int]] = None):
+        super().__init__(position, pending)
+        self._loop = asyncio.get_running_loop()
+        self._changed = asyncio.Event()
+
+    def _notify(self) -> None:
+        # Acorda quem está esperando e prepara um evento novo para a próxima mudança
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def _set_state(self, state: str) -> None:
+        with self._cond:
+            if self.state != STOPPED:
+                self.state = state
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self._notify()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._notify)
+
+    async def checkpoint(self) -> bool:
+        while self.state == PAUSED:
+            await self._changed.wait()
+        return self.state != STOPPED
+
+    async def wait(self, seconds: float) -> bool:
+        remaining = max(0.0, seconds)
+        while True:
+            if self.state == STOPPED:
+                return False
+            changed = self._changed
+            if self.state == PAUSED:
+                await changed.wait()
+                continue
+            if remaining <= 0:
+                return True
+            deadline = self._loop.time() + remaining
+            try:
+                await asyncio.wait_for(changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+            # Se foi pausado no meio, desconta só o tempo que ficou rodando. Pelo prazo
+            # (mesma conta do timer) e não por subtração: o arredondamento deixaria um
+            # resto ínfimo que, no relógio virtual da simulação, nunca se esgota
+            remaining = deadline - self._loop.time()
@@ -0,0 +1,265 @@
+"""
+WhatsApp API Sender - Campaign Planner Module
+Estimativa de duração, término e mensagens por hora de uma campanha
+"""
+
+import os
+import time
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from campaign_runner import BEHAVIOR_PROFILES, MEAL_HOURS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LATENCY = {'text': 1.5, 'media': 4.0}  # segundos por envio sem histórico
+DEFAULT_UPLOAD_KBPS = 2000  # banda de upload assumida para mídia
+EXACT_CONTACTS = 2000  # contatos simulados um a um; depois disso, em blocos
+MAX_BLOCKS = 2000  # blocos para o restante, qualquer que seja o tamanho da lista
+
+
+def _fatigue(profile: Dict[str, float], elapsed: float) -> float:
+    """Mesmo multiplicador de fadiga do runner, em função dos segundos decorridos"""
+    return 1 + (elapsed / 60) * profile['fatigue_factor'] * 0.1
+
+
+def expected_sequence_interval(base_interval: float, profile: Dict[str, float], elapsed: float) -> float:
+    """Valor esperado do intervalo entre mensagens de um contato (variações simétricas têm média 0)"""
+    expected = base_interval * profile['base_mult'] * _fatigue(profile, elapsed)
+    expected += 0.12 * 10  # 12% de chance de distração de 5-15s
+    return max(1, min(expected, 120))
+
+
+def expected_contact_interval(config_min: float, config_max: float, profile: Dict[str, float],
+                              elapsed: float, hour: int) -> float:
+    """Valor esperado do intervalo entre contatos, incluindo o "pensamento" antes do próximo"""
+    base = (config_min + config_max) / 2 * profile['base_mult']
+    base *= 1 + profile['variance'] / 4  # variação uniforme em [-v/2, v]
+    base *= _fatigue(profile, elapsed)
+    # 5% pressa (x0.45), 10% pausa longa (+40s), 10% ritmo irregular (x1.05)
+    expected = base * (0.05 * 0.45 + 0.10 + 0.10 * 1.05 + 0.75) + 0.10 * 40
+    if hour in MEAL_HOURS:
+        expected += 0.3 * 20
+    return max(3, min(expected, 300)) + 2.5
+
+
+def expected_prep_time(message: Dict[str, Any], step_idx: int) -> float:
+    """Valor esperado da "preparação" antes de um passo (hesitação, digitação, mídia)"""
+    prep = 0.0
+    if step_idx > 0:
+        prep += 1.5 + 0.15 * 2
+    if message.get('type') == 'text':
+        typing = min(len(message.get('content', '')) * 0.05, 5)
+        if typing > 1:
+            prep += typing
+    elif message.get('type') == 'media':
+        prep += 4
+    return prep
+
+
+def step_latency(message: Dict[str, Any], latency: Dict[str, float], upload_kbps: float) -> float:
+    """Tempo de envio de um passo: latência histórica + upload da mídia"""
+    if message.get('type') != 'media':
+        return latency.get('text', DEFAULT_LATENCY['text'])
+    try:
+        size = os.path.getsize(message.get('path', ''))
+    except OSError:
+        size = 0
+    return latency.get('media', DEFAULT_LATENCY['media']) + size * 8 / 1000 / upload_kbps
+
+
+def historical_latency(config: Dict[str, Any], queue=None) -> Dict[str, float]:
+    """
+    Latência média por tipo de envio: medida nas últimas campanhas da fila
+    do worker ou, na falta, a do monitor do gateway nas últimas 24h
+
+    Args:
+        config: config.json (arquivo de histórico do monitor)
+        queue: ``CampaignQueue`` com as campanhas anteriores (opcional)
+    """
+    latency = dict(DEFAULT_LATENCY)
+    if queue is not None:
+        measured = queue.recent_latency()
+        if measured:
+            latency.update(measured)
+            return latency
+
+    try:
+        from monitor_history import MonitorHistoryStore, DEFAULT_HISTORY_FILE
+        store = MonitorHistoryStore(config.get('monitor_historico_arquivo', DEFAULT_HISTORY_FILE), readonly=True)
+        try:
+            buckets = store.downsample(86400, start=time.time() - 86400)
+        finally:
+            store.close()
+        measured = [b['latencia_media'] for b in buckets if b['latencia_media'] is not None]
+        if measured:
+            latency['text'] = max(latency['text'], sum(measured) / len(measured))
+    except Exception as e:
+        logger.debug(f"Sem histórico do monitor: {e}")
+    return latency
+
+
+def _contact_finish(sequence: List[Dict[str, Any]], profile: Dict[str, float],
+                    pacing: Dict[str, Any], activation: float) -> float:
+    """Término esperado da sequência de um contato ativado em ``activation``"""
+    t = activation
+    for step_idx, message in enumerate(sequence):
+        if step_idx > 0:
+            t += expected_sequence_interval(pacing['interval'], profile, t)
+        t += expected_prep_time(message, step_idx) + pacing['latencies'][step_idx]
+    return t
+
+
+def _steady_spacing(sequence: List[Dict[str, Any]], profile: Dict[str, float],
+                    pacing: Dict[str, Any], start: datetime, at: float) -> float:
+    """Distância esperada entre ativações em regime estável, no instante ``at``"""
+    hour = (start + timedelta(seconds=at)).hour
+    interval = expected_contact_interval(pacing['config_min'], pacing['config_max'], profile, at, hour)
+    duration = _contact_finish(sequence, profile, pacing, at) - at
+    return max(interval, (duration + interval) / pacing['max_active'])
+
+
+def _simulate_profile(n_contacts: int, sequence: List[Dict[str, Any]], profile: Dict[str, float],
+                      pacing: Dict[str, Any], start: datetime) -> List[Tuple[int, float]]:
+    """
+    Linha do tempo esperada: (índice, término em segundos desde o início)
+
+    Os primeiros ``EXACT_CONTACTS`` contatos são simulados um a um. O
+    restante avança em até ``MAX_BLOCKS`` blocos pelo regime estável
+    (``_steady_spacing``), com o ritmo recalculado a cada bloco (fadiga e
+    horário de almoço). O custo fica limitado para listas de milhões de
+    contatos.
+    """
+    max_active = pacing['max_active']
+    slots: List[float] = []  # término dos contatos em andamento
+    samples: List[Tuple[int, float]] = []
+    last_activation = None
+    exact = min(n_contacts, EXACT_CONTACTS)
+
+    for index in range(exact):
+        free_at = 0.0
+        if len(slots) >= max_active:
+            free_at = heapq.heappop(slots)
+        if last_activation is None:
+            activation = 0.0
+        else:
+            at = max(free_at, last_activation)
+            hour = (start + timedelta(seconds=at)).hour
+            activation = at + expected_contact_interval(pacing['config_min'], pacing['config_max'],
+                                                        profile, at, hour)
+        last_activation = activation
+
+        t = _contact_finish(sequence, profile, pacing, activation)
+        heapq.heappush(slots, t)
+        samples.append((index, t))
+
+    remaining = n_contacts - exact
+    if remaining:
+        stride = -(-remaining // MAX_BLOCKS)
+        index, activation = exact - 1, last_activation
+        while index < n_contacts - 1:
+            count = min(stride, n_contacts - 1 - index)
+            # Ritmo avaliado no meio do bloco: a fadiga cresce ao longo dele
+            midpoint = activation + _steady_spacing(sequence, profile, pacing, start, activation) * count / 2
+            activation += _steady_spacing(sequence, profile, pacing, start, midpoint) * count
+            index += count
+            samples.append((index, _contact_finish(sequence, profile, pacing, activation)))
+    return samples
+
+
+def _contacts_within(samples: List[Tuple[int, float]], limit: float) -> int:
+    """Contatos que terminam até ``limit``; dentro de um bloco, interpola entre as amostras"""
+    fitting = 0.0
+    prev_index, prev_finish = -1, 0.0
+    for index, finish in samples:
+        count = index - prev_index
+        if count == 1:
+            fitting += finish <= limit
+        else:
+            low, high = sorted((prev_finish, finish))
+            if high <= limit:
+                fitting += count
+            elif low < limit:
+                fitting += count * (limit - low) / (high - low)
+        prev_index, prev_finish = index, finish
+    return int(fitting)
+
+
+def _format_duration(seconds: float) -> str:
+    hours, rest = divmod(int(seconds), 3600)
+    return f"{hours}h{rest // 60:02d}min"
+
+
+def plan_campaign(n_contacts: int, sequence: List[Dict[str, Any]], config: Dict[str, Any],
+                  message_config: Dict[str, Any], start: Optional[datetime] = None,
+                  window_end: Optional[datetime] = None,
+                  latency: Optional[Dict[str, float]] = None) -> Dict[str, Any]:
+    """
+    Estima a campanha a partir do ritmo configurado, do limite de taxa, da
+    latência histórica do gateway e do tamanho das mídias
+
+    Args:
+        n_contacts: Quantidade de contatos
+        sequence: Sequência de mensagens
+        config: config.json (intervalos, limites)
+        message_config: Intervalo entre mensagens da sequência
+        start: Início previsto (padrão: agora)
+        window_end: Fim da janela de envio, para saber quantos contatos cabem
+        latency: Latência por tipo; padrão: ``historical_latency(config)``
+
+    Returns:
+        Dict com duração, término previsto, mensagens/hora e premissas usadas
+    """
+    start = start or datetime.now()
+    latency = latency or historical_latency(config)
+    upload_kbps = float(config.get('upload_bandwidth_kbps', DEFAULT_UPLOAD_KBPS))
+    total_messages = n_contacts * len(sequence)
+
+    pacing = {
+        'interval': int(message_config.get('interval', 10)),
+        'config_min': int(config.get('min_interval_seconds', 15)),
+        'config_max': int(config.get('max_interval_seconds', 30)),
+        'max_active': max(1, int(config.get('max_active_contacts', 1))),
+        'latencies': [step_latency(message, latency, upload_kbps) for message in sequence]
+    }
+
+    # O runner sorteia um perfil por campanha: média das linhas do tempo dos perfis
+    # (as amostras caem nos mesmos índices para todos os perfis)
+    timelines = [_simulate_profile(n_contacts, sequence, profile, pacing, start)
+                 for profile in BEHAVIOR_PROFILES.values()]
+    samples = [(points[0][0], sum(finish for _, finish in points) / len(points))
+               for points in zip(*timelines)] if n_contacts else []
+    pacing_seconds = max(finish for _, finish in samples) if samples else 0.0
+
+    rate = float(config.get('rate_limit_per_minute') or 0)
+    rate_seconds = total_messages / rate * 60 if rate > 0 else 0.0
+    estimated = max(pacing_seconds, rate_seconds)
+
+    plan = {
+        'total_contacts': n_contacts,
+        'total_messages': total_messages,
+        'estimated_seconds': round(estimated, 1),
+        'estimated_duration': _format_duration(estimated),
+        'start': start.isoformat(timespec='seconds'),
+        'estimated_completion': (start + timedelta(seconds=estimated)).isoformat(timespec='seconds'),
+        'messages_per_hour': round(total_messages / estimated * 3600, 1) if estimated else None,
+        'bound': 'rate_limit' if rate_seconds > pacing_seconds else 'pacing',
+        'assumptions': {
+            'latency_seconds': {k: round(v, 3) for k, v in latency.items()},
+            'step_seconds': [round(v, 2) for v in pacing['latencies']],
+            'max_active_contacts': pacing['max_active'],
+            'rate_limit_per_minute': rate or None
+        }
+    }
+
+    if window_end is not None:
+        window = (window_end - start).total_seconds()
+        scale = estimated / pacing_seconds if pacing_seconds else 1
+        fitting = _contacts_within(samples, window / scale)
+        plan['window_end'] = window_end.isoformat(timespec='seconds')
+        plan['fits_window'] = estimated <= window
+        plan['contacts_within_window'] = fitting
+    return plan
+
@@ -0,0 +1,344 @@
+"""
+WhatsApp API Sender - Campaign Queue Module
+Fila local de campanhas em SQLite compartilhada entre o servidor web e o sender_worker
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import logging
+import threading
+import subprocess
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+DEFAULT_QUEUE_FILE = 'campaign_queue.db'
+WORKER_STALE_AFTER = 5.0  # segundos sem heartbeat para considerar o worker parado
+
+# Estados da campanha na fila
+QUEUED = 'queued'
+RUNNING = 'running'
+STOPPED = 'stopped'
+COMPLETED = 'completed'
+FAILED = 'failed'  # Não pôde começar (ex.: mídia da sequência não encontrada)
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS campaigns (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    status TEXT NOT NULL,
+    desired TEXT NOT NULL DEFAULT 'running',
+    paused INTEGER NOT NULL DEFAULT 0,
+    payload TEXT NOT NULL,
+    position TEXT NOT NULL DEFAULT '[0, 0]',
+    pending TEXT NOT NULL DEFAULT '{}',
+    progress TEXT NOT NULL DEFAULT '{}',
+    worker TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS campaign_logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    campaign_id INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS workers (
+    name TEXT PRIMARY KEY,
+    pid INTEGER,
+    heartbeat REAL NOT NULL
+);
+"""
+
+
+class CampaignQueue:
+    """
+    Fila de campanhas em SQLite (modo WAL).
+
+    O servidor web enfileira campanhas e grava comandos na coluna ``desired``
+    (running/paused/stopped); o worker reivindica a campanha, aplica os
+    comandos e grava progresso, posição de retomada e logs.
+    """
+
+    def __init__(self, path: str = DEFAULT_QUEUE_FILE):
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self):
+        """Transação com lock de escrita desde o início (BEGIN IMMEDIATE)"""
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    # ---- Lado do servidor web -------------------------------------------
+
+    def enqueue(self, payload: Dict[str, Any], progress: Optional[Dict[str, Any]] = None) -> int:
+        """Enfileira uma campanha (com progresso inicial opcional, ex.: o plano) e retorna o seu id"""
+        now = time.time()
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                'INSERT INTO campaigns (status, payload, progress, created_at, updated_at) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (QUEUED, json.dumps(payload, ensure_ascii=False, default=str),
+                 json.dumps(progress or {}, ensure_ascii=False), now, now)
+            )
+            return cursor.lastrowid
+
+    def set_desired(self, campaign_id: int, desired: str) -> None:
+        with self._transaction() as conn:
+            conn.execute('UPDATE campaigns SET desired = ?, updated_at = ? WHERE id = ?',
+                         (desired, time.time(), campaign_id))
+
+    def requeue(self, campaign_id: int) -> bool:
+        """Recoloca na fila uma campanha parada; ela continua da posição salva"""
+        with self._transaction() as conn:
+            cursor = conn.execute(
+                "UPDATE campaigns SET status = ?, desired = 'running', paused = 0, worker = NULL, "
+                "updated_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, time.time(), campaign_id, STOPPED)
+            )
+            return cursor.rowcount == 1
+
+    def latest(self) -> Optional[Dict[str, Any]]:
+        """Campanha mais recente, sem o payload"""
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT id, status, desired, paused, position, pending, progress, worker, '
+                'created_at, updated_at FROM campaigns ORDER BY id DESC LIMIT 1'
+            ).fetchone()
+        return _decode(row) if row else None
+
+    def recent_latency(self, limit: int = 10) -> Dict[str, float]:
+        """Latência média de envio por tipo (text/media) medida nas últimas campanhas"""
+        with self._connect() as conn:
+            rows = conn.execute('SELECT progress FROM campaigns ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        totals: Dict[str, List[float]] = {}
+        for row in rows:
+            for kind, (mean, count) in json.loads(row['progress']).get('latency', {}).items():
+                total = totals.setdefault(kind, [0.0, 0])
+                total[0] += mean * count
+                total[1] += count
+        return {kind: total / count for kind, (total, count) in totals.items() if count}
+
+    def logs_since(self, last_id: int, limit: int = 500) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT id, campaign_id, created_at, message FROM campaign_logs '
+                'WHERE id > ? ORDER BY id LIMIT ?', (last_id, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def last_log_id(self) -> int:
+        with self._connect() as conn:
+            return conn.execute('SELECT COALESCE(MAX(id), 0) FROM campaign_logs').fetchone()[0]
+
+    def worker_online(self, stale_after: float = WORKER_STALE_AFTER) -> bool:
+        with self._connect() as conn:
+            row = conn.execute('SELECT MAX(heartbeat) FROM workers').fetchone()
+        return bool(row[0]) and time.time() - row[0] < stale_after
+
+    # ---- Lado do worker --------------------------------------------------
+
+    def claim(self, worker: str, stale_after: float = WORKER_STALE_AFTER * 3) -> Optional[Dict[str, Any]]:
+        """
+        Reivindica a próxima campanha da fila
+
+        Campanhas "running" de um worker que parou de atualizar há mais de
+        ``stale_after`` segundos também são reivindicadas e continuam da
+        última posição gravada.
+        """
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute(
+                'SELECT * FROM campaigns WHERE status = ? OR (status = ? AND updated_at < ?) '
+                'ORDER BY id LIMIT 1', (QUEUED, RUNNING, now - stale_after)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE campaigns SET status = ?, worker = ?, updated_at = ? WHERE id = ?',
+                         (RUNNING, worker, now, row['id']))
+        job = _decode(row)
+        job['payload'] = json.loads(row['payload'])
+        return job
+
+    def desired(self, campaign_id: int) -> str:
+        with self._connect() as conn:
+            row = conn.execute('SELECT desired FROM campaigns WHERE id = ?', (campaign_id,)).fetchone()
+        return row['desired'] if row else STOPPED
+
+    def save_state(self, campaign_id: int, progress: Dict[str, Any], position: Tuple[int, int],
+                   pending: Dict[int, int], paused: bool = False, status: Optional[str] = None) -> None:
+        """Grava progresso e ponto de retomada (e opcionalmente o novo status)"""
+        fields = 'progress = ?, position = ?, pending = ?, paused = ?, updated_at = ?'
+        values = [json.dumps(progress, ensure_ascii=False), json.dumps(list(position)),
+                  json.dumps(pending), int(paused), time.time()]
+        if status is not None:
+            fields += ', status = ?'
+            values.append(status)
+        with self._transaction() as conn:
+            conn.execute(f'UPDATE campaigns SET {fields} WHERE id = ?', (*values, campaign_id))
+
+    def append_log(self, campaign_id: int, message: str) -> None:
+        with self._transaction() as conn:
+            conn.execute('INSERT INTO campaign_logs (campaign_id, created_at, message) VALUES (?, ?, ?)',
+                         (campaign_id, time.time(), message))
+
+    def heartbeat(self, worker: str) -> None:
+        with self._transaction() as conn:
+            conn.execute('INSERT INTO workers (name, pid, heartbeat) VALUES (?, ?, ?) '
+                         'ON CONFLICT(name) DO UPDATE SET pid = excluded.pid, heartbeat = excluded.heartbeat',
+                         (worker, os.getpid(), time.time()))
+
+    def remove_worker(self, worker: str) -> None:
+        with self._transaction() as conn:
+            conn.execute('DELETE FROM workers WHERE name = ?', (worker,))
+
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    data = dict(row)
+    data.pop('payload', None)
+    data['position'] = tuple(json.loads(data['position']))
+    data['pending'] = {int(k): v for k, v in json.loads(data['pending']).items()}
+    data['progress'] = json.loads(data['progress'])
+    data['paused'] = bool(data['paused'])
+    return data
+
+
+class CampaignQueueClient:
+    """
+    Visão do servidor web sobre a fila: enfileira campanhas, envia comandos
+    ao worker e observa progresso e logs. Tem a mesma interface usada pelas
+    rotas com o ``CampaignSupervisor``.
+    """
+
+    def __init__(self, queue: CampaignQueue, log: Optional[Callable[..., None]] = None,
+                 auto_start_worker: bool = True):
+        self.logger = logging.getLogger(__name__)
+        self.queue = queue
+        self.log = log or self.logger.info
+        self.auto_start_worker = auto_start_worker
+        self._last_log_id = queue.last_log_id()
+        self._log_lock = threading.Lock()  # As rotas de status/logs rodam em threads do Quart
+        self._worker_process: Optional[subprocess.Popen] = None
+
+    @property
+    def is_running(self) -> bool:
+        campaign = self.queue.latest()
+        return campaign is not None and campaign['status'] in ACTIVE_STATUSES
+
+    def ensure_worker(self) -> None:
+        """Inicia um sender_worker se nenhum estiver enviando heartbeat"""
+        if not self.auto_start_worker or self.queue.worker_online():
+            return
+        if self._worker_process is not None and self._worker_process.poll() is None:
+            return  # Já iniciado, ainda subindo
+        script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sender_worker.py')
+        self._worker_process = subprocess.Popen(
+            [sys.executable, script, '--queue', self.queue.path], start_new_session=True
+        )
+        self.log(f"⚙️ sender_worker iniciado (pid {self._worker_process.pid})")
+
+    def start(self, contacts: List[Dict[str, Any]], sequence: List[Dict[str, Any]],
+              config: Dict[str, Any], message_config: Dict[str, Any],
+              plan: Optional[Dict[str, Any]] = None) -> int:
+        """
+        Enfileira a campanha para o worker
+
+        Args:
+            plan: Estimativa de ``plan_campaign``; o worker compara a vazão real com ela
+
+        Raises:
+            RuntimeError: Se já houver uma campanha em andamento
+        """
+        if self.is_running:
+            raise RuntimeError('Envio já está em andamento')
+        self.auto_start_worker = config.get('auto_start_worker', self.auto_start_worker)
+        campaign_id = self.queue.enqueue({
+            'contacts': contacts,
+            'sequence': sequence,
+            'config': config,
+            'message_config': message_config
+        }, {'plan': plan} if plan else None)
+        self.ensure_worker()
+        return campaign_id
+
+    def _active(self) -> Optional[Dict[str, Any]]:
+        campaign = self.queue.latest()
+        return campaign if campaign and campaign['status'] in ACTIVE_STATUSES else None
+
+    def pause(self) -> bool:
+        campaign = self._active()
+        if campaign is None:
+            return False
+        self.queue.set_desired(campaign['id'], 'paused')
+        return True
+
+    def stop(self) -> bool:
+        campaign = self._active()
+        if campaign is None:
+            return False
+        self.queue.set_desired(campaign['id'], STOPPED)
+        return True
+
+    def resume(self) -> Optional[Tuple[int, int]]:
+        """
+        Retoma a campanha pausada, ou recoloca na fila a última campanha parada
+
+        Returns:
+            (contato, passo) de onde o envio continua, ou None se não há o que retomar
+        """
+        campaign = self.queue.latest()
+        if campaign is None:
+            return None
+        if campaign['status'] in ACTIVE_STATUSES:
+            if campaign['desired'] != 'paused' and not campaign['paused']:
+                return None
+            self.queue.set_desired(campaign['id'], 'running')
+        elif not self.queue.requeue(campaign['id']):
+            return None
+        else:
+            self.ensure_worker()
+        pending = campaign['pending']
+        return min(pending.items()) if pending else campaign['position']
+
+    def pull_logs(self) -> None:
+        """Copia para o log da interface as mensagens novas gravadas pelo worker"""
+        # Ler e avançar juntos: duas consultas simultâneas copiariam as mesmas linhas
+        with self._log_lock:
+            for entry in self.queue.logs_since(self._last_log_id):
+                self._last_log_id = entry['id']
+                self.log(entry['message'], datetime.fromtimestamp(entry['created_at']).strftime('%H:%M:%S'))
+
+    def status(self) -> Dict[str, Any]:
+        self.pull_logs()
+        campaign = self.queue.latest()
+        active = campaign is not None and campaign['status'] in ACTIVE_STATUSES
+        return {
+            'sending_active': active,
+            'sending_paused': active and campaign['paused'],
+            'can_resume': campaign is not None and campaign['status'] == STOPPED,
+            'send_progress': campaign['progress'] if campaign else {},
+            'campaign_id': campaign['id'] if campaign else None,
+            'campaign_status': campaign['status'] if campaign else None,
+            'worker_online': self.queue.worker_online()
+        }
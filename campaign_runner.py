@@ -0,0 +1,505 @@
+"""
+WhatsApp API Sender - Campaign Runner Module
+Execução de campanhas: sequência de mensagens por contato com intervalos humanizados
+"""
+
+import random
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from campaign_control import AsyncCampaignControl
+from campaign_scheduler import CampaignScheduler
+from sequence_compiler import CompiledStep, compile_sequence
+from adaptive_concurrency import AIMDConcurrencyLimiter, get_concurrency_limiter
+
+# Perfis de comportamento humano
+BEHAVIOR_PROFILES = {
+    'conservador': {'base_mult': 1.5, 'variance': 0.4, 'fatigue_factor': 1.1},
+    'normal': {'base_mult': 1.0, 'variance': 0.6, 'fatigue_factor': 1.2},
+    'agressivo': {'base_mult': 0.7, 'variance': 0.8, 'fatigue_factor': 1.3}
+}
+
+MEAL_HOURS = (12, 13, 17, 18, 19)  # Horários de almoço/jantar: pausas mais longas entre contatos
+# Espera mínima pela ficha: esperas ínfimas (arredondamento de float) não reabastecem o bucket
+MIN_THROTTLE_WAIT = 0.01
+
+
+class CampaignRunner:
+    """
+    Envia a sequência de mensagens para cada contato.
+
+    Cada (contato, passo) é um evento no ``CampaignScheduler``. Até
+    ``max_active_contacts`` contatos ficam em andamento ao mesmo tempo: enquanto
+    o intervalo entre as mensagens de um contato corre, os passos vencidos de
+    outros contatos são despachados. O espaçamento entre passos do mesmo
+    contato e o limite ``rate_limit_per_minute`` da instância são mantidos.
+    Com ``max_active_contacts = 1`` (padrão) o envio é sequencial como antes.
+    O início de cada contato continua espaçado por um ``_contact_interval()``
+    completo: intercalar só preenche os intervalos entre mensagens de uma
+    sequência, sem abrir conversas novas mais rápido que o ritmo humano.
+
+    Passos vencidos de contatos diferentes podem ser enviados em paralelo, até
+    o limite de envios simultâneos da instância, ajustado por
+    ``AIMDConcurrencyLimiter`` conforme a latência e os erros do gateway.
+
+    O runner é uma corrotina que roda no loop do worker; o envio bloqueante
+    (requests) vai para o executor padrão. Se o sender tiver
+    ``send_message_async`` (gateway simulado), ele é aguardado diretamente.
+    ``progress`` pertence ao runner: só ele escreve, a interface apenas lê.
+
+    A sequência é compilada uma vez na criação (``compile_sequence``): uma
+    mídia ausente gera ``SequenceCompileError`` antes do primeiro envio.
+
+    Relógio, hora do dia e gerador aleatório são injetáveis (``clock``,
+    ``now``, ``rng``); as esperas usam os timers do loop. Com o loop de tempo
+    virtual de ``simulate_campaign`` uma campanha de horas roda em segundos.
+    """
+
+    def __init__(self, contacts: List[Dict[str, Any]], sequence: List[Dict[str, Any]],
+                 config: Dict[str, Any], message_config: Dict[str, Any], sender,
+                 control: AsyncCampaignControl, progress: Optional[Dict[str, Any]] = None,
+                 log: Optional[Callable[[str], None]] = None,
+                 clock: Optional[Callable[[], float]] = None,
+                 now: Callable[[], datetime] = datetime.now,
+                 rng: Optional[random.Random] = None,
+                 concurrency: Optional[AIMDConcurrencyLimiter] = None):
+        self.contacts = contacts
+        self.sequence = sequence
+        self.sender = sender
+        self.control = control
+        self.log = log or logging.getLogger(__name__).info
+
+        # Contadores de uma execução anterior (retomada) continuam valendo
+        previous = progress or {}
+        self.progress = {
+            'current': 0,
+            'total': len(contacts) * len(sequence),
+            'success': previous.get('success', 0),
+            'error': previous.get('error', 0),
+            'current_contact': '',
+            'current_message': 1,
+            'sequence_length': len(sequence),
+            'stuck': previous.get('stuck', 0),
+            # Envios abandonados pelo watchdog (entrega não confirmada), para reenvio manual
+            'retryable': list(previous.get('retryable', [])),
+            # Estimativa feita antes do início e vazão medida comparada com ela
+            'plan': previous.get('plan'),
+            'throughput': {},
+            # Latência média de envio por tipo: {tipo: [média, envios]}
+            'latency': dict(previous.get('latency', {}))
+        }
+
+        self.base_sequence_interval = int(message_config.get('interval', 10))
+        self.fallback_name = message_config.get('fallback_name', 'amigo(a)')
+        self.config_min = int(config.get('min_interval_seconds', 15))
+        self.config_max = int(config.get('max_interval_seconds', 30))
+        self.max_active = max(1, int(config.get('max_active_contacts', 1)))
+        # Limite da instância (compartilhado entre processos) aplicado pelo sender
+        self.rate_limiter = getattr(sender, 'rate_limiter', None)
+        # Envios simultâneos ajustados pela latência/erros do gateway (AIMD)
+        self.concurrency = concurrency or get_concurrency_limiter(config)
+        self._in_flight: Set[asyncio.Future] = set()
+        self._wakeup = asyncio.Event()
+
+        # Endpoints, mídias e templates resolvidos uma vez; mídia ausente falha aqui
+        self.compiled = compile_sequence(sequence, config)
+
+        self.scheduler = CampaignScheduler()
+        # Relógio do loop da campanha (monotonic no loop padrão, virtual na simulação)
+        self.clock = clock or asyncio.get_running_loop().time
+        self.now = now
+        self.rng = rng or random.Random()
+        self.profile_name = self.rng.choice(list(BEHAVIOR_PROFILES))
+        self.profile = BEHAVIOR_PROFILES[self.profile_name]
+        self.session_start_time = self.clock()
+        self.next_contact = control.position[0]
+        self.last_activation: Optional[float] = None
+        self._run_started = 0.0
+        self._sent_at_start = 0
+
+    def _contact_name(self, contact_idx: int) -> str:
+        return self.contacts[contact_idx].get('nome', self.fallback_name)
+
+    def _fatigue_multiplier(self) -> float:
+        """Fadiga da sessão: os intervalos aumentam com o tempo"""
+        session_duration = (self.clock() - self.session_start_time) / 60  # em minutos
+        return 1 + (session_duration * self.profile['fatigue_factor'] * 0.1)
+
+    def _sequence_interval(self) -> float:
+        """Intervalo humanizado entre mensagens da sequência de um contato"""
+        profile = self.profile
+        base_time = self.base_sequence_interval * profile['base_mult']
+
+        # Variação principal (±variance%)
+        variance = self.rng.uniform(-profile['variance'], profile['variance'])
+        varied_time = base_time * (1 + variance)
+
+        # Aplicar fadiga
+        fatigued_time = varied_time * self._fatigue_multiplier()
+
+        # Adicionar micro-variações (simulando inconsistência humana)
+        micro_variation = self.rng.uniform(-0.3, 0.3)
+        final_time = fatigued_time * (1 + micro_variation)
+
+        # Ocasionalmente pausas mais longas (pessoa se distrai)
+        if self.rng.random() < 0.12:  # 12% chance
+            distraction_time = self.rng.uniform(5, 15)
+            final_time += distraction_time
+            self.log(f"😴 Pausa de distração... {distraction_time:.1f}s extra")
+
+        # Mínimo e máximo realistas
+        return max(1, min(final_time, 120))  # Entre 1s e 2min
+
+    def _contact_interval(self) -> float:
+        """Intervalo humanizado entre o início de um contato e o do próximo"""
+        profile = self.profile
+        fatigue_multiplier = self._fatigue_multiplier()
+
+        # Perfil de comportamento para intervalos entre contatos
+        profile_min = self.config_min * profile['base_mult']
+        profile_max = self.config_max * profile['base_mult']
+
+        # Variação principal
+        variance = self.rng.uniform(-profile['variance'] * 0.5, profile['variance'])
+        varied_min = profile_min * (1 + variance)
+        varied_max = profile_max * (1 + variance)
+
+        # Garantir ordem lógica
+        if varied_min > varied_max:
+            varied_min, varied_max = varied_max, varied_min
+
+        # Selecionar tempo aleatório no range, já com fadiga
+        wait_time = self.rng.uniform(varied_min * fatigue_multiplier, varied_max * fatigue_multiplier)
+
+        # Padrões especiais de comportamento humano
+        random_behavior = self.rng.random()
+
+        if random_behavior < 0.05:  # 5% - Pressa súbita
+            wait_time *= self.rng.uniform(0.3, 0.6)
+            self.log("🏃‍♂️ Acelerando ritmo...")
+        elif random_behavior < 0.15:  # 10% - Pausa longa
+            extra_time = self.rng.uniform(20, 60)
+            wait_time += extra_time
+            self.log(f"☕ Pausa longa... +{extra_time:.1f}s")
+        elif random_behavior < 0.25:  # 10% - Ritmo irregular
+            wait_time *= self.rng.uniform(0.7, 1.4)
+            self.log("🎲 Ritmo irregular...")
+
+        # Pausas por "blocos de tempo" (simula horários de trabalho)
+        if self.now().hour in MEAL_HOURS:
+            if self.rng.random() < 0.3:  # 30% chance
+                meal_pause = self.rng.uniform(10, 30)
+                wait_time += meal_pause
+                self.log(f"🍽️ Pausa para refeição... +{meal_pause:.1f}s")
+
+        # Limites finais
+        wait_time = max(3, min(wait_time, 300))  # Entre 3s e 5min
+
+        log_msg = f"⏳ Próximo contato em {wait_time:.1f}s"
+        if fatigue_multiplier > 1.3:
+            log_msg += " (fadiga detectada)"
+        self.log(log_msg)
+        return wait_time
+
+    def _prep_time(self, contact_idx: int, step_idx: int) -> float:
+        """Tempo de "preparação" antes de um passo: hesitação, digitação ou seleção de mídia"""
+        step = self.compiled[step_idx]
+        prep_time = 0.0
+
+        if step_idx > 0:  # Não na primeira mensagem do contato
+            prep_time += self.rng.uniform(0.5, 2.5)
+            if self.rng.random() < 0.15:  # 15% chance de pausar mais (hesitação)
+                prep_time += self.rng.uniform(1, 3)
+
+        if not step.is_media:
+            # Tempo de digitação baseado no tamanho da mensagem
+            length = step.template.length(self._contact_name(contact_idx))
+            typing_time = min(length * self.rng.uniform(0.02, 0.08), 5)  # ~20-80ms por caractere, máx. 5s
+            if typing_time > 1:
+                prep_time += typing_time
+        else:
+            # Tempo de seleção/upload de mídia
+            prep_time += self.rng.uniform(2, 6)
+
+        return prep_time
+
+    def _activate(self, contact_idx: int, step_idx: int, due: float) -> None:
+        """Coloca um contato em andamento agendando o seu passo ``step_idx``"""
+        contact = self.contacts[contact_idx]
+        self.control.mark_step(contact_idx, step_idx)
+        self.scheduler.schedule(due + self._prep_time(contact_idx, step_idx), contact_idx, step_idx)
+        remaining = len(self.sequence) - step_idx
+        self.log(f"👤 Processando {self._contact_name(contact_idx)} ({contact['numero']}) - "
+                 f"Sequência de {remaining} mensagens")
+
+    def _fill_slots(self, now: float) -> None:
+        """Inicia novos contatos enquanto houver vaga em ``max_active_contacts``"""
+        while len(self.control.pending) < self.max_active and self.next_contact < len(self.contacts):
+            if self.last_activation is None:
+                due = now  # Primeiro contato: sem espera
+            else:
+                thinking_time = self.rng.uniform(1, 4)  # "Pensamento" antes de iniciar contato
+                due = max(now, self.last_activation) + self._contact_interval() + thinking_time
+            self.last_activation = due
+            self._activate(self.next_contact, 0, due)
+            self.next_contact += 1
+            self.control.mark(self.next_contact, 0)
+
+    def _send_blocking(self, numero: str, texto: str, step: CompiledStep) -> Tuple[bool, Dict[str, Any]]:
+        """Envio + resultado detalhado, lidos na mesma thread do executor"""
+        # A ficha do limitador já foi consumida no loop (_take_token)
+        success = self.sender.send_compiled(numero, texto, step, self.compiled, take_token=False)
+        return success, dict(self.sender.last_send_outcome)
+
+    async def _send(self, numero: str, texto: str, step: CompiledStep) -> Tuple[bool, Dict[str, Any]]:
+        """
+        Executa o envio bloqueante no executor
+
+        Se a task for cancelada no meio do envio, espera o envio terminar
+        (ele já saiu para o gateway) antes de propagar o cancelamento.
+        """
+        send_async = getattr(self.sender, 'send_message_async', None)
+        if send_async is not None:
+            return await send_async(numero, texto, step.path)
+
+        loop = asyncio.get_running_loop()
+        send = loop.run_in_executor(None, self._send_blocking, numero, texto, step)
+        try:
+            return await asyncio.shield(send)
+        except asyncio.CancelledError:
+            self.control.stop()
+            await send
+            raise
+
+    async def _take_token(self) -> float:
+        """
+        Consome uma ficha do limitador da instância sem bloquear
+
+        Returns:
+            0 se consumiu; senão, segundos até haver uma. SQLite/Redis
+            compartilhados são consultados fora do loop
+        """
+        if getattr(self.rate_limiter, 'does_io', False):
+            return await asyncio.get_running_loop().run_in_executor(None, self.rate_limiter.try_acquire)
+        return self.rate_limiter.try_acquire()
+
+    async def _dispatch(self, contact_idx: int, step_idx: int) -> Tuple[bool, bool]:
+        """
+        Envia um passo da sequência para um contato e atualiza o progresso
+
+        Returns:
+            (sucesso, gateway sobrecarregado: timeout ou 5xx)
+        """
+        contact = self.contacts[contact_idx]
+        step = self.compiled[step_idx]
+        numero = contact['numero']
+        nome = self._contact_name(contact_idx)
+        total_steps = len(self.sequence)
+
+        self.progress['current'] += 1
+        self.progress['current_contact'] = f"{nome} ({numero})"
+        self.progress['current_message'] = step_idx + 1
+
+        try:
+            success, outcome = False, {}
+            send_started = self.clock()
+
+            label = self.sequence[step_idx].get('mediaType', step.media_type) if step.is_media else 'texto'
+            self.log(f"📤 Enviando mensagem {step_idx + 1}/{total_steps} ({label}) para {nome}")
+            success, outcome = await self._send(numero, step.template.render(nome), step)
+
+            if success:
+                self._record_latency(step.kind, self.clock() - send_started)
+                self.progress['success'] += 1
+                self.log(f"✅ Mensagem {step_idx + 1} enviada para {nome}")
+            elif outcome.get('retryable'):
+                self.progress['error'] += 1
+                self.progress['stuck'] = self.sender.watchdog.metrics['stuck']
+                self.progress['retryable'].append({'contact': contact_idx, 'step': step_idx, 'numero': numero})
+                self.log(f"⏱️ Mensagem {step_idx + 1} para {nome} travou e foi abandonada "
+                         f"(entrega não confirmada; marcada como retentável, sem reenvio automático)")
+            else:
+                self.progress['error'] += 1
+                self.log(f"❌ Falha na mensagem {step_idx + 1} para {nome}")
+
+            overloaded = bool(outcome.get('timed_out')) or (outcome.get('status') or 0) >= 500
+            return success, overloaded
+
+        except asyncio.CancelledError:
+            # O envio terminou, mas o resultado não foi contado: registra a posição
+            # para que a retomada não repita esta mensagem
+            self._advance(contact_idx, step_idx)
+            raise
+
+        except Exception as e:
+            self.progress['error'] += 1
+            self.log(f"❌ Erro na mensagem {step_idx + 1} para {nome}: {str(e)}")
+            return False, False
+
+    async def _dispatch_task(self, contact_idx: int, step_idx: int, started_at: float) -> None:
+        """Envio em paralelo: devolve a vaga ao limitador e agenda o próximo passo do contato"""
+        success, overloaded = False, False
+        try:
+            success, overloaded = await self._dispatch(contact_idx, step_idx)
+        finally:
+            await self.concurrency.release(started_at, success, overloaded)
+            self.progress['concurrency'] = self.concurrency.stats()
+            self._update_throughput()
+        if self.control.is_stopped:
+            self._advance(contact_idx, step_idx)
+        else:
+            self._schedule_after(contact_idx, step_idx, self.clock())
+        self._wakeup.set()
+
+    def _record_latency(self, kind: str, seconds: float) -> None:
+        """Média acumulada da latência de envio por tipo, usada nas próximas estimativas"""
+        mean, count = self.progress['latency'].get(kind, (0.0, 0))
+        count += 1
+        self.progress['latency'][kind] = [round(mean + (seconds - mean) / count, 3), count]
+
+    def _update_throughput(self) -> None:
+        """Vazão medida nesta execução, término projetado e comparação com o plano"""
+        done = self.progress['current'] - self._sent_at_start
+        elapsed = self.clock() - self._run_started
+        throughput = {'elapsed_seconds': round(elapsed, 1)}
+        if done > 0 and elapsed > 0:
+            rate = done / elapsed
+            remaining = (self.progress['total'] - self.progress['current']) / rate
+            throughput['messages_per_hour'] = round(rate * 3600, 1)
+            throughput['projected_completion'] = \
+                (self.now() + timedelta(seconds=remaining)).isoformat(timespec='seconds')
+            planned = (self.progress['plan'] or {}).get('messages_per_hour')
+            if planned:
+                throughput['plan_ratio'] = round(rate * 3600 / planned, 3)
+        self.progress['throughput'] = throughput
+
+    def _advance(self, contact_idx: int, step_idx: int) -> None:
+        """Registra no controle que o passo ``step_idx`` do contato já foi despachado"""
+        next_step = step_idx + 1
+        self.control.mark_step(contact_idx, next_step if next_step < len(self.sequence) else None)
+
+    def _schedule_after(self, contact_idx: int, step_idx: int, now: float) -> None:
+        """Agenda o passo seguinte do contato ou libera a vaga se a sequência acabou"""
+        self._advance(contact_idx, step_idx)
+        next_step = step_idx + 1
+        if next_step < len(self.sequence):
+            wait_time = self._sequence_interval()
+            self.log(f"⏳ {self._contact_name(contact_idx)}: próxima mensagem em {wait_time:.1f}s")
+            self.scheduler.schedule(now + wait_time + self._prep_time(contact_idx, next_step),
+                                    contact_idx, next_step)
+        else:
+            self._fill_slots(now)
+
+    def _restore(self, now: float) -> None:
+        """Reagenda os contatos que estavam em andamento quando a campanha parou"""
+        due = now
+        for contact_idx, step_idx in sorted(self.control.pending.items()):
+            self._activate(contact_idx, step_idx, due)
+            self.last_activation = due
+            due += self._sequence_interval()
+
+    async def _wait(self, seconds: Optional[float]) -> bool:
+        """
+        Espera até ``seconds`` (ou indefinidamente), acordando antes se um envio
+        em paralelo terminar e agendar algo novo
+
+        Returns:
+            False se a campanha foi parada
+        """
+        self._wakeup.clear()
+        waiters = [asyncio.ensure_future(self._wakeup.wait())]
+        if seconds is not None:
+            waiters.append(asyncio.ensure_future(self.control.wait(seconds)))
+        try:
+            await asyncio.wait(waiters, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in waiters:
+                waiter.cancel()
+        return not self.control.is_stopped
+
+    async def run(self) -> bool:
+        """
+        Executa a campanha até o fim ou até ser parada
+
+        Returns:
+            True se todos os passos foram despachados, False se foi parada
+        """
+        steps = len(self.sequence)
+        already_sent = self.next_contact * steps - sum(steps - s for s in self.control.pending.values())
+        self.progress['current'] = already_sent
+        self._sent_at_start = already_sent
+        self._run_started = self.clock()
+
+        mode = "sequencial" if self.max_active == 1 else f"até {self.max_active} contatos intercalados"
+        self.log(f"🚀 Envio iniciado para {len(self.contacts)} contatos ({mode}).")
+        self.log(f"🎭 Perfil de comportamento: {self.profile_name}")
+
+        now = self.clock()
+        self._restore(now)
+        self._fill_slots(now)
+
+        try:
+            while len(self.scheduler) or self._in_flight:
+                if not await self.control.checkpoint():
+                    break
+
+                if not len(self.scheduler):
+                    # Só há envios em andamento; os próximos passos são agendados quando terminarem
+                    await self._wait(None)
+                    continue
+
+                delay = self.scheduler.next_due() - self.clock()
+                if delay > 0:
+                    if not await self._wait(delay):
+                        break
+                    continue
+
+                if self.rate_limiter is not None:
+                    # A ficha é consumida aqui, antes do despacho: a espera por ela é
+                    # interrompível e nenhum envio fica bloqueado no executor
+                    throttle = await self._take_token()
+                    if throttle > 0:
+                        if not await self._wait(max(throttle, MIN_THROTTLE_WAIT)):
+                            break
+                        continue
+
+                started_at = await self.concurrency.acquire()
+                if self.control.is_stopped:
+                    await self.concurrency.release(started_at, ok=False)
+                    break
+
+                _, contact_idx, step_idx = self.scheduler.pop()
+                task = asyncio.ensure_future(self._dispatch_task(contact_idx, step_idx, started_at))
+                self._in_flight.add(task)
+                task.add_done_callback(self._in_flight.discard)
+        finally:
+            # Drena os envios em andamento antes de encerrar
+            if self._in_flight:
+                await asyncio.gather(*self._in_flight, return_exceptions=True)
+
+        if self.control.is_stopped:
+            return False
+
+        self._log_summary()
+        return True
+
+    def _log_summary(self) -> None:
+        success_count = self.progress['success']
+        error_count = self.progress['error']
+        total_count = self.progress['total']
+        success_rate = (success_count / total_count) * 100 if total_count > 0 else 0
+        session_duration = (self.clock() - self.session_start_time) / 60
+
+        self.log("=" * 50)
+        self.log("🎉 SEQUÊNCIA CONCLUÍDA!")
+        self.log(f"✅ Sucessos: {success_count}")
+        self.log(f"❌ Erros: {error_count}")
+        self.log(f"📈 Taxa de sucesso: {success_rate:.1f}%")
+        retryable_count = len(self.progress['retryable'])
+        if retryable_count:
+            self.log(f"⏱️ Envios travados abandonados: {retryable_count} (entrega não confirmada; "
+                     f"listados em progress['retryable'] para reenvio manual)")
+        self.log(f"⏱️ Duração da sessão: {session_duration:.1f} minutos")
+        self.log(f"🎭 Perfil usado: {self.profile_name}")
@@ -0,0 +1,43 @@
+"""
+WhatsApp API Sender - Campaign Scheduler Module
+Agenda cada (contato, passo) da sequência como um evento com horário de disparo
+"""
+
+import heapq
+import itertools
+from typing import List, Optional, Tuple
+
+
+class CampaignScheduler:
+    """
+    Fila de prioridade de eventos ``(horário, ordem, contato, passo)``.
+
+    O envio não fica mais parado esperando o intervalo entre as mensagens de
+    um contato: enquanto o próximo passo de A não vence, o passo que vencer
+    primeiro (de A, B, C...) é despachado. Empates saem na ordem em que foram
+    agendados.
+    """
+
+    def __init__(self):
+        self._heap: List[Tuple[float, int, int, int]] = []
+        self._seq = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, due: float, contact_idx: int, step_idx: int) -> None:
+        """Agenda o passo ``step_idx`` do contato ``contact_idx`` para ``due``"""
+        heapq.heappush(self._heap, (due, next(self._seq), contact_idx, step_idx))
+
+    def next_due(self) -> Optional[float]:
+        """Horário do próximo evento, ou None se a fila estiver vazia"""
+        return self._heap[0][0] if self._heap else None
+
+    def pop(self) -> Tuple[float, int, int]:
+        """Remove e retorna o próximo evento como (horário, contato, passo)"""
+        due, _, contact_idx, step_idx = heapq.heappop(self._heap)
+        return due, contact_idx, step_idx
+
+    def pending(self) -> List[Tuple[int, int]]:
+        """Eventos ainda não despachados como (contato, passo), em ordem de horário"""
+        return [(contact_idx, step_idx) for _, _, contact_idx, step_idx in sorted(self._heap)]
@@ -0,0 +1,162 @@
+"""
+WhatsApp API Sender - Campaign Supervisor Module
+Gerencia a task asyncio da campanha: início, pausa, parada, retomada e encerramento
+"""
+
+import asyncio
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from campaign_control import AsyncCampaignControl
+from campaign_runner import CampaignRunner
+
+
+class CampaignSupervisor:
+    """
+    Dono único da campanha em andamento no servidor web.
+
+    Cria o ``CampaignRunner`` como task no loop do Quart, repassa os comandos
+    da interface para o ``AsyncCampaignControl`` e guarda o ponto de retomada
+    quando a campanha é parada. Os handlers apenas leem ``status()``.
+    """
+
+    def __init__(self, log: Optional[Callable[[str], None]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.log = log or self.logger.info
+        self.runner: Optional[CampaignRunner] = None
+        self.control: Optional[AsyncCampaignControl] = None
+        self.task: Optional[asyncio.Task] = None
+        self.resume_point: Optional[Dict[str, Any]] = None
+        self._last_progress: Dict[str, Any] = {}
+
+    @property
+    def is_running(self) -> bool:
+        return self.task is not None and not self.task.done()
+
+    @property
+    def is_paused(self) -> bool:
+        return self.is_running and self.control.is_paused
+
+    def progress(self) -> Dict[str, Any]:
+        """Cópia do progresso da campanha atual (ou da última)"""
+        if self.runner is not None:
+            return dict(self.runner.progress)
+        return dict(self._last_progress)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            'sending_active': self.is_running,
+            'sending_paused': self.is_paused,
+            'can_resume': not self.is_running and self.resume_point is not None,
+            'send_progress': self.progress()
+        }
+
+    def start(self, contacts: List[Dict[str, Any]], sequence: List[Dict[str, Any]],
+              config: Dict[str, Any], message_config: Dict[str, Any], sender,
+              position: Tuple[int, int] = (0, 0), pending: Optional[Dict[int, int]] = None,
+              progress: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Inicia a campanha como task no loop atual
+
+        Raises:
+            RuntimeError: Se já houver uma campanha em andamento
+        """
+        if self.is_running:
+            raise RuntimeError('Envio já está em andamento')
+
+        self.resume_point = None
+        self.control = AsyncCampaignControl(position, pending)
+        self.runner = CampaignRunner(contacts, sequence, config, message_config, sender,
+                                     self.control, progress, self.log)
+        self.task = asyncio.get_running_loop().create_task(
+            self._supervise(self.runner, contacts, sequence, config, message_config, sender)
+        )
+
+    async def _supervise(self, runner: CampaignRunner, contacts, sequence, config,
+                         message_config, sender) -> None:
+        control = runner.control
+        try:
+            await runner.run()
+        except asyncio.CancelledError:
+            control.stop()
+            raise
+        except Exception as e:
+            control.stop()
+            self.log(f"💥 Erro crítico no envio: {str(e)}")
+        finally:
+            if control.is_stopped:
+                # Guardar a posição para retomar exatamente de onde parou
+                self.resume_point = {
+                    'contacts': contacts,
+                    'sequence': sequence,
+                    'config': config,
+                    'message_config': message_config,
+                    'sender': sender,
+                    'position': control.position,
+                    'pending': dict(control.pending),
+                    'progress': dict(runner.progress)
+                }
+                contact_idx, step_idx = control.resume_position()
+                self.log(f"⏹️ Envio interrompido no contato {contact_idx + 1}, "
+                         f"mensagem {step_idx + 1} (use retomar para continuar)")
+            runner.progress['current_contact'] = 'Envio finalizado'
+            self._last_progress = dict(runner.progress)
+            _flush_log_handlers()
+
+    def pause(self) -> bool:
+        if not self.is_running:
+            return False
+        self.control.pause()
+        return True
+
+    def resume(self) -> Optional[Tuple[int, int]]:
+        """
+        Retoma uma campanha pausada, ou reinicia uma parada a partir do ponto salvo
+
+        Returns:
+            (contato, passo) de onde o envio continua, ou None se não há o que retomar
+        """
+        if self.is_paused:
+            self.control.resume()
+            return self.control.resume_position()
+
+        point = self.resume_point
+        if self.is_running or not point:
+            return None
+
+        self.start(point['contacts'], point['sequence'], point['config'], point['message_config'],
+                   point['sender'], point['position'], point['pending'], point['progress'])
+        return self.control.resume_position()
+
+    def stop(self) -> bool:
+        if not self.is_running:
+            return False
+        self.control.stop()
+        return True
+
+    async def shutdown(self, timeout: float = 30.0) -> None:
+        """
+        Encerramento gracioso: para a campanha, espera o envio em andamento
+        terminar e só cancela a task se passar de ``timeout`` segundos
+        """
+        if not self.is_running:
+            return
+        self.control.stop()
+        try:
+            await asyncio.wait_for(asyncio.shield(self.task), timeout)
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Campanha não terminou em {timeout:.0f}s; cancelando")
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+
+def _flush_log_handlers() -> None:
+    """Garante que os logs da campanha foram gravados em disco"""
+    for handler in logging.getLogger().handlers:
+        try:
+            handler.flush()
+        except Exception:
+            pass
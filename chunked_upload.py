@@ -0,0 +1,266 @@
+"""
+WhatsApp API Sender - Chunked Upload Module
+Upload em partes (init, envio de cada parte por offset, conclusão) gravado
+direto em disco, com sha256 calculado durante o recebimento e retomada após
+queda de conexão
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import logging
+from typing import Any, AsyncIterable, Dict, Optional
+
+from sequence_compiler import MAX_MEDIA_MB
+
+DEFAULT_INCOMING_DIR = os.path.join('uploads', 'incoming')
+CHUNK_SIZE = 8 * 1024 * 1024  # Tamanho sugerido ao cliente; cada PUT fica abaixo do MAX_CONTENT_LENGTH
+FLUSH_SIZE = 1024 * 1024  # Bytes acumulados antes de gravar em disco
+STALE_SECONDS = 24 * 3600  # Uploads incompletos parados há mais tempo são descartados
+
+MEDIA_EXTENSIONS = {
+    'image': ['jpg', 'jpeg', 'png', 'gif', 'webp'],
+    'video': ['mp4', 'avi', 'mov', 'wmv', 'flv', 'mkv'],
+    'audio': ['mp3', 'wav', 'ogg', 'aac', 'm4a', 'flac'],
+    'document': ['pdf', 'doc', 'docx', 'xls', 'xlsx', 'txt', 'rtf']
+}
+
+# Tipos de upload: extensões aceitas e limite padrão (config.json: upload_limits_mb)
+UPLOAD_KINDS = {
+    'contacts': {'extensions': ['xlsx'], 'limit_mb': 50},
+    'media': {'extensions': [ext for exts in MEDIA_EXTENSIONS.values() for ext in exts],
+              'limit_mb': MAX_MEDIA_MB}
+}
+
+
+class UploadError(Exception):
+    """Erro do protocolo de upload; ``status`` é o código HTTP correspondente"""
+
+    def __init__(self, message: str, status: int = 400, offset: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+class ChunkedUploadManager:
+    """
+    Uploads em partes guardados em ``incoming_dir``: ``<id>.json`` com os
+    dados da sessão e ``<id><ext>`` com os bytes recebidos.
+
+    O offset aceito é sempre o tamanho do arquivo em disco, então depois de
+    uma queda o cliente consulta ``status()`` e continua de onde parou. O
+    sha256 é atualizado a cada parte; se o servidor reiniciou no meio, o
+    trecho já gravado é relido uma vez para recompor o hash.
+    """
+
+    def __init__(self, incoming_dir: str = DEFAULT_INCOMING_DIR,
+                 limits_mb: Optional[Dict[str, float]] = None):
+        self.logger = logging.getLogger(__name__)
+        self.incoming_dir = incoming_dir
+        self.limits_mb = limits_mb or {}
+        os.makedirs(incoming_dir, exist_ok=True)
+        self._hashers: Dict[str, Any] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+
+    def limit_bytes(self, kind: str) -> int:
+        limit_mb = self.limits_mb.get(kind, UPLOAD_KINDS[kind]['limit_mb'])
+        return int(limit_mb * 1024 * 1024)
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.incoming_dir, f"{upload_id}.json")
+
+    def data_path(self, session: Dict[str, Any]) -> str:
+        return os.path.join(self.incoming_dir, session['upload_id'] + session['ext'])
+
+    def _load(self, upload_id: str) -> Dict[str, Any]:
+        # upload_id vem da URL: só aceita o formato gerado em init()
+        if len(upload_id) != 32 or not all(c in '0123456789abcdef' for c in upload_id):
+            raise UploadError('Upload não encontrado', 404)
+        try:
+            with open(self._meta_path(upload_id), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise UploadError('Upload não encontrado', 404)
+
+    def _save(self, session: Dict[str, Any]) -> None:
+        path = self._meta_path(session['upload_id'])
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(session, f)
+        os.replace(path + '.tmp', path)
+
+    def init(self, kind: str, filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Abre um upload
+
+        Args:
+            kind: ``contacts`` ou ``media``
+            filename: Nome original do arquivo
+            size: Tamanho total em bytes
+            sha256: Hash esperado (opcional, conferido na conclusão)
+
+        Returns:
+            Estado do upload (``upload_id``, ``offset``, ``chunk_size``...)
+
+        Raises:
+            UploadError: Tipo, extensão ou tamanho inválido
+        """
+        if kind not in UPLOAD_KINDS:
+            raise UploadError(f"Tipo de upload desconhecido: {kind}")
+        ext = os.path.splitext(filename)[1].lower()
+        if ext.lstrip('.') not in UPLOAD_KINDS[kind]['extensions']:
+            raise UploadError('Tipo de arquivo não suportado', 415)
+        if size <= 0:
+            raise UploadError('Tamanho do arquivo inválido')
+        limit = self.limit_bytes(kind)
+        if size > limit:
+            raise UploadError(f"Arquivo muito grande ({size / 1024 / 1024:.1f}MB, "
+                              f"máximo {limit / 1024 / 1024:.0f}MB)", 413)
+
+        session = {
+            'upload_id': uuid.uuid4().hex,
+            'kind': kind,
+            'filename': filename,
+            'ext': ext,
+            'size': size,
+            'sha256': sha256.lower() if sha256 else None,
+            'created_at': time.time(),
+            'updated_at': time.time()
+        }
+        open(self.data_path(session), 'wb').close()
+        self._save(session)
+        self._hashers[session['upload_id']] = hashlib.sha256()
+        return self.status(session['upload_id'])
+
+    def status(self, upload_id: str) -> Dict[str, Any]:
+        session = self._load(upload_id)
+        offset = os.path.getsize(self.data_path(session))
+        return {
+            'upload_id': upload_id,
+            'kind': session['kind'],
+            'filename': session['filename'],
+            'size': session['size'],
+            'offset': offset,
+            'complete': offset == session['size'],
+            'chunk_size': CHUNK_SIZE
+        }
+
+    def _hasher(self, session: Dict[str, Any], offset: int):
+        hasher = self._hashers.get(session['upload_id'])
+        if hasher is None:
+            # Servidor reiniciou no meio do upload: recompõe o hash do que já está em disco
+            hasher = hashlib.sha256()
+            with open(self.data_path(session), 'rb') as f:
+                for block in iter(lambda: f.read(FLUSH_SIZE), b''):
+                    hasher.update(block)
+            self._hashers[session['upload_id']] = hasher
+        return hasher
+
+    def _append(self, session: Dict[str, Any], data: bytes) -> None:
+        with open(self.data_path(session), 'ab') as f:
+            f.write(data)
+        self._hashers[session['upload_id']].update(data)
+
+    async def write_chunk(self, upload_id: str, offset: int, body: AsyncIterable[bytes]) -> Dict[str, Any]:
+        """
+        Grava uma parte começando em ``offset``
+
+        O corpo é consumido aos poucos e gravado em blocos de ``FLUSH_SIZE``;
+        se a conexão cair no meio, o que já chegou fica gravado e o próximo
+        PUT começa do novo offset.
+
+        Raises:
+            UploadError: Offset diferente do recebido até agora (409, com o
+                offset correto) ou parte ultrapassando o tamanho declarado (413)
+        """
+        loop = asyncio.get_running_loop()
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            session = self._load(upload_id)
+            current = os.path.getsize(self.data_path(session))
+            if offset != current:
+                raise UploadError(f"Offset {offset} inválido, esperado {current}", 409, current)
+            await loop.run_in_executor(None, self._hasher, session, current)
+
+            received = current
+            buffer = bytearray()
+            try:
+                async for data in body:
+                    received += len(data)
+                    if received > session['size']:
+                        raise UploadError('Parte ultrapassa o tamanho declarado do arquivo', 413)
+                    buffer += data
+                    if len(buffer) >= FLUSH_SIZE:
+                        await loop.run_in_executor(None, self._append, session, bytes(buffer))
+                        buffer.clear()
+            finally:
+                # Também grava o que chegou antes de uma queda de conexão
+                if buffer and received <= session['size']:
+                    await loop.run_in_executor(None, self._append, session, bytes(buffer))
+                session['updated_at'] = time.time()
+                self._save(session)
+            return self.status(upload_id)
+
+    async def complete(self, upload_id: str, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Fecha o upload conferindo tamanho e hash
+
+        Depois de um reinício do servidor o hash é recalculado do arquivo
+        inteiro (até o limite do tipo): isso roda no executor, como em
+        ``write_chunk``, e sob o mesmo lock do upload
+
+        Returns:
+            Sessão com ``path`` (arquivo recebido) e ``sha256`` calculado; o
+            chamador move ou processa o arquivo e depois chama ``discard()``
+
+        Raises:
+            UploadError: Upload incompleto (409) ou hash divergente (422)
+        """
+        lock = self._locks.setdefault(upload_id, asyncio.Lock())
+        async with lock:
+            session = self._load(upload_id)
+            path = self.data_path(session)
+            offset = os.path.getsize(path)
+            if offset != session['size']:
+                raise UploadError(f"Upload incompleto ({offset} de {session['size']} bytes)", 409, offset)
+
+            hasher = await asyncio.get_running_loop().run_in_executor(None, self._hasher, session, offset)
+        digest = hasher.hexdigest()
+        expected = (sha256 or session['sha256'] or '').lower()
+        if expected and expected != digest:
+            raise UploadError('sha256 do arquivo recebido não confere', 422)
+        return {**session, 'path': path, 'sha256': digest}
+
+    def discard(self, upload_id: str) -> None:
+        """Remove os arquivos do upload (o arquivo de dados pode já ter sido movido)"""
+        session = self._load(upload_id)
+        for path in (self.data_path(session), self._meta_path(upload_id)):
+            if os.path.exists(path):
+                os.remove(path)
+        self._hashers.pop(upload_id, None)
+        self._locks.pop(upload_id, None)
+
+    def cleanup(self, max_age: float = STALE_SECONDS) -> int:
+        """
+        Descarta uploads sem atividade há mais de ``max_age`` segundos
+
+        Returns:
+            Quantidade de uploads removidos
+        """
+        cutoff = time.time() - max_age
+        removed = 0
+        for name in os.listdir(self.incoming_dir):
+            if not name.endswith('.json'):
+                continue
+            upload_id = name[:-len('.json')]
+            try:
+                if self._load(upload_id)['updated_at'] < cutoff:
+                    self.discard(upload_id)
+                    removed += 1
+            except (UploadError, ValueError, OSError):
+                continue
+        if removed:
+            self.logger.info(f"🧹 {removed} upload(s) incompleto(s) descartado(s)")
+        return removed
@@ -0,0 +1,171 @@
+"""
+WhatsApp API Sender - Contact Table Module
+Tabela compacta de contatos (colunas em arrays, status em um byte, números
+válidos como inteiros), convertida para o formato JSON de sempre só nas
+respostas da API
+"""
+
+import sys
+from array import array
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+PENDING = 0
+VALID = 1
+INVALID = 2
+
+# Rótulos e classes CSS por código de status: um objeto por status, não por contato
+STATUS_LABELS = ('Não Validado', 'Válido', 'Inválido')
+STATUS_CLASSES = ('warning', 'success', 'danger')
+
+
+class ContactTable:
+    """
+    Contatos em colunas: o contato ``i`` é a linha ``i`` (``id`` = índice).
+
+    - ``_numbers``: número E.164 válido como int64 (sem o ``+``), 0 se não validado/inválido
+    - ``_raw``: número como veio da planilha; vira None depois de validado
+    - ``_names`` e ``_sheets``: nome (ou None) e aba de origem (interned)
+    - ``_status``: um byte por contato (PENDING/VALID/INVALID)
+
+    Por contato ficam ~40 bytes de colunas mais o texto do nome, contra um
+    dict com cinco chaves e strings de status repetidas.
+    """
+
+    def __init__(self, contacts: Iterable[Dict[str, Any]] = ()):
+        self._numbers = array('q')
+        self._raw: List[Optional[str]] = []
+        self._names: List[Optional[str]] = []
+        self._sheets: List[Optional[str]] = []
+        self._status = bytearray()
+        self._valid = 0
+        self._invalid = 0
+        self.extend(contacts)
+
+    def __len__(self) -> int:
+        return len(self._status)
+
+    def __bool__(self) -> bool:
+        return len(self._status) > 0
+
+    def append(self, numero: str, nome: Optional[str] = None, aba: Optional[str] = None) -> int:
+        self._numbers.append(0)
+        self._raw.append(numero)
+        self._names.append(nome)
+        self._sheets.append(sys.intern(aba) if aba is not None else None)
+        self._status.append(PENDING)
+        return len(self._status) - 1
+
+    def extend(self, contacts: Iterable[Dict[str, Any]]) -> None:
+        """Acrescenta contatos no formato da planilha (``numero``, ``nome``, ``aba``)"""
+        for contact in contacts:
+            self.append(str(contact.get('numero', '')), contact.get('nome'), contact.get('aba'))
+
+    def __contains__(self, index: int) -> bool:
+        return isinstance(index, int) and 0 <= index < len(self._status)
+
+    @property
+    def validated(self) -> bool:
+        return (self._valid + self._invalid) > 0
+
+    @property
+    def valid_count(self) -> int:
+        return self._valid
+
+    @property
+    def invalid_count(self) -> int:
+        return self._invalid
+
+    def status(self, index: int) -> int:
+        return self._status[index]
+
+    def numero(self, index: int) -> str:
+        if self._status[index] == VALID:
+            return f"+{self._numbers[index]}"
+        return self._raw[index] or ''
+
+    def nome(self, index: int) -> Optional[str]:
+        return self._names[index]
+
+    def raw_numbers(self) -> List[str]:
+        """Números a validar, na ordem dos contatos (o formatado, se já válido)"""
+        return [raw if raw is not None else f"+{number}" for raw, number in zip(self._raw, self._numbers)]
+
+    def _count(self, status: int, delta: int) -> None:
+        if status == VALID:
+            self._valid += delta
+        elif status == INVALID:
+            self._invalid += delta
+
+    def set_validation(self, index: int, formatted_number: Optional[str]) -> None:
+        """Grava o resultado de ``validate_phone_number`` para o contato"""
+        self._count(self._status[index], -1)
+        if formatted_number:
+            self._numbers[index] = int(formatted_number.lstrip('+'))
+            self._raw[index] = None
+            self._status[index] = VALID
+        else:
+            if self._raw[index] is None:
+                self._raw[index] = f"+{self._numbers[index]}"
+            self._numbers[index] = 0
+            self._status[index] = INVALID
+        self._count(self._status[index], 1)
+
+    def update(self, index: int, nome: Optional[str], numero: str) -> None:
+        """Troca nome e número; o contato volta a ``PENDING`` até ser revalidado"""
+        self._count(self._status[index], -1)
+        self._names[index] = nome
+        self._raw[index] = numero
+        self._numbers[index] = 0
+        self._status[index] = PENDING
+
+    def reset_validation(self) -> None:
+        for index in self.indices(VALID):
+            self._raw[index] = f"+{self._numbers[index]}"
+            self._numbers[index] = 0
+        self._status = bytearray(len(self._status))
+        self._valid = self._invalid = 0
+
+    def indices(self, status: Optional[int] = None) -> Iterator[int]:
+        """Índices dos contatos (com o ``status`` dado), em ordem de id"""
+        if status is None:
+            return iter(range(len(self._status)))
+        code = bytes([status])
+        found = self._status.find(code)
+        positions = []
+        while found != -1:
+            positions.append(found)
+            found = self._status.find(code, found + 1)
+        return iter(positions)
+
+    def sheet_counts(self) -> Dict[str, int]:
+        counts: Dict[str, int] = {}
+        for sheet in self._sheets:
+            if sheet is not None:
+                counts[sheet] = counts.get(sheet, 0) + 1
+        return counts
+
+    def to_dict(self, index: int) -> Dict[str, Any]:
+        """Contato no formato JSON usado pela interface"""
+        status = self._status[index]
+        contact: Dict[str, Any] = {'id': index, 'numero': self.numero(index)}
+        if self._names[index] is not None:
+            contact['nome'] = self._names[index]
+        if self._sheets[index] is not None:
+            contact['aba'] = self._sheets[index]
+        if status != PENDING:
+            contact['status'] = STATUS_LABELS[status]
+            contact['status_class'] = STATUS_CLASSES[status]
+        return contact
+
+    def to_dicts(self, indices: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+        return [self.to_dict(index) for index in (self.indices() if indices is None else indices)]
+
+    def campaign_contacts(self, indices: Iterable[int]) -> List[Dict[str, str]]:
+        """Só o que o envio usa (``numero`` e ``nome``), para a fila do sender_worker"""
+        contacts = []
+        for index in indices:
+            contact = {'numero': self.numero(index)}
+            if self._names[index] is not None:
+                contact['nome'] = self._names[index]
+            contacts.append(contact)
+        return contacts
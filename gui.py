@@ -23,6 +23,7 @@ from utils import (
     create_sample_excel
 )
 from api_sender import WhatsAppAPISender
+from campaign_control import CampaignControl
 
 
 # Configurar aparência do CustomTkinter
@@ -49,6 +50,8 @@ class WhatsAppSenderGUI:
         self.valid_contacts = []
         self.sender = None
         self.sending_active = False
+        self.control = None
+        self.resume_index = None  # Próximo contato de um envio interrompido
         
         # Configurar interface
         self.setup_ui()
@@ -305,6 +308,12 @@ class WhatsAppSenderGUI:
                                     state="disabled")
         self.stop_btn.pack(side="right", padx=20, pady=20)
         
+        self.pause_btn = ctk.CTkButton(control_frame, text="⏸️ Pausar",
+                                     command=self.toggle_pause, height=50,
+                                     font=ctk.CTkFont(size=16, weight="bold"),
+                                     state="disabled")
+        self.pause_btn.pack(side="right", padx=20, pady=20)
+        
     def setup_logs_tab(self):
         """Configura a aba de logs"""
         
@@ -592,18 +601,29 @@ class WhatsAppSenderGUI:
         if not result:
             return
         
+        # Oferecer retomada de um envio interrompido
+        start_index = 0
+        if self.resume_index:
+            if messagebox.askyesno("Retomar Envio",
+                                   f"O último envio parou no contato {self.resume_index + 1}.\n\n"
+                                   "Deseja continuar de onde parou?"):
+                start_index = self.resume_index
+        self.resume_index = None
+        
         # Configurar interface para envio
         self.sending_active = True
+        self.control = CampaignControl((start_index, 0))
         self.start_btn.configure(state="disabled")
         self.stop_btn.configure(state="normal")
+        self.pause_btn.configure(state="normal", text="⏸️ Pausar")
         self.progress_bar.set(0)
         
         # Iniciar envio em thread separada
-        self.send_thread = threading.Thread(target=self.send_messages_thread)
+        self.send_thread = threading.Thread(target=self.send_messages_thread, args=(self.control,))
         self.send_thread.daemon = True
         self.send_thread.start()
     
-    def send_messages_thread(self):
+    def send_messages_thread(self, control):
         """Thread para envio de mensagens"""
         try:
             self.sender = WhatsAppAPISender(self.config)
@@ -611,12 +631,15 @@ class WhatsAppSenderGUI:
             success_count = 0
             error_count = 0
             total = len(self.valid_contacts)
+            start_index = control.position[0]
             
-            self.log_message(f"🚀 Iniciando envio de {total} mensagens...")
+            self.root.after(0, self.log_message, f"🚀 Iniciando envio de {total - start_index} mensagens...")
             
-            for i, contact in enumerate(self.valid_contacts):
-                if not self.sending_active:  # Verificar se foi parado
+            for i in range(start_index, total):
+                contact = self.valid_contacts[i]
+                if not control.checkpoint():  # Verificar se foi parado
                     break
+                control.mark(i, 0)
                 
                 numero = contact['numero']
                 nome = contact.get('nome', 'Contato')
@@ -636,6 +659,7 @@ class WhatsAppSenderGUI:
                     
                     # Enviar mensagem
                     success = self.sender.send_message(numero, mensagem, caminho_midia)
+                    control.mark(i + 1, 0)
                     
                     if success:
                         success_count += 1
@@ -650,20 +674,27 @@ class WhatsAppSenderGUI:
                     self.root.after(0, self.update_live_stats, success_count, error_count, total)
                     
                     # Aguardar intervalo (se não for a última mensagem)
-                    if i < total - 1 and self.sending_active:
+                    if i < total - 1 and not control.is_stopped:
                         import random
-                        import time
                         wait_time = random.randint(self.min_interval_var.get(), 
                                                  self.max_interval_var.get())
                         self.root.after(0, self.log_message, 
                                       f"⏳ Aguardando {wait_time} segundos...")
-                        time.sleep(wait_time)
+                        if not control.wait(wait_time):
+                            break
                 
                 except Exception as e:
+                    control.mark(i + 1, 0)
                     error_count += 1
                     self.root.after(0, self.log_message, 
                                   f"❌ Erro no envio para {numero}: {str(e)}")
             
+            if control.is_stopped:
+                # Guardar a posição para oferecer retomada no próximo início
+                next_index = control.position[0]
+                self.resume_index = next_index if next_index < total else None
+                return
+            
             # Finalizar envio
             self.root.after(0, self.finish_sending, success_count, error_count, total)
             
@@ -689,6 +720,7 @@ class WhatsAppSenderGUI:
         self.sending_active = False
         self.start_btn.configure(state="normal")
         self.stop_btn.configure(state="disabled")
+        self.pause_btn.configure(state="disabled", text="⏸️ Pausar")
         
         # Mostrar resumo final
         success_rate = (success_count / total) * 100 if total > 0 else 0
@@ -712,12 +744,28 @@ class WhatsAppSenderGUI:
         messagebox.showinfo("Envio Concluído", summary_message)
     
     def stop_sending(self):
-        """Para o envio de mensagens"""
+        """Para o envio de mensagens (a posição fica salva para retomada)"""
+        if self.control:
+            self.control.stop()
         self.sending_active = False
         self.start_btn.configure(state="normal")
         self.stop_btn.configure(state="disabled")
+        self.pause_btn.configure(state="disabled", text="⏸️ Pausar")
         self.log_message("⏹️ Envio interrompido pelo usuário")
     
+    def toggle_pause(self):
+        """Pausa ou retoma o envio em andamento"""
+        if not self.control or self.control.is_stopped:
+            return
+        if self.control.is_paused:
+            self.control.resume()
+            self.pause_btn.configure(text="⏸️ Pausar")
+            self.log_message("▶️ Envio retomado")
+        else:
+            self.control.pause()
+            self.pause_btn.configure(text="▶️ Retomar")
+            self.log_message("⏸️ Envio pausado")
+    
     def log_message(self, message):
         """Adiciona mensagem ao log"""
         timestamp = datetime.now().strftime("%H:%M:%S")
@@ -0,0 +1,171 @@
+"""
+WhatsApp API Sender - Loop Monitor Module
+Mede continuamente o atraso do event loop e registra qual rota estava
+executando (com amostra da pilha) quando o atraso passou do limite
+"""
+
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+DEFAULT_INTERVAL = 0.05  # segundos entre medições
+DEFAULT_THRESHOLD = 0.1  # atraso a partir do qual a rota e a pilha são registradas
+HISTOGRAM_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+STACK_DEPTH = 12
+
+
+class LoopLagMonitor:
+    """
+    Duas partes:
+
+    - uma tarefa no loop dorme ``interval`` e mede quanto acordou atrasada
+      (o atraso é o tempo em que algo segurou o loop sem ``await``);
+    - uma thread vigia o último batimento dessa tarefa e, enquanto o loop
+      está travado além de ``threshold``, captura a pilha da thread do loop e
+      a rota da tarefa em execução (registrada por ``track()`` em
+      ``before_request``).
+
+    Quando a medição volta, o travamento é contabilizado para a rota no
+    histograma de piores ofensores.
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, threshold: float = DEFAULT_THRESHOLD,
+                 max_events: int = 100, window: int = 2000):
+        self.logger = logging.getLogger(__name__)
+        self.interval = interval
+        self.threshold = threshold
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS_MS) + 1)
+        self.recent = deque(maxlen=window)
+        self.events = deque(maxlen=max_events)
+        self.offenders: Dict[str, Dict[str, Any]] = {}
+        self.samples = 0
+        self.max_lag = 0.0
+        self._routes: Dict[asyncio.Task, str] = {}
+        self._lock = threading.Lock()
+        self._pending: Optional[Dict[str, Any]] = None
+        self._beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def track(self, route: str) -> None:
+        """Associa a tarefa atual (uma requisição) à rota"""
+        task = asyncio.current_task()
+        if task is not None:
+            self._routes[task] = route
+
+    def untrack(self) -> None:
+        task = asyncio.current_task()
+        if task is not None:
+            self._routes.pop(task, None)
+
+    def start(self) -> None:
+        """Inicia a medição no loop atual e a thread vigia"""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._measure())
+        self._thread = threading.Thread(target=self._watch, name='loop-monitor', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _measure(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self._beat = time.monotonic()
+            self._record(max(loop.time() - started - self.interval, 0.0))
+
+    def _current_route(self) -> str:
+        # Lido da thread vigia: a tarefa em execução no loop naquele instante
+        task = asyncio.current_task(self._loop)
+        if task is None:
+            return '(fora de requisição)'
+        return self._routes.get(task, f"(tarefa {task.get_name()})")
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.interval / 2):
+            stalled = time.monotonic() - self._beat - self.interval
+            if stalled < self.threshold:
+                continue
+            with self._lock:
+                if self._pending is not None:
+                    continue  # Uma amostra por travamento
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = traceback.format_stack(frame, limit=STACK_DEPTH) if frame is not None else []
+            with self._lock:
+                self._pending = {'route': self._current_route(), 'stack': [line.rstrip() for line in stack]}
+
+    def _record(self, lag: float) -> None:
+        lag_ms = lag * 1000
+        self.samples += 1
+        self.recent.append(lag_ms)
+        self.max_lag = max(self.max_lag, lag)
+        for index, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if lag_ms <= bound:
+                self.histogram[index] += 1
+                break
+        else:
+            self.histogram[-1] += 1
+
+        with self._lock:
+            pending, self._pending = self._pending, None
+        if lag < self.threshold:
+            return
+
+        route = pending['route'] if pending else '(desconhecida)'
+        stack = pending['stack'] if pending else []
+        event = {'at': time.time(), 'lag_ms': round(lag_ms, 1), 'route': route, 'stack': stack}
+        self.events.append(event)
+        offender = self.offenders.setdefault(route, {'route': route, 'count': 0, 'total_ms': 0.0,
+                                                     'max_ms': 0.0, 'stack': []})
+        offender['count'] += 1
+        offender['total_ms'] += lag_ms
+        if lag_ms >= offender['max_ms']:
+            offender['max_ms'] = lag_ms
+            offender['stack'] = stack
+        self.logger.warning(f"🐢 Event loop travado por {lag_ms:.0f}ms em {route}")
+
+    def _percentile(self, values: List[float], pct: float) -> float:
+        if not values:
+            return 0.0
+        return values[min(int(len(values) * pct), len(values) - 1)]
+
+    def snapshot(self, top: int = 10) -> Dict[str, Any]:
+        """Histograma, percentis recentes, piores rotas e últimos travamentos"""
+        recent = sorted(self.recent)
+        bounds = [str(bound) for bound in HISTOGRAM_BUCKETS_MS] + ['+inf']
+        offenders = sorted(self.offenders.values(), key=lambda o: o['total_ms'], reverse=True)[:top]
+        return {
+            'interval_ms': self.interval * 1000,
+            'threshold_ms': self.threshold * 1000,
+            'samples': self.samples,
+            'lag_ms': {
+                'p50': round(self._percentile(recent, 0.50), 2),
+                'p99': round(self._percentile(recent, 0.99), 2),
+                'max': round(self.max_lag * 1000, 2),
+                'mean': round(sum(recent) / len(recent), 2) if recent else 0.0
+            },
+            'histogram': [{'le_ms': bound, 'count': count} for bound, count in zip(bounds, self.histogram)],
+            'offenders': [{**o, 'total_ms': round(o['total_ms'], 1), 'max_ms': round(o['max_ms'], 1)}
+                          for o in offenders],
+            'events': list(self.events)[-20:]
+        }
+
+
+loop_monitor = LoopLagMonitor()
@@ -0,0 +1,240 @@
+"""
+WhatsApp API Sender - Media Optimizer Module
+Otimização das mídias antes da campanha: reduz/limpa imagens (Pillow) e
+converte vídeo para H.264 faststart e áudio para OGG/Opus (ffmpeg), com cache
+por sha256 do arquivo original + perfil
+"""
+
+import os
+import shutil
+import hashlib
+import logging
+import mimetypes
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+DEFAULT_CACHE_DIR = os.path.join('uploads', 'optimized')
+HASH_CHUNK = 1024 * 1024
+
+# Perfis de otimização: o nome entra na chave do cache
+PROFILES = {
+    'whatsapp': {
+        'image_max_side': 1600,
+        'image_quality': 80,
+        'video_max_width': 1280,
+        'video_crf': 28,
+        'video_audio_bitrate': '96k',
+        'audio_bitrate': '32k'
+    },
+    'economico': {
+        'image_max_side': 1024,
+        'image_quality': 70,
+        'video_max_width': 854,
+        'video_crf': 32,
+        'video_audio_bitrate': '64k',
+        'audio_bitrate': '24k'
+    }
+}
+
+logger = logging.getLogger(__name__)
+
+
+def file_sha256(path: str) -> str:
+    """sha256 do arquivo, lido em blocos"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def media_kind(path: str) -> str:
+    mime_type, _ = mimetypes.guess_type(path)
+    if mime_type and mime_type.split('/')[0] in ('image', 'video', 'audio'):
+        return mime_type.split('/')[0]
+    return 'document'
+
+
+def _optimize_image(source: str, target_base: str, profile: Dict[str, Any]) -> Optional[str]:
+    try:
+        from PIL import Image, ImageOps  # dependência opcional: sem Pillow as imagens ficam como estão
+    except ImportError:
+        return None
+
+    with Image.open(source) as image:
+        if getattr(image, 'is_animated', False):
+            return None  # GIF/WebP animado: mantém o original
+        image = ImageOps.exif_transpose(image)  # aplica a rotação antes de descartar o EXIF
+        image.thumbnail((profile['image_max_side'], profile['image_max_side']))
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        if has_alpha:
+            target = target_base + '.png'
+            image.save(target + '.tmp', 'PNG', optimize=True)
+        else:
+            target = target_base + '.jpg'
+            image.convert('RGB').save(target + '.tmp', 'JPEG', quality=profile['image_quality'],
+                                      optimize=True, progressive=True)
+    os.replace(target + '.tmp', target)
+    return target
+
+
+def _run_ffmpeg(args: List[str], target: str) -> Optional[str]:
+    ffmpeg = shutil.which('ffmpeg')
+    if ffmpeg is None:
+        return None
+    temp = target + '.tmp' + os.path.splitext(target)[1]
+    result = subprocess.run([ffmpeg, '-y', '-loglevel', 'error', *args, temp],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise RuntimeError(f"ffmpeg falhou: {result.stderr.strip()[:300]}")
+    os.replace(temp, target)
+    return target
+
+
+def _optimize_video(source: str, target_base: str, profile: Dict[str, Any]) -> Optional[str]:
+    return _run_ffmpeg([
+        '-i', source, '-map_metadata', '-1',
+        '-vf', f"scale='min({profile['video_max_width']},iw)':-2",
+        '-c:v', 'libx264', '-preset', 'veryfast', '-crf', str(profile['video_crf']), '-pix_fmt', 'yuv420p',
+        '-c:a', 'aac', '-b:a', profile['video_audio_bitrate'],
+        '-movflags', '+faststart'
+    ], target_base + '.mp4')
+
+
+def _optimize_audio(source: str, target_base: str, profile: Dict[str, Any]) -> Optional[str]:
+    # OGG/Opus mono: formato esperado por sendWhatsAppAudio (Evolution) e sendVoice (WAHA)
+    return _run_ffmpeg([
+        '-i', source, '-map_metadata', '-1', '-vn', '-ac', '1',
+        '-c:a', 'libopus', '-b:a', profile['audio_bitrate'], '-application', 'voip'
+    ], target_base + '.ogg')
+
+
+OPTIMIZERS = {'image': _optimize_image, 'video': _optimize_video, 'audio': _optimize_audio}
+TARGET_EXTENSIONS = {'video': '.mp4', 'audio': '.ogg'}
+
+
+def optimize_file(source: str, cache_dir: str = DEFAULT_CACHE_DIR, profile_name: str = 'whatsapp') -> Dict[str, Any]:
+    """
+    Otimiza um arquivo (ou reaproveita o cache). Roda em processo separado.
+
+    Returns:
+        Dict com ``path`` (arquivo a enviar), ``source``, tamanhos, ``kind``,
+        ``cached`` e ``skipped`` (motivo, quando o original é mantido)
+    """
+    profile = PROFILES[profile_name]
+    kind = media_kind(source)
+    original_size = os.path.getsize(source)
+    result = {'source': source, 'path': source, 'kind': kind, 'original_size': original_size,
+              'size': original_size, 'cached': False, 'skipped': None}
+
+    optimizer = OPTIMIZERS.get(kind)
+    if optimizer is None:
+        result['skipped'] = 'tipo sem otimização'
+        return result
+
+    sha256 = file_sha256(source)
+    result['sha256'] = sha256
+    target_base = os.path.join(cache_dir, f"{sha256}-{profile_name}")
+    cached = [name for name in (target_base + ext for ext in ('.jpg', '.png', '.mp4', '.ogg'))
+              if os.path.exists(name)]
+
+    if cached:
+        target = cached[0]
+        result['cached'] = True
+    else:
+        os.makedirs(cache_dir, exist_ok=True)
+        try:
+            target = optimizer(source, target_base, profile)
+        except Exception as e:
+            result['skipped'] = f"erro na otimização: {e}"
+            return result
+        if target is None:
+            result['skipped'] = 'Pillow não instalado' if kind == 'image' else 'ffmpeg não encontrado'
+            return result
+
+    size = os.path.getsize(target)
+    # Vídeo/áudio em formato diferente do alvo sempre usam a conversão; nos
+    # demais casos só vale a pena se o arquivo ficou menor
+    needs_format = os.path.splitext(source)[1].lower() != TARGET_EXTENSIONS.get(kind, os.path.splitext(source)[1].lower())
+    if size >= original_size and not needs_format:
+        result['skipped'] = 'original já é menor'
+        return result
+
+    result['path'] = target
+    result['size'] = size
+    return result
+
+
+class MediaOptimizer:
+    """
+    Estágio opcional antes da campanha (``media_optimization: true`` no
+    config.json): cada mídia distinta da sequência é otimizada uma única vez,
+    num pool de processos, e a sequência passa a apontar para o arquivo
+    derivado. Os derivados ficam em ``cache_dir`` com nome
+    ``<sha256 do original>-<perfil>``, então reenvios e outras campanhas
+    reaproveitam o resultado; o servidor registra os derivados no
+    ``MediaStore`` (``register``), cujo ``gc()`` os apaga quando nenhuma
+    campanha os referencia mais.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, profile: str = 'whatsapp',
+                 max_workers: Optional[int] = None):
+        if profile not in PROFILES:
+            raise ValueError(f"Perfil de otimização desconhecido: {profile}")
+        self.cache_dir = cache_dir
+        self.profile = profile
+        self.max_workers = max_workers
+
+    @classmethod
+    def from_config(cls, config: Dict[str, Any]) -> Optional['MediaOptimizer']:
+        """Otimizador configurado, ou None se a otimização estiver desligada"""
+        if not config.get('media_optimization', False):
+            return None
+        return cls(config.get('media_optimization_dir', DEFAULT_CACHE_DIR),
+                   config.get('media_optimization_profile', 'whatsapp'),
+                   config.get('media_optimization_workers'))
+
+    def optimize_sequence(self, sequence: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Otimiza as mídias da sequência
+
+        Returns:
+            Cópia da sequência com ``path`` trocado pelo arquivo otimizado e
+            ``original_path``/``optimization`` com o resultado de cada passo
+        """
+        sources = sorted({message['path'] for message in sequence
+                          if message.get('type') == 'media' and os.path.isfile(message.get('path', ''))})
+        if not sources:
+            return [dict(message) for message in sequence]
+
+        with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {source: pool.submit(optimize_file, source, self.cache_dir, self.profile)
+                       for source in sources}
+            results = {source: future.result() for source, future in futures.items()}
+
+        optimized = []
+        for message in sequence:
+            message = dict(message)
+            result = results.get(message.get('path')) if message.get('type') == 'media' else None
+            if result is not None:
+                message['original_path'] = result['source']
+                message['path'] = result['path']
+                message['optimization'] = {k: result[k] for k in ('original_size', 'size', 'cached', 'skipped')}
+                if result['skipped']:
+                    logger.info(f"🗜️ {os.path.basename(result['source'])}: mantido ({result['skipped']})")
+            optimized.append(message)
+        return optimized
+
+
+def optimization_summary(sequence: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Bytes por contato antes/depois da otimização"""
+    before = after = 0
+    for message in sequence:
+        info = message.get('optimization')
+        if info:
+            before += info['original_size']
+            after += info['size']
+    return {'original_bytes': before, 'optimized_bytes': after}
@@ -0,0 +1,336 @@
+"""
+WhatsApp API Sender - Media Store Module
+Armazenamento de mídias endereçado por conteúdo (sha256): deduplicação,
+índice de metadados em SQLite e limpeza por contagem de referências
+"""
+
+import os
+import json
+import time
+import shutil
+import sqlite3
+import hashlib
+import logging
+import mimetypes
+import subprocess
+import tempfile
+from contextlib import contextmanager
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional
+
+DEFAULT_MEDIA_ROOT = os.path.join('uploads', 'media')
+INDEX_FILENAME = 'media_index.db'
+CHUNK_SIZE = 1024 * 1024
+GC_GRACE_SECONDS = 24 * 3600  # Mídia recém-enviada ainda sem referência não é apagada antes disso
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mime_type TEXT,
+    width INTEGER,
+    height INTEGER,
+    duration REAL,
+    original_name TEXT,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS refs (
+    sha256 TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    PRIMARY KEY (sha256, owner)
+);
+CREATE INDEX IF NOT EXISTS refs_owner ON refs (owner);
+"""
+
+logger = logging.getLogger(__name__)
+
+
+def _probe_image(path: str) -> Dict[str, Any]:
+    try:
+        from PIL import Image  # dependência opcional: sem Pillow as dimensões ficam vazias
+        with Image.open(path) as image:
+            return {'width': image.width, 'height': image.height}
+    except Exception:
+        return {}
+
+
+def _probe_duration(path: str) -> Dict[str, Any]:
+    ffprobe = shutil.which('ffprobe')
+    if ffprobe is None:
+        return {}
+    try:
+        result = subprocess.run([ffprobe, '-v', 'error', '-print_format', 'json', '-show_format',
+                                 '-show_streams', path], capture_output=True, text=True, timeout=30)
+        info = json.loads(result.stdout or '{}')
+    except (subprocess.SubprocessError, ValueError):
+        return {}
+    meta: Dict[str, Any] = {}
+    duration = info.get('format', {}).get('duration')
+    if duration:
+        meta['duration'] = round(float(duration), 3)
+    for stream in info.get('streams', []):
+        if stream.get('codec_type') == 'video':
+            meta['width'], meta['height'] = stream.get('width'), stream.get('height')
+            break
+    return meta
+
+
+class MediaStore:
+    """
+    Mídias gravadas em ``<root>/<sha256[:2]>/<sha256><ext>``: o mesmo arquivo
+    enviado várias vezes ocupa espaço uma vez só.
+
+    O índice guarda tamanho, MIME, dimensões e duração (sem reler o arquivo)
+    e as referências de cada dono (``template:<arquivo>``, ``campaign:<id>``,
+    ``sequence:current``). ``gc()`` apaga as mídias sem referência depois de
+    ``GC_GRACE_SECONDS``.
+    """
+
+    def __init__(self, root: str = DEFAULT_MEDIA_ROOT):
+        self.logger = logging.getLogger(__name__)
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.index_path = os.path.join(root, INDEX_FILENAME)
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=10, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def blob_path(self, sha256: str, ext: str) -> str:
+        return os.path.join(self.root, sha256[:2], f"{sha256}{ext.lower()}")
+
+    def put_stream(self, stream: BinaryIO, filename: str) -> Dict[str, Any]:
+        """
+        Grava o conteúdo de ``stream`` calculando o sha256 durante a cópia
+
+        Args:
+            stream: Arquivo aberto para leitura binária (ex.: upload)
+            filename: Nome original, usado para extensão e MIME
+
+        Returns:
+            Metadados da mídia (``path``, ``sha256``, ``size``, ``mime_type``,
+            ``width``, ``height``, ``duration``) e ``deduplicated``
+        """
+        digest = hashlib.sha256()
+        size = 0
+        fd, temp_path = tempfile.mkstemp(dir=self.root, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+            sha256 = digest.hexdigest()
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        return self.adopt(temp_path, filename, sha256, size)
+
+    def adopt(self, temp_path: str, filename: str, sha256: str, size: int) -> Dict[str, Any]:
+        """
+        Move para o armazenamento um arquivo já gravado e com hash conhecido
+        (ex.: upload em partes concluído), sem copiar nem reler o conteúdo
+
+        Args:
+            temp_path: Arquivo a mover (no mesmo disco que ``root``)
+            filename: Nome original, usado para extensão e MIME
+            sha256: Hash do conteúdo
+            size: Tamanho em bytes
+
+        Returns:
+            Metadados da mídia, como em ``put_stream``
+        """
+        ext = os.path.splitext(filename)[1]
+        try:
+            existing = self.get(sha256)
+            if existing is not None and os.path.exists(existing['path']):
+                os.remove(temp_path)
+                # Reenvio conta como envio novo: o gc() espera a carência de novo antes de apagar
+                now = time.time()
+                with self._connect() as conn:
+                    conn.execute('UPDATE blobs SET created_at = ? WHERE sha256 = ?', (now, sha256))
+                return {**existing, 'created_at': now, 'deduplicated': True}
+
+            path = self.blob_path(sha256, ext)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(temp_path, path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        mime_type, _ = mimetypes.guess_type(filename)
+        meta: Dict[str, Any] = {}
+        if mime_type and mime_type.startswith('image/'):
+            meta = _probe_image(path)
+        elif mime_type and mime_type.split('/')[0] in ('video', 'audio'):
+            meta = _probe_duration(path)
+
+        record = {
+            'sha256': sha256,
+            'path': path.replace('\\', '/'),
+            'size': size,
+            'mime_type': mime_type,
+            'width': meta.get('width'),
+            'height': meta.get('height'),
+            'duration': meta.get('duration'),
+            'original_name': filename,
+            'created_at': time.time()
+        }
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO blobs (sha256, path, size, mime_type, width, height, duration, '
+                         'original_name, created_at) VALUES (:sha256, :path, :size, :mime_type, :width, '
+                         ':height, :duration, :original_name, :created_at)', record)
+        return {**record, 'deduplicated': False}
+
+    def register(self, path: str) -> Dict[str, Any]:
+        """
+        Indexa, sem mover, um arquivo gerado fora do armazenamento (ex.:
+        mídia otimizada no cache do ``MediaOptimizer``), para que ele tenha
+        referências e seja apagado pelo ``gc()`` quando ninguém mais usar
+
+        Returns:
+            Metadados da mídia; se o conteúdo já existia no armazenamento, o
+            registro existente (e o arquivo duplicado é removido)
+        """
+        digest = hashlib.sha256()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        sha256 = digest.hexdigest()
+        now = time.time()
+
+        existing = self.get(sha256)
+        if existing is not None and os.path.exists(existing['path']):
+            if os.path.abspath(existing['path']) != os.path.abspath(path):
+                os.remove(path)
+            with self._connect() as conn:
+                conn.execute('UPDATE blobs SET created_at = ? WHERE sha256 = ?', (now, sha256))
+            return {**existing, 'created_at': now, 'deduplicated': True}
+
+        filename = os.path.basename(path)
+        mime_type, _ = mimetypes.guess_type(filename)
+        meta: Dict[str, Any] = {}
+        if mime_type and mime_type.startswith('image/'):
+            meta = _probe_image(path)
+        elif mime_type and mime_type.split('/')[0] in ('video', 'audio'):
+            meta = _probe_duration(path)
+        record = {
+            'sha256': sha256,
+            'path': path.replace('\\', '/'),
+            'size': os.path.getsize(path),
+            'mime_type': mime_type,
+            'width': meta.get('width'),
+            'height': meta.get('height'),
+            'duration': meta.get('duration'),
+            'original_name': filename,
+            'created_at': now
+        }
+        with self._connect() as conn:
+            conn.execute('INSERT OR REPLACE INTO blobs (sha256, path, size, mime_type, width, height, duration, '
+                         'original_name, created_at) VALUES (:sha256, :path, :size, :mime_type, :width, '
+                         ':height, :duration, :original_name, :created_at)', record)
+        return {**record, 'deduplicated': False}
+
+    def put_file(self, path: str) -> Dict[str, Any]:
+        """Importa um arquivo existente para o armazenamento"""
+        with open(path, 'rb') as file:
+            return self.put_stream(file, os.path.basename(path))
+
+    def get(self, sha256: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM blobs WHERE sha256 = ?', (sha256,)).fetchone()
+        return dict(row) if row else None
+
+    def lookup(self, path: str) -> Optional[Dict[str, Any]]:
+        """Metadados pelo caminho da mídia, sem acessar o arquivo"""
+        with self._connect() as conn:
+            row = conn.execute('SELECT * FROM blobs WHERE path = ?', (path.replace('\\', '/'),)).fetchone()
+        return dict(row) if row else None
+
+    def _hashes_for(self, conn: sqlite3.Connection, paths: Iterable[str]) -> List[str]:
+        hashes = []
+        for path in paths:
+            row = conn.execute('SELECT sha256 FROM blobs WHERE path = ?', (path.replace('\\', '/'),)).fetchone()
+            if row:
+                hashes.append(row['sha256'])
+        return hashes
+
+    def set_refs(self, owner: str, paths: Iterable[str]) -> None:
+        """
+        Substitui as referências de ``owner`` pelas mídias em ``paths``
+        (caminhos fora do armazenamento são ignorados; lista vazia libera tudo)
+        """
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('DELETE FROM refs WHERE owner = ?', (owner,))
+                conn.executemany('INSERT OR IGNORE INTO refs (sha256, owner) VALUES (?, ?)',
+                                 [(sha256, owner) for sha256 in self._hashes_for(conn, paths)])
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def set_sequence_refs(self, owner: str, sequence: List[Dict[str, Any]]) -> None:
+        """Referências das mídias de uma sequência (inclui o original de mídias otimizadas)"""
+        paths = []
+        for message in sequence:
+            if message.get('type') == 'media':
+                paths.extend(p for p in (message.get('path'), message.get('original_path')) if p)
+        self.set_refs(owner, paths)
+
+    def ref_count(self, sha256: str) -> int:
+        with self._connect() as conn:
+            return conn.execute('SELECT COUNT(*) FROM refs WHERE sha256 = ?', (sha256,)).fetchone()[0]
+
+    def gc(self, grace_seconds: float = GC_GRACE_SECONDS) -> int:
+        """
+        Apaga mídias sem referência mais antigas que ``grace_seconds``
+
+        Returns:
+            Quantidade de arquivos removidos
+        """
+        cutoff = time.time() - grace_seconds
+        with self._connect() as conn:
+            rows = conn.execute(
+                'SELECT sha256, path FROM blobs WHERE created_at < ? '
+                'AND sha256 NOT IN (SELECT sha256 FROM refs)', (cutoff,)
+            ).fetchall()
+        removed = 0
+        for row in rows:
+            with self._connect() as conn:
+                conn.execute('BEGIN IMMEDIATE')
+                # Pode ter ganho uma referência (ou sido reenviada) desde a consulta acima
+                if conn.execute('SELECT 1 FROM refs WHERE sha256 = ?', (row['sha256'],)).fetchone() or \
+                        conn.execute('SELECT 1 FROM blobs WHERE sha256 = ? AND created_at >= ?',
+                                     (row['sha256'], cutoff)).fetchone():
+                    conn.execute('ROLLBACK')
+                    continue
+                conn.execute('DELETE FROM blobs WHERE sha256 = ?', (row['sha256'],))
+                conn.execute('COMMIT')
+            try:
+                os.remove(row['path'])
+                os.rmdir(os.path.dirname(row['path']))  # Só sai se o diretório ficou vazio
+            except OSError:
+                pass
+            removed += 1
+        if removed:
+            self.logger.info(f"🧹 {removed} mídia(s) sem referência removida(s)")
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._connect() as conn:
+            blobs, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs').fetchone()
+            unreferenced = conn.execute(
+                'SELECT COUNT(*) FROM blobs WHERE sha256 NOT IN (SELECT sha256 FROM refs)').fetchone()[0]
+        return {'blobs': blobs, 'bytes': size, 'unreferenced': unreferenced}
@@ -0,0 +1,238 @@
+"""
+WhatsApp API Sender - Monitor History Module
+Armazenamento compacto do histórico do monitor em um arquivo circular mapeado em memória
+"""
+
+import os
+import json
+import math
+import mmap
+import struct
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from async_storage import write_atomic
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_HISTORY_FILE = 'monitor_history.bin'
+DEFAULT_CAPACITY = 200_000  # ~3 MB; semanas de histórico para várias instâncias
+
+# Cabeçalho: magic, versão, tamanho do registro, capacidade, próxima posição, total gravado
+HEADER = struct.Struct('<4sHHQQQ')
+HEADER_SIZE = 64
+MAGIC = b'WMHS'
+VERSION = 1
+
+# Registro: timestamp (epoch), id da chave alvo/instância, flags, código do estado, latência (s)
+RECORD = struct.Struct('<dHBBf')
+
+FLAG_ONLINE = 0x01
+FLAG_SESSION_ACTIVE = 0x02
+FLAG_TOKEN_VALID = 0x04
+
+SESSION_STATES = ['UNKNOWN', 'WORKING', 'SCAN_QR_CODE', 'STARTING', 'FAILED', 'STOPPED']
+SESSION_STATE_CODES = {name: code for code, name in enumerate(SESSION_STATES)}
+
+
+class MonitorHistoryStore:
+    """
+    Histórico de status em registros binários de tamanho fixo, gravados num
+    arquivo circular via mmap. Quando a capacidade é atingida, os registros
+    mais antigos são sobrescritos.
+
+    Os nomes das chaves (alvo/instância) ficam num arquivo JSON ao lado.
+    """
+
+    def __init__(self, path: str = DEFAULT_HISTORY_FILE, capacity: int = DEFAULT_CAPACITY,
+                 readonly: bool = False):
+        self.path = path
+        self.keys_path = f"{path}.keys.json"
+        self.readonly = readonly
+        self._keys = self._load_keys()
+
+        if not os.path.exists(path):
+            if readonly:
+                raise FileNotFoundError(f"Histórico do monitor não encontrado: {path}")
+            self._create(path, capacity)
+        elif not readonly and os.path.getsize(path) == 0:
+            self._create(path, capacity)  # Criação interrompida antes do cabeçalho
+
+        self._file = open(path, 'rb' if readonly else 'r+b')
+        size = os.fstat(self._file.fileno()).st_size
+        if size < HEADER_SIZE:
+            self._file.close()
+            raise ValueError(f"Arquivo de histórico vazio ou truncado: {path}")
+        access = mmap.ACCESS_READ if readonly else mmap.ACCESS_WRITE
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=access)
+
+        magic, version, record_size, self.capacity, _, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            self.close()
+            raise ValueError(f"Arquivo de histórico inválido ou de outra versão: {path}")
+        if size < HEADER_SIZE + self.capacity * RECORD.size:
+            self.close()
+            raise ValueError(f"Arquivo de histórico vazio ou truncado: {path}")
+        if self.capacity != capacity and not readonly:
+            logger.warning(f"Histórico {path} já existe com capacidade {self.capacity}; "
+                           f"ignorando capacidade configurada {capacity}")
+
+    @staticmethod
+    def _create(path: str, capacity: int) -> None:
+        with open(path, 'wb') as f:
+            f.truncate(HEADER_SIZE + capacity * RECORD.size)
+            f.write(HEADER.pack(MAGIC, VERSION, RECORD.size, capacity, 0, 0))
+
+    def _load_keys(self) -> Dict[str, int]:
+        try:
+            with open(self.keys_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _key_id(self, key: str) -> int:
+        if key not in self._keys:
+            self._keys[key] = len(self._keys)
+            text = json.dumps(self._keys, ensure_ascii=False)
+
+            def write(temp_path: str) -> None:
+                with open(temp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+
+            # Temporário + rename: um leitor nunca vê o JSON pela metade
+            write_atomic(self.keys_path, write)
+        return self._keys[key]
+
+    def _header(self) -> Tuple[int, int]:
+        """Retorna (próxima posição lógica, quantidade de registros válidos)"""
+        _, _, _, _, head, count = HEADER.unpack_from(self._mm, 0)
+        return head, min(count, self.capacity)
+
+    def _offset(self, head: int, count: int, index: int) -> int:
+        """Offset do registro lógico ``index`` (0 = mais antigo)"""
+        physical = (head - count + index) % self.capacity
+        return HEADER_SIZE + physical * RECORD.size
+
+    def append(self, timestamp: float, key: str, online: bool, session_active: bool,
+               token_valid: bool, session_state: str, response_time: Optional[float]) -> None:
+        """Grava um registro; os timestamps devem ser crescentes"""
+        flags = ((FLAG_ONLINE if online else 0) |
+                 (FLAG_SESSION_ACTIVE if session_active else 0) |
+                 (FLAG_TOKEN_VALID if token_valid else 0))
+        state = SESSION_STATE_CODES.get(session_state, 0)
+        latency = math.nan if response_time is None else float(response_time)
+
+        _, _, _, _, head, count = HEADER.unpack_from(self._mm, 0)
+        offset = HEADER_SIZE + (head % self.capacity) * RECORD.size
+        RECORD.pack_into(self._mm, offset, timestamp, self._key_id(key), flags, state, latency)
+        HEADER.pack_into(self._mm, 0, MAGIC, VERSION, RECORD.size, self.capacity,
+                         head + 1, min(count + 1, self.capacity))
+
+    def append_status(self, status: Dict, timestamp: float) -> None:
+        """Grava um status no formato produzido pelo MonitorWAHA"""
+        self.append(timestamp, status.get('chave', 'principal'), status['waha_online'],
+                    status['sessao_ativa'], status['token_valido'], status['status_sessao'],
+                    status['tempo_resposta'])
+
+    def _bisect(self, head: int, count: int, timestamp: float) -> int:
+        """Primeiro índice lógico com timestamp >= ``timestamp``"""
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if struct.unpack_from('<d', self._mm, self._offset(head, count, mid))[0] < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _iter_range(self, start: Optional[float], end: Optional[float]):
+        head, count = self._header()
+        first = 0 if start is None else self._bisect(head, count, start)
+        last = count if end is None else self._bisect(head, count, end)
+        for index in range(first, last):
+            yield RECORD.unpack_from(self._mm, self._offset(head, count, index))
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              key: Optional[str] = None) -> List[Dict]:
+        """Registros em [start, end), opcionalmente filtrados por chave"""
+        key_ids = self._load_keys()
+        names = {v: k for k, v in key_ids.items()}
+        key_id = key_ids.get(key) if key else None
+        if key and key_id is None:
+            return []
+
+        records = []
+        for timestamp, kid, flags, state, latency in self._iter_range(start, end):
+            if key_id is not None and kid != key_id:
+                continue
+            records.append({
+                'timestamp': timestamp,
+                'chave': names.get(kid, str(kid)),
+                'online': bool(flags & FLAG_ONLINE),
+                'sessao_ativa': bool(flags & FLAG_SESSION_ACTIVE),
+                'token_valido': bool(flags & FLAG_TOKEN_VALID),
+                'status_sessao': SESSION_STATES[state] if state < len(SESSION_STATES) else 'UNKNOWN',
+                'tempo_resposta': None if math.isnan(latency) else round(latency, 3)
+            })
+        return records
+
+    def downsample(self, bucket_seconds: float, start: Optional[float] = None,
+                   end: Optional[float] = None, key: Optional[str] = None) -> List[Dict]:
+        """
+        Agrega os registros em janelas de ``bucket_seconds`` para gráficos
+
+        Returns:
+            Lista de buckets com disponibilidade e latência média/máxima
+        """
+        key_id = self._load_keys().get(key) if key else None
+        if key and key_id is None:
+            return []
+
+        buckets = {}
+        for timestamp, kid, flags, _, latency in self._iter_range(start, end):
+            if key_id is not None and kid != key_id:
+                continue
+            bucket_start = timestamp - (timestamp % bucket_seconds)
+            bucket = buckets.get(bucket_start)
+            if bucket is None:
+                bucket = buckets[bucket_start] = [0, 0, 0.0, 0, 0.0]
+            bucket[0] += 1
+            if flags & FLAG_ONLINE and flags & FLAG_SESSION_ACTIVE:
+                bucket[1] += 1
+            if not math.isnan(latency):
+                bucket[2] += latency
+                bucket[3] += 1
+                bucket[4] = max(bucket[4], latency)
+
+        return [{
+            'inicio': bucket_start,
+            'amostras': samples,
+            'disponibilidade_percent': round(healthy / samples * 100, 2),
+            'latencia_media': round(latency_sum / latency_count, 3) if latency_count else None,
+            'latencia_maxima': round(latency_max, 3) if latency_count else None
+        } for bucket_start, (samples, healthy, latency_sum, latency_count, latency_max)
+            in sorted(buckets.items())]
+
+    def keys(self) -> List[str]:
+        return list(self._load_keys())
+
+    def time_span(self) -> Tuple[Optional[float], Optional[float]]:
+        """Timestamps do registro mais antigo e do mais recente"""
+        head, count = self._header()
+        if not count:
+            return None, None
+        first = RECORD.unpack_from(self._mm, self._offset(head, count, 0))[0]
+        last = RECORD.unpack_from(self._mm, self._offset(head, count, count - 1))[0]
+        return first, last
+
+    def flush(self) -> None:
+        if not self.readonly:
+            self._mm.flush()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+            self._mm.close()
+        except (ValueError, AttributeError):
+            pass
+        self._file.close()
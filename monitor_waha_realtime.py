@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 """
 Monitor em Tempo Real do WAHA
-Monitora continuamente o status do WAHA e detecta problemas automaticamente
+Monitora continuamente o status do WAHA (e da Evolution API) e detecta problemas automaticamente
 """
 
 import os
@@ -9,12 +9,76 @@ import sys
 import json
 import time
 import signal
-import requests
+import asyncio
 import threading
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 from collections import deque
 
+import aiohttp
+
+from monitor_history import MonitorHistoryStore, DEFAULT_HISTORY_FILE, DEFAULT_CAPACITY
+
+PROVIDER_WAHA = 'waha'
+PROVIDER_EVOLUTION = 'evolution-api'
+
+# Limites (em segundos) dos buckets do histograma de latência
+LATENCIA_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Estados da Evolution API traduzidos para o vocabulário de sessão do WAHA
+ESTADOS_EVOLUTION = {
+    'open': 'WORKING',
+    'connecting': 'STARTING',
+    'close': 'STOPPED'
+}
+
+
+class HistogramaLatencia:
+    """Histograma cumulativo de latências com buckets fixos"""
+
+    def __init__(self, limites=LATENCIA_BUCKETS):
+        self.limites = tuple(limites)
+        self.contagens = [0] * (len(self.limites) + 1)  # último bucket = +Inf
+        self.total = 0
+        self.soma = 0.0
+        self.maximo = 0.0
+
+    def registrar(self, segundos: float) -> None:
+        for idx, limite in enumerate(self.limites):
+            if segundos <= limite:
+                break
+        else:
+            idx = len(self.limites)
+        self.contagens[idx] += 1
+        self.total += 1
+        self.soma += segundos
+        self.maximo = max(self.maximo, segundos)
+
+    def percentil(self, p: float) -> Optional[float]:
+        """Limite superior do bucket que contém o percentil p (0-100)"""
+        if not self.total:
+            return None
+        alvo = self.total * p / 100
+        acumulado = 0
+        for idx, contagem in enumerate(self.contagens):
+            acumulado += contagem
+            if acumulado >= alvo:
+                return self.limites[idx] if idx < len(self.limites) else self.maximo
+        return self.maximo
+
+    def to_dict(self) -> Dict:
+        buckets = {f"<={limite}s": c for limite, c in zip(self.limites, self.contagens)}
+        buckets['+Inf'] = self.contagens[-1]
+        return {
+            'total': self.total,
+            'media': round(self.soma / self.total, 4) if self.total else None,
+            'p50': self.percentil(50),
+            'p95': self.percentil(95),
+            'maximo': round(self.maximo, 4),
+            'buckets': buckets
+        }
+
+
 class MonitorWAHA:
     def __init__(self, config_path: str = "config.json"):
         self.config = self._carregar_config(config_path)
@@ -22,20 +86,38 @@ class MonitorWAHA:
         self.token = self.config.get('token', '')
         self.instance_id = self.config.get('instance_id', 'default')
         self.headers = {'X-API-KEY': self.token}
-        
+        self.alvos = self._montar_alvos()
+
         # Configurações de monitoramento
-        self.intervalo_verificacao = 30  # segundos
+        self.intervalo_verificacao = 30  # segundos (intervalo inicial de cada alvo)
+        self.intervalo_minimo = 5  # após uma falha
+        self.intervalo_maximo = 120  # teto do backoff enquanto saudável
+        self.fator_backoff = 1.5
         self.timeout_request = 10  # segundos
+        self.max_conexoes = 20  # pool de conexões compartilhado
         self.max_tentativas_reconexao = 3
         self.historico_status = deque(maxlen=100)  # Últimos 100 status
-        
+        self.historico_por_chave = {}  # Últimos status de cada alvo/instância
+        self.histogramas = {}  # "alvo endpoint" -> HistogramaLatencia
+
+        # Histórico persistente (arquivo circular com capacidade fixa)
+        self.historico = MonitorHistoryStore(
+            self.config.get('monitor_historico_arquivo', DEFAULT_HISTORY_FILE),
+            capacity=int(self.config.get('monitor_historico_capacidade', DEFAULT_CAPACITY))
+        )
+
         # Estado do monitor
         self.rodando = False
         self.thread_monitor = None
         self.ultimo_status = None
+        self.ultimos_status = {}
+        self.ultimo_ciclo_segundos = None
         self.problemas_detectados = []
         self.alertas_enviados = set()
-        
+        self._loop = None
+        self._evento_parar = None
+        self._correcoes = {}  # alvo -> task de correção automática em andamento
+
         # Métricas
         self.metricas = {
             'uptime_inicio': None,
@@ -44,13 +126,14 @@ class MonitorWAHA:
             'verificacoes_falha': 0,
             'tempo_inatividade_total': 0,
             'ultima_inatividade_inicio': None,
-            'reconexoes_automaticas': 0
+            'reconexoes_automaticas': 0,
+            'ciclos': 0
         }
-        
+
         # Configurar handler para interrupção
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
-    
+
     def _carregar_config(self, config_path: str) -> Dict:
         """Carrega configurações do arquivo JSON"""
         try:
@@ -62,13 +145,49 @@ class MonitorWAHA:
         except json.JSONDecodeError:
             print(f"❌ Erro ao decodificar JSON: {config_path}")
             return {}
-    
+
+    def _montar_alvos(self) -> List[Dict]:
+        """
+        Monta a lista de gateways monitorados.
+
+        Usa ``monitor_alvos`` do config.json quando existir, por exemplo:
+            [{"nome": "waha-1", "provider": "waha", "base_url": "...",
+              "token": "...", "instancias": ["default", "vendas"]}]
+        Caso contrário, monitora apenas o gateway principal do config.
+        """
+        alvos_config = self.config.get('monitor_alvos') or [{
+            'nome': 'principal',
+            'provider': self.config.get('provider', PROVIDER_WAHA),
+            'base_url': self.base_url,
+            'token': self.token,
+            'instancias': [self.instance_id]
+        }]
+
+        alvos = []
+        for idx, alvo in enumerate(alvos_config):
+            provider = str(alvo.get('provider', PROVIDER_WAHA)).lower()
+            if provider != PROVIDER_EVOLUTION:
+                provider = PROVIDER_WAHA
+            token = alvo.get('token', '')
+            headers = {'apikey': token} if provider == PROVIDER_EVOLUTION else {'X-API-KEY': token}
+            instancias = alvo.get('instancias') or [alvo.get('instance_id', 'default')]
+            alvos.append({
+                'nome': alvo.get('nome', f"alvo{idx + 1}"),
+                'provider': provider,
+                'base_url': alvo.get('base_url', 'http://localhost:3000').rstrip('/'),
+                'headers': headers,
+                'instancias': list(instancias),
+                'intervalo': None,
+                'proximo_em': 0.0
+            })
+        return alvos
+
     def _signal_handler(self, signum, frame):
         """Handler para sinais de interrupção"""
         print(f"\n🛑 Recebido sinal {signum}. Parando monitor...")
         self.parar_monitor()
         sys.exit(0)
-    
+
     def _log_com_timestamp(self, mensagem: str, nivel: str = "INFO") -> None:
         """Log com timestamp"""
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -79,20 +198,23 @@ class MonitorWAHA:
             "ERROR": "❌",
             "DEBUG": "🔍"
         }.get(nivel, "📝")
-        
+
         print(f"[{timestamp}] {simbolo} {mensagem}")
-        
+
         # Salvar em arquivo de log
         try:
             with open("monitor_waha.log", "a", encoding="utf-8") as f:
                 f.write(f"[{timestamp}] [{nivel}] {mensagem}\n")
         except Exception:
             pass  # Ignorar erros de log
-    
-    def verificar_status_waha(self) -> Dict:
-        """Verifica o status atual do WAHA"""
-        status = {
+
+    def _novo_status(self, alvo: Dict, instancia: str) -> Dict:
+        return {
             'timestamp': datetime.now().isoformat(),
+            'alvo': alvo['nome'],
+            'provider': alvo['provider'],
+            'instancia': instancia,
+            'chave': f"{alvo['nome']}/{instancia}",
             'waha_online': False,
             'sessao_ativa': False,
             'token_valido': False,
@@ -101,265 +223,507 @@ class MonitorWAHA:
             'problemas': [],
             'detalhes': {}
         }
-        
-        inicio_verificacao = time.time()
-        
+
+    def _histograma(self, alvo: Dict, endpoint: str) -> HistogramaLatencia:
+        chave = f"{alvo['nome']} {endpoint}"
+        if chave not in self.histogramas:
+            self.histogramas[chave] = HistogramaLatencia()
+        return self.histogramas[chave]
+
+    async def _requisicao(self, sessao: aiohttp.ClientSession, alvo: Dict, endpoint: str,
+                          caminho: str, metodo: str = 'GET', payload: Optional[Dict] = None):
+        """Executa uma requisição registrando a latência; retorna (status, json, latência)"""
+        inicio = time.perf_counter()
         try:
-            # 1. Verificar se WAHA está online
-            response = requests.get(f"{self.base_url}/api/health", 
-                                  timeout=self.timeout_request)
-            
-            tempo_resposta = time.time() - inicio_verificacao
-            status['tempo_resposta'] = round(tempo_resposta, 3)
-            
-            if response.status_code == 200:
-                status['waha_online'] = True
-                
-                # 2. Verificar token
+            async with sessao.request(metodo, f"{alvo['base_url']}{caminho}",
+                                      headers=alvo['headers'], json=payload) as response:
                 try:
-                    sessions_response = requests.get(f"{self.base_url}/api/sessions", 
-                                                    headers=self.headers, 
-                                                    timeout=self.timeout_request)
-                    if sessions_response.status_code == 200:
-                        status['token_valido'] = True
-                        
-                        # 3. Verificar sessão específica
-                        session_response = requests.get(
-                            f"{self.base_url}/api/sessions/{self.instance_id}", 
-                            headers=self.headers, 
-                            timeout=self.timeout_request
-                        )
-                        
-                        if session_response.status_code == 200:
-                            session_data = session_response.json()
-                            status['status_sessao'] = session_data.get('status', 'UNKNOWN')
-                            status['detalhes']['sessao'] = session_data
-                            
-                            if status['status_sessao'] == 'WORKING':
-                                status['sessao_ativa'] = True
-                            elif status['status_sessao'] == 'SCAN_QR_CODE':
-                                status['problemas'].append('Sessão aguardando QR Code')
-                            elif status['status_sessao'] == 'FAILED':
-                                status['problemas'].append('Sessão falhou')
-                        else:
-                            status['problemas'].append(f'Erro ao verificar sessão: {session_response.status_code}')
-                    
-                    elif sessions_response.status_code == 401:
-                        status['problemas'].append('Token de API inválido')
-                    else:
-                        status['problemas'].append(f'Erro de autenticação: {sessions_response.status_code}')
-                        
-                except Exception as e:
-                    status['problemas'].append(f'Erro ao verificar token/sessão: {str(e)}')
+                    dados = await response.json(content_type=None)
+                except (json.JSONDecodeError, aiohttp.ContentTypeError, ValueError):
+                    dados = None
+                return response.status, dados, time.perf_counter() - inicio
+        finally:
+            self._histograma(alvo, endpoint).registrar(time.perf_counter() - inicio)
+
+    def _problema_conexao(self, erro: BaseException, nome_gateway: str) -> str:
+        if isinstance(erro, asyncio.TimeoutError):
+            return f'Timeout ao conectar com {nome_gateway}'
+        if isinstance(erro, aiohttp.ClientConnectionError):
+            return f'{nome_gateway} não está acessível'
+        return f'Erro inesperado: {str(erro)}'
+
+    async def _sondar_waha(self, sessao: aiohttp.ClientSession, alvo: Dict) -> List[Dict]:
+        """Sonda um gateway WAHA: health e sessões em paralelo"""
+        health, sessions = await asyncio.gather(
+            self._requisicao(sessao, alvo, 'health', '/api/health'),
+            self._requisicao(sessao, alvo, 'sessions', '/api/sessions'),
+            return_exceptions=True
+        )
+
+        statuses = [self._novo_status(alvo, instancia) for instancia in alvo['instancias']]
+
+        if isinstance(health, BaseException):
+            problema = self._problema_conexao(health, 'WAHA')
+            for status in statuses:
+                status['problemas'].append(problema)
+            return statuses
+
+        health_code, _, latencia = health
+        for status in statuses:
+            status['tempo_resposta'] = round(latencia, 3)
+            if health_code == 200:
+                status['waha_online'] = True
             else:
-                status['problemas'].append(f'WAHA respondeu com status {response.status_code}')
-                
-        except requests.exceptions.ConnectionError:
-            status['problemas'].append('WAHA não está acessível')
-        except requests.exceptions.Timeout:
-            status['problemas'].append('Timeout ao conectar com WAHA')
-        except Exception as e:
-            status['problemas'].append(f'Erro inesperado: {str(e)}')
-        
-        return status
-    
+                status['problemas'].append(f'WAHA respondeu com status {health_code}')
+        if health_code != 200:
+            return statuses
+
+        if isinstance(sessions, BaseException):
+            for status in statuses:
+                status['problemas'].append(f'Erro ao verificar token/sessão: {str(sessions)}')
+            return statuses
+
+        sessions_code, sessions_data, _ = sessions
+        if sessions_code == 401:
+            for status in statuses:
+                status['problemas'].append('Token de API inválido')
+            return statuses
+        if sessions_code != 200:
+            for status in statuses:
+                status['problemas'].append(f'Erro de autenticação: {sessions_code}')
+            return statuses
+
+        por_nome = {s.get('name'): s for s in (sessions_data or []) if isinstance(s, dict)}
+
+        # Sessões que não vieram na listagem são consultadas individualmente, em paralelo
+        faltantes = [s for s in statuses if s['instancia'] not in por_nome]
+        detalhes = await asyncio.gather(
+            *(self._requisicao(sessao, alvo, 'session', f"/api/sessions/{s['instancia']}")
+              for s in faltantes),
+            return_exceptions=True
+        )
+        for status, detalhe in zip(faltantes, detalhes):
+            if isinstance(detalhe, BaseException):
+                status['problemas'].append(f'Erro ao verificar token/sessão: {str(detalhe)}')
+            elif detalhe[0] == 200 and isinstance(detalhe[1], dict):
+                por_nome[status['instancia']] = detalhe[1]
+            else:
+                status['problemas'].append(f'Erro ao verificar sessão: {detalhe[0]}')
+
+        for status in statuses:
+            status['token_valido'] = True
+            session_data = por_nome.get(status['instancia'])
+            if session_data is None:
+                continue
+            status['status_sessao'] = session_data.get('status', 'UNKNOWN')
+            status['detalhes']['sessao'] = session_data
+
+            if status['status_sessao'] == 'WORKING':
+                status['sessao_ativa'] = True
+            elif status['status_sessao'] == 'SCAN_QR_CODE':
+                status['problemas'].append('Sessão aguardando QR Code')
+            elif status['status_sessao'] == 'FAILED':
+                status['problemas'].append('Sessão falhou')
+
+        return statuses
+
+    async def _sondar_evolution(self, sessao: aiohttp.ClientSession, alvo: Dict) -> List[Dict]:
+        """Sonda uma Evolution API: raiz e estado de cada instância em paralelo"""
+        respostas = await asyncio.gather(
+            self._requisicao(sessao, alvo, 'health', '/'),
+            *(self._requisicao(sessao, alvo, 'connectionState', f"/instance/connectionState/{instancia}")
+              for instancia in alvo['instancias']),
+            return_exceptions=True
+        )
+        health, estados = respostas[0], respostas[1:]
+
+        statuses = []
+        for instancia, estado in zip(alvo['instancias'], estados):
+            status = self._novo_status(alvo, instancia)
+            statuses.append(status)
+
+            if isinstance(health, BaseException):
+                status['problemas'].append(self._problema_conexao(health, 'Evolution API'))
+                continue
+            health_code, _, latencia = health
+            status['tempo_resposta'] = round(latencia, 3)
+            if health_code != 200:
+                status['problemas'].append(f'Evolution API respondeu com status {health_code}')
+                continue
+            status['waha_online'] = True
+
+            if isinstance(estado, BaseException):
+                status['problemas'].append(f'Erro ao verificar token/sessão: {str(estado)}')
+                continue
+            codigo, dados, _ = estado
+            if codigo == 401:
+                status['problemas'].append('Token de API inválido')
+                continue
+            if codigo != 200 or not isinstance(dados, dict):
+                status['problemas'].append(f'Erro ao verificar sessão: {codigo}')
+                continue
+
+            status['token_valido'] = True
+            estado_bruto = dados.get('instance', {}).get('state', 'unknown')
+            status['status_sessao'] = ESTADOS_EVOLUTION.get(estado_bruto, estado_bruto.upper())
+            status['detalhes']['sessao'] = dados
+            if status['status_sessao'] == 'WORKING':
+                status['sessao_ativa'] = True
+            elif status['status_sessao'] == 'STOPPED':
+                status['problemas'].append('Sessão falhou')
+
+        return statuses
+
+    async def _sondar_alvo(self, sessao: aiohttp.ClientSession, alvo: Dict) -> List[Dict]:
+        if alvo['provider'] == PROVIDER_EVOLUTION:
+            return await self._sondar_evolution(sessao, alvo)
+        return await self._sondar_waha(sessao, alvo)
+
+    def _nova_sessao_http(self) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_conexoes),
+            timeout=aiohttp.ClientTimeout(total=self.timeout_request)
+        )
+
+    async def _verificar_todos_async(self) -> List[Dict]:
+        async with self._nova_sessao_http() as sessao:
+            resultados = await asyncio.gather(*(self._sondar_alvo(sessao, alvo) for alvo in self.alvos))
+        return [status for statuses in resultados for status in statuses]
+
+    def verificar_todos(self) -> List[Dict]:
+        """Verifica uma vez, em paralelo, todos os alvos e instâncias configurados"""
+        return asyncio.run(self._verificar_todos_async())
+
+    def verificar_status_waha(self) -> Dict:
+        """Verifica o status atual do WAHA (primeira instância configurada)"""
+        return self.verificar_todos()[0]
+
     def detectar_problemas(self, status_atual: Dict) -> List[str]:
         """Detecta problemas baseado no status atual e histórico"""
         problemas = []
-        
+
         # Problemas diretos do status
         problemas.extend(status_atual['problemas'])
-        
+
         # Análise de tempo de resposta
         if status_atual['tempo_resposta'] and status_atual['tempo_resposta'] > 5:
             problemas.append(f"Tempo de resposta alto: {status_atual['tempo_resposta']}s")
-        
+
         # Análise de histórico
-        if len(self.historico_status) >= 3:
-            ultimos_3 = list(self.historico_status)[-3:]
-            
+        historico = self.historico_por_chave.get(status_atual.get('chave'), self.historico_status)
+        if len(historico) >= 3:
+            ultimos_3 = list(historico)[-3:]
+
             # Verificar instabilidade
             status_diferentes = len(set(s['status_sessao'] for s in ultimos_3))
             if status_diferentes > 1:
                 problemas.append("Instabilidade detectada na sessão")
-            
+
             # Verificar falhas consecutivas
             falhas_consecutivas = sum(1 for s in ultimos_3 if not s['waha_online'])
             if falhas_consecutivas >= 2:
                 problemas.append(f"Falhas consecutivas detectadas: {falhas_consecutivas}")
-        
+
         return problemas
-    
-    def tentar_correcao_automatica(self, problemas: List[str]) -> List[str]:
+
+    async def tentar_correcao_automatica(self, sessao: aiohttp.ClientSession, status: Dict,
+                                         problemas: List[str]) -> List[str]:
         """Tenta corrigir problemas automaticamente"""
         correcoes_aplicadas = []
-        
+        alvo = next(a for a in self.alvos if a['nome'] == status['alvo'])
+
         for problema in problemas:
             if "Sessão falhou" in problema:
-                self._log_com_timestamp("Tentando reiniciar sessão automaticamente...", "WARNING")
-                if self._reiniciar_sessao():
-                    correcoes_aplicadas.append("Sessão reiniciada com sucesso")
+                self._log_com_timestamp(f"[{status['chave']}] Tentando reiniciar sessão automaticamente...", "WARNING")
+                if await self._reiniciar_sessao(sessao, alvo, status['instancia']):
+                    correcoes_aplicadas.append(f"[{status['chave']}] Sessão reiniciada com sucesso")
                     self.metricas['reconexoes_automaticas'] += 1
                 else:
-                    self._log_com_timestamp("Falha ao reiniciar sessão automaticamente", "ERROR")
-            
-            elif "WAHA não está acessível" in problema:
-                self._log_com_timestamp("Tentando reconectar ao WAHA...", "WARNING")
-                time.sleep(5)  # Aguardar antes de tentar novamente
-        
+                    self._log_com_timestamp(f"[{status['chave']}] Falha ao reiniciar sessão automaticamente", "ERROR")
+
+            elif "não está acessível" in problema:
+                # O intervalo adaptativo já encurta a próxima verificação deste alvo
+                self._log_com_timestamp(f"[{status['chave']}] Tentando reconectar...", "WARNING")
+
         return correcoes_aplicadas
-    
-    def _reiniciar_sessao(self) -> bool:
-        """Reinicia a sessão WAHA"""
+
+    async def _reiniciar_sessao(self, sessao: aiohttp.ClientSession, alvo: Dict, instancia: str) -> bool:
+        """Reinicia a sessão WAHA (ou a instância da Evolution API)"""
         try:
+            if alvo['provider'] == PROVIDER_EVOLUTION:
+                codigo, _, _ = await self._requisicao(
+                    sessao, alvo, 'restart', f"/instance/restart/{instancia}", metodo='POST'
+                )
+                return codigo in (200, 201)
+
             # Parar sessão atual
-            stop_url = f"{self.base_url}/api/sessions/{self.instance_id}/stop"
-            requests.post(stop_url, headers=self.headers, timeout=self.timeout_request)
-            
-            time.sleep(3)  # Aguardar parada completa
-            
+            await self._requisicao(sessao, alvo, 'stop', f"/api/sessions/{instancia}/stop", metodo='POST')
+
+            await asyncio.sleep(3)  # Aguardar parada completa
+
             # Iniciar nova sessão
-            start_url = f"{self.base_url}/api/sessions/start"
             payload = {
-                "name": self.instance_id,
+                "name": instancia,
                 "config": {
                     "proxy": None,
                     "webhooks": []
                 }
             }
-            response = requests.post(start_url, json=payload, 
-                                   headers=self.headers, timeout=30)
-            return response.status_code == 201
+            codigo, _, _ = await self._requisicao(
+                sessao, alvo, 'start', "/api/sessions/start", metodo='POST', payload=payload
+            )
+            return codigo == 201
         except Exception as e:
             self._log_com_timestamp(f"Erro ao reiniciar sessão: {e}", "ERROR")
             return False
-    
-    def _loop_monitoramento(self) -> None:
-        """Loop principal de monitoramento"""
+
+    def _ajustar_intervalo(self, alvo: Dict, saudavel: bool) -> None:
+        """Backoff enquanto saudável, intervalo mínimo logo após uma falha"""
+        atual = alvo['intervalo'] or self.intervalo_verificacao
+        if saudavel:
+            alvo['intervalo'] = min(atual * self.fator_backoff, self.intervalo_maximo)
+        else:
+            alvo['intervalo'] = self.intervalo_minimo
+        alvo['proximo_em'] = time.monotonic() + alvo['intervalo']
+
+    def _processar_status(self, sessao: aiohttp.ClientSession, status: Dict) -> None:
+        """Atualiza histórico, métricas e alertas a partir de um status"""
+        self.historico_status.append(status)
+        self.historico_por_chave.setdefault(status['chave'], deque(maxlen=10)).append(status)
+        self.ultimos_status[status['chave']] = status
+        self.ultimo_status = status
+        self.historico.append_status(status, time.time())
+
+        # Atualizar métricas
+        self.metricas['total_verificacoes'] += 1
+
+        if status['waha_online'] and status['sessao_ativa']:
+            self.metricas['verificacoes_sucesso'] += 1
+        else:
+            self.metricas['verificacoes_falha'] += 1
+
+        # Detectar problemas
+        problemas = [f"[{status['chave']}] {p}" for p in self.detectar_problemas(status)]
+        prefixo = f"[{status['chave']}] "
+
+        if problemas:
+            # Log apenas novos problemas
+            novos_problemas = [p for p in problemas if p not in self.alertas_enviados]
+
+            for problema in novos_problemas:
+                self._log_com_timestamp(f"Problema detectado: {problema}", "WARNING")
+                self.alertas_enviados.add(problema)
+
+            # Tentar correção automática
+            if novos_problemas:
+                self._agendar_correcao(sessao, status, novos_problemas)
+        else:
+            # Limpar alertas deste alvo se não há problemas
+            resolvidos = {p for p in self.alertas_enviados if p.startswith(prefixo)}
+            if resolvidos:
+                self._log_com_timestamp(f"{prefixo}Todos os problemas foram resolvidos", "SUCCESS")
+                self.alertas_enviados -= resolvidos
+
+    def _agendar_correcao(self, sessao: aiohttp.ClientSession, status: Dict, problemas: List[str]) -> None:
+        """
+        Correção automática em task própria, no máximo uma por alvo: reiniciar
+        uma sessão leva segundos e não pode atrasar a sondagem dos outros alvos
+        """
+        nome = status['alvo']
+        tarefa = self._correcoes.get(nome)
+        if tarefa is not None and not tarefa.done():
+            self._log_com_timestamp(f"[{status['chave']}] Correção automática já em andamento", "INFO")
+            return
+        self._correcoes[nome] = asyncio.get_running_loop().create_task(
+            self._corrigir(sessao, status, problemas)
+        )
+
+    async def _corrigir(self, sessao: aiohttp.ClientSession, status: Dict, problemas: List[str]) -> None:
+        try:
+            correcoes = await self.tentar_correcao_automatica(sessao, status, problemas)
+        except Exception as e:
+            self._log_com_timestamp(f"[{status['chave']}] Erro na correção automática: {e}", "ERROR")
+            return
+        for correcao in correcoes:
+            self._log_com_timestamp(f"Correção aplicada: {correcao}", "SUCCESS")
+
+    async def _cancelar_correcoes(self) -> None:
+        """Cancela as correções em andamento antes de fechar a sessão HTTP que elas usam"""
+        pendentes = [t for t in self._correcoes.values() if not t.done()]
+        for tarefa in pendentes:
+            tarefa.cancel()
+        await asyncio.gather(*pendentes, return_exceptions=True)
+        self._correcoes.clear()
+
+    def _atualizar_inatividade(self) -> None:
+        """O sistema está inativo enquanto qualquer instância monitorada estiver fora"""
+        todos_ok = all(s['waha_online'] and s['sessao_ativa'] for s in self.ultimos_status.values())
+
+        if todos_ok:
+            # Se estava inativo, calcular tempo de inatividade
+            if self.metricas['ultima_inatividade_inicio']:
+                tempo_inativo = datetime.now() - self.metricas['ultima_inatividade_inicio']
+                self.metricas['tempo_inatividade_total'] += tempo_inativo.total_seconds()
+                self.metricas['ultima_inatividade_inicio'] = None
+
+                self._log_com_timestamp(
+                    f"Sistema voltou ao normal após {tempo_inativo.total_seconds():.1f}s de inatividade",
+                    "SUCCESS"
+                )
+        elif not self.metricas['ultima_inatividade_inicio']:
+            # Marcar início de inatividade
+            self.metricas['ultima_inatividade_inicio'] = datetime.now()
+
+    async def _aguardar(self, segundos: float) -> None:
+        """Espera interrompível pelo pedido de parada"""
+        try:
+            await asyncio.wait_for(self._evento_parar.wait(), timeout=segundos)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _loop_monitoramento(self) -> None:
+        """Loop principal de monitoramento (asyncio)"""
+        self._loop = asyncio.get_running_loop()
+        self._evento_parar = asyncio.Event()
         self._log_com_timestamp("Monitor iniciado", "SUCCESS")
         self.metricas['uptime_inicio'] = datetime.now()
-        
-        while self.rodando:
-            try:
-                # Verificar status
-                status = self.verificar_status_waha()
-                self.historico_status.append(status)
-                self.ultimo_status = status
-                
-                # Atualizar métricas
-                self.metricas['total_verificacoes'] += 1
-                
-                if status['waha_online'] and status['sessao_ativa']:
-                    self.metricas['verificacoes_sucesso'] += 1
-                    
-                    # Se estava inativo, calcular tempo de inatividade
-                    if self.metricas['ultima_inatividade_inicio']:
-                        tempo_inativo = datetime.now() - self.metricas['ultima_inatividade_inicio']
-                        self.metricas['tempo_inatividade_total'] += tempo_inativo.total_seconds()
-                        self.metricas['ultima_inatividade_inicio'] = None
-                        
-                        self._log_com_timestamp(
-                            f"Sistema voltou ao normal após {tempo_inativo.total_seconds():.1f}s de inatividade", 
-                            "SUCCESS"
+
+        for alvo in self.alvos:
+            alvo['intervalo'] = self.intervalo_verificacao
+            alvo['proximo_em'] = time.monotonic()
+
+        async with self._nova_sessao_http() as sessao:
+            while self.rodando:
+                try:
+                    agora = time.monotonic()
+                    devidos = [a for a in self.alvos if a['proximo_em'] <= agora]
+
+                    if devidos:
+                        # Todos os alvos devidos são sondados ao mesmo tempo
+                        inicio_ciclo = time.monotonic()
+                        resultados = await asyncio.gather(
+                            *(self._sondar_alvo(sessao, alvo) for alvo in devidos)
                         )
-                else:
-                    self.metricas['verificacoes_falha'] += 1
-                    
-                    # Marcar início de inatividade
-                    if not self.metricas['ultima_inatividade_inicio']:
-                        self.metricas['ultima_inatividade_inicio'] = datetime.now()
-                
-                # Detectar problemas
-                problemas = self.detectar_problemas(status)
-                
-                if problemas:
-                    # Log apenas novos problemas
-                    novos_problemas = [p for p in problemas if p not in self.alertas_enviados]
-                    
-                    for problema in novos_problemas:
-                        self._log_com_timestamp(f"Problema detectado: {problema}", "WARNING")
-                        self.alertas_enviados.add(problema)
-                    
-                    # Tentar correção automática
-                    if novos_problemas:
-                        correcoes = self.tentar_correcao_automatica(novos_problemas)
-                        for correcao in correcoes:
-                            self._log_com_timestamp(f"Correção aplicada: {correcao}", "SUCCESS")
-                else:
-                    # Limpar alertas se não há problemas
-                    if self.alertas_enviados:
-                        self._log_com_timestamp("Todos os problemas foram resolvidos", "SUCCESS")
-                        self.alertas_enviados.clear()
-                
-                # Log periódico de status (a cada 10 verificações)
-                if self.metricas['total_verificacoes'] % 10 == 0:
-                    self._log_status_periodico(status)
-                
-                # Aguardar próxima verificação
-                time.sleep(self.intervalo_verificacao)
-                
-            except Exception as e:
-                self._log_com_timestamp(f"Erro no loop de monitoramento: {e}", "ERROR")
-                time.sleep(self.intervalo_verificacao)
-    
-    def _log_status_periodico(self, status: Dict) -> None:
+                        self.ultimo_ciclo_segundos = round(time.monotonic() - inicio_ciclo, 3)
+                        self.metricas['ciclos'] += 1
+
+                        for alvo, statuses in zip(devidos, resultados):
+                            saudavel = all(s['waha_online'] and s['sessao_ativa'] for s in statuses)
+                            self._ajustar_intervalo(alvo, saudavel)
+                            for status in statuses:
+                                self._processar_status(sessao, status)
+                        self._atualizar_inatividade()
+
+                        # Log periódico de status (a cada 10 ciclos)
+                        if self.metricas['ciclos'] % 10 == 0:
+                            self._log_status_periodico()
+
+                    # Aguardar até o próximo alvo devido
+                    proximo = min(a['proximo_em'] for a in self.alvos)
+                    await self._aguardar(max(0.0, proximo - time.monotonic()))
+
+                except Exception as e:
+                    self._log_com_timestamp(f"Erro no loop de monitoramento: {e}", "ERROR")
+                    await self._aguardar(self.intervalo_minimo)
+
+            await self._cancelar_correcoes()
+
+    def _log_status_periodico(self) -> None:
         """Log periódico do status"""
         uptime = datetime.now() - self.metricas['uptime_inicio']
-        taxa_sucesso = (self.metricas['verificacoes_sucesso'] / 
+        taxa_sucesso = (self.metricas['verificacoes_sucesso'] /
                        self.metricas['total_verificacoes'] * 100) if self.metricas['total_verificacoes'] > 0 else 0
-        
+
+        for chave, status in self.ultimos_status.items():
+            alvo = next(a for a in self.alvos if a['nome'] == status['alvo'])
+            p95 = self._histograma(alvo, 'health').percentil(95)
+            self._log_com_timestamp(
+                f"[{chave}] Gateway={'ON' if status['waha_online'] else 'OFF'} | "
+                f"Sessão={status['status_sessao']} | "
+                f"Intervalo={alvo['intervalo']:.0f}s | "
+                f"p95={p95}s",
+                "INFO"
+            )
+
         self._log_com_timestamp(
-            f"Status: WAHA={'ON' if status['waha_online'] else 'OFF'} | "
-            f"Sessão={status['status_sessao']} | "
             f"Uptime={uptime.total_seconds():.0f}s | "
             f"Taxa sucesso={taxa_sucesso:.1f}% | "
-            f"Verificações={self.metricas['total_verificacoes']}",
+            f"Verificações={self.metricas['total_verificacoes']} | "
+            f"Último ciclo={self.ultimo_ciclo_segundos}s",
             "INFO"
         )
-    
+
     def iniciar_monitor(self) -> None:
         """Inicia o monitoramento"""
         if self.rodando:
             self._log_com_timestamp("Monitor já está rodando", "WARNING")
             return
-        
+
         self.rodando = True
-        self.thread_monitor = threading.Thread(target=self._loop_monitoramento, daemon=True)
+        self.thread_monitor = threading.Thread(
+            target=lambda: asyncio.run(self._loop_monitoramento()), daemon=True
+        )
         self.thread_monitor.start()
-        
-        self._log_com_timestamp(f"Monitor iniciado - Verificando a cada {self.intervalo_verificacao}s", "SUCCESS")
-    
+
+        instancias = sum(len(a['instancias']) for a in self.alvos)
+        self._log_com_timestamp(
+            f"Monitor iniciado - {len(self.alvos)} gateway(s), {instancias} instância(s), "
+            f"intervalo adaptativo {self.intervalo_minimo}-{self.intervalo_maximo}s",
+            "SUCCESS"
+        )
+
     def parar_monitor(self) -> None:
         """Para o monitoramento"""
         if not self.rodando:
             return
-        
+
         self.rodando = False
-        
+        if self._loop and self._evento_parar:
+            self._loop.call_soon_threadsafe(self._evento_parar.set)
+
         if self.thread_monitor and self.thread_monitor.is_alive():
             self.thread_monitor.join(timeout=5)
-        
+
         self._log_com_timestamp("Monitor parado", "INFO")
         self._gerar_relatorio_final()
-    
+        self.historico.close()
+
+    def _resumo_historico(self) -> Dict:
+        """Disponibilidade de todo o histórico gravado, por instância e por dia"""
+        inicio, fim = self.historico.time_span()
+        if inicio is None:
+            return {}
+        resumo = {
+            'inicio': datetime.fromtimestamp(inicio).isoformat(),
+            'fim': datetime.fromtimestamp(fim).isoformat(),
+            'instancias': {}
+        }
+        for chave in self.historico.keys():
+            total = self.historico.downsample(max(fim - inicio, 1) + 1, key=chave)
+            resumo['instancias'][chave] = {
+                'total': total[0] if total else None,
+                'diario': self.historico.downsample(86400, key=chave)
+            }
+        return resumo
+
     def _gerar_relatorio_final(self) -> None:
         """Gera relatório final do monitoramento"""
         if not self.metricas['uptime_inicio']:
             return
-        
+
         uptime_total = datetime.now() - self.metricas['uptime_inicio']
-        
+
         # Calcular tempo de inatividade final
         if self.metricas['ultima_inatividade_inicio']:
             tempo_inativo_atual = datetime.now() - self.metricas['ultima_inatividade_inicio']
             self.metricas['tempo_inatividade_total'] += tempo_inativo_atual.total_seconds()
-        
-        taxa_sucesso = (self.metricas['verificacoes_sucesso'] / 
+
+        taxa_sucesso = (self.metricas['verificacoes_sucesso'] /
                        self.metricas['total_verificacoes'] * 100) if self.metricas['total_verificacoes'] > 0 else 0
-        
-        disponibilidade = ((uptime_total.total_seconds() - self.metricas['tempo_inatividade_total']) / 
+
+        disponibilidade = ((uptime_total.total_seconds() - self.metricas['tempo_inatividade_total']) /
                           uptime_total.total_seconds() * 100) if uptime_total.total_seconds() > 0 else 0
-        
+
         relatorio = {
             'periodo_monitoramento': {
                 'inicio': self.metricas['uptime_inicio'].isoformat(),
@@ -373,22 +737,27 @@ class MonitorWAHA:
                 'taxa_sucesso_percent': round(taxa_sucesso, 2),
                 'disponibilidade_percent': round(disponibilidade, 2),
                 'tempo_inatividade_total_segundos': self.metricas['tempo_inatividade_total'],
-                'reconexoes_automaticas': self.metricas['reconexoes_automaticas']
+                'reconexoes_automaticas': self.metricas['reconexoes_automaticas'],
+                'ciclos': self.metricas['ciclos'],
+                'ultimo_ciclo_segundos': self.ultimo_ciclo_segundos
             },
+            'latencias': {chave: h.to_dict() for chave, h in self.histogramas.items()},
+            'historico_persistido': self._resumo_historico(),
             'ultimo_status': self.ultimo_status,
+            'ultimos_status': self.ultimos_status,
             'historico_recente': list(self.historico_status)[-10:]  # Últimos 10 status
         }
-        
+
         # Salvar relatório
         filename = f"relatorio_monitor_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
         try:
             with open(filename, 'w', encoding='utf-8') as f:
                 json.dump(relatorio, f, indent=2, ensure_ascii=False)
-            
+
             self._log_com_timestamp(f"Relatório final salvo em: {filename}", "SUCCESS")
         except Exception as e:
             self._log_com_timestamp(f"Erro ao salvar relatório: {e}", "ERROR")
-        
+
         # Log do resumo
         print("\n" + "=" * 50)
         print("📊 RESUMO DO MONITORAMENTO")
@@ -399,49 +768,54 @@ class MonitorWAHA:
         print(f"📈 Disponibilidade: {disponibilidade:.1f}%")
         print(f"⚠️ Tempo inativo: {self.metricas['tempo_inatividade_total']:.0f}s")
         print(f"🔄 Reconexões automáticas: {self.metricas['reconexoes_automaticas']}")
+        for chave, histograma in sorted(self.histogramas.items()):
+            print(f"⏱️ {chave}: p50={histograma.percentil(50)}s p95={histograma.percentil(95)}s "
+                  f"({histograma.total} amostras)")
         print("=" * 50)
-    
+
     def status_atual(self) -> Dict:
         """Retorna o status atual"""
         return self.ultimo_status or {}
-    
+
     def configurar_intervalo(self, segundos: int) -> None:
         """Configura o intervalo de verificação"""
         if segundos < 5:
             segundos = 5
         self.intervalo_verificacao = segundos
+        self.intervalo_maximo = max(self.intervalo_maximo, segundos)
         self._log_com_timestamp(f"Intervalo de verificação alterado para {segundos}s", "INFO")
 
 def main():
     """Função principal"""
     print("🔍 Monitor em Tempo Real do WAHA")
     print("=" * 40)
-    
+
     if len(sys.argv) > 1:
         if sys.argv[1] == "--help":
             print("\n📖 USO:")
             print("  python monitor_waha_realtime.py                    # Iniciar monitor")
             print("  python monitor_waha_realtime.py --intervalo 60     # Monitor com intervalo de 60s")
             print("  python monitor_waha_realtime.py --status           # Verificar status uma vez")
+            print("\n⚙️ Vários gateways: defina 'monitor_alvos' no config.json")
             print("\n⌨️ Durante o monitoramento:")
             print("  Ctrl+C para parar o monitor")
             return
-        
+
         elif sys.argv[1] == "--status":
             monitor = MonitorWAHA()
-            status = monitor.verificar_status_waha()
+            status = monitor.verificar_todos()
             print(json.dumps(status, indent=2, ensure_ascii=False))
             return
-    
+
     # Verificar se arquivo de configuração existe
     if not os.path.exists('config.json'):
         print("❌ Arquivo config.json não encontrado!")
         print("💡 Crie o arquivo config.json com as configurações do WAHA")
         return
-    
+
     # Inicializar monitor
     monitor = MonitorWAHA()
-    
+
     # Configurar intervalo se especificado
     if len(sys.argv) > 2 and sys.argv[1] == "--intervalo":
         try:
@@ -450,33 +824,33 @@ def main():
         except ValueError:
             print("❌ Intervalo deve ser um número")
             return
-    
+
     # Verificação inicial
     print("🔍 Verificação inicial...")
-    status_inicial = monitor.verificar_status_waha()
-    
-    if not status_inicial['waha_online']:
+    status_inicial = monitor.verificar_todos()
+
+    if not any(s['waha_online'] for s in status_inicial):
         print("❌ WAHA não está acessível. Verifique se está rodando.")
         resposta = input("Continuar monitoramento mesmo assim? (s/N): ")
         if resposta.lower() != 's':
             return
-    
+
     # Iniciar monitoramento
     monitor.iniciar_monitor()
-    
+
     try:
         print("\n🔍 Monitoramento ativo. Pressione Ctrl+C para parar.")
         print("📊 Logs sendo salvos em: monitor_waha.log")
-        
+
         # Manter programa rodando
         while monitor.rodando:
             time.sleep(1)
-    
+
     except KeyboardInterrupt:
         print("\n🛑 Interrompido pelo usuário")
-    
+
     finally:
         monitor.parar_monitor()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,96 @@
+"""
+WhatsApp API Sender - Multipart Stream Module
+Corpo multipart/form-data gerado em blocos a partir do arquivo em disco,
+com Content-Length calculado antes do envio
+"""
+
+import os
+import uuid
+import asyncio
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _quote(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartStream:
+    """
+    Corpo multipart com campos de texto e um arquivo.
+
+    Preâmbulo (campos + cabeçalho da parte do arquivo) e fechamento são
+    montados uma vez; o arquivo é lido em blocos de ``chunk_size`` a cada
+    iteração. A memória por upload fica em um bloco, seja qual for o tamanho
+    do arquivo, e o objeto pode ser iterado de novo numa retentativa.
+
+    Uso com requests: ``session.post(url, data=body, headers=body.headers)``
+    (``__len__`` faz o requests enviar Content-Length em vez de chunked).
+    Com aiohttp: ``session.post(url, data=body, headers=body.headers)`` usando
+    a iteração assíncrona.
+    """
+
+    def __init__(self, fields: Dict[str, str], file_field: str, path: str,
+                 filename: Optional[str] = None, content_type: Optional[str] = None,
+                 boundary: Optional[str] = None, chunk_size: int = CHUNK_SIZE):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.boundary = boundary or uuid.uuid4().hex
+        filename = filename or os.path.basename(path)
+
+        parts = []
+        for name, value in fields.items():
+            parts.append(f'--{self.boundary}\r\n'
+                         f'Content-Disposition: form-data; name="{_quote(name)}"\r\n\r\n'
+                         f'{value}\r\n')
+        parts.append(f'--{self.boundary}\r\n'
+                     f'Content-Disposition: form-data; name="{_quote(file_field)}"; '
+                     f'filename="{_quote(filename)}"\r\n'
+                     f'Content-Type: {content_type or "application/octet-stream"}\r\n\r\n')
+        self.preamble = ''.join(parts).encode('utf-8')
+        self.trailer = f'\r\n--{self.boundary}--\r\n'.encode('utf-8')
+        self.file_size = os.path.getsize(path)
+
+    @property
+    def content_length(self) -> int:
+        return len(self.preamble) + self.file_size + len(self.trailer)
+
+    def __len__(self) -> int:
+        return self.content_length
+
+    @property
+    def headers(self) -> Dict[str, str]:
+        return {
+            'Content-Type': f'multipart/form-data; boundary={self.boundary}',
+            'Content-Length': str(self.content_length)
+        }
+
+    def __iter__(self) -> Iterator[bytes]:
+        yield self.preamble
+        with open(self.path, 'rb') as file:
+            remaining = self.file_size
+            while remaining > 0:
+                chunk = file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"Arquivo {self.path} diminuiu durante o envio")
+                remaining -= len(chunk)
+                yield chunk
+        yield self.trailer
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        # Leitura do disco no executor para não bloquear o loop
+        loop = asyncio.get_running_loop()
+        yield self.preamble
+        file = await loop.run_in_executor(None, open, self.path, 'rb')
+        try:
+            remaining = self.file_size
+            while remaining > 0:
+                chunk = await loop.run_in_executor(None, file.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    raise IOError(f"Arquivo {self.path} diminuiu durante o envio")
+                remaining -= len(chunk)
+                yield chunk
+        finally:
+            file.close()
+        yield self.trailer
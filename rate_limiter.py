@@ -0,0 +1,236 @@
+"""
+WhatsApp API Sender - Rate Limiter Module
+Limite de envios por minuto da instância (token bucket), em memória ou
+compartilhado entre processos via SQLite ou Redis
+"""
+
+import time
+import sqlite3
+import logging
+import threading
+from typing import Any, Callable, Dict, Optional
+
+DEFAULT_RATE_LIMIT_FILE = 'rate_limits.db'
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Token bucket em memória: ``rate_per_minute`` fichas por minuto, com até
+    ``burst`` fichas acumuladas. Cada envio consome uma ficha.
+
+    Vale só para o processo atual; para vários processos use
+    ``SQLiteTokenBucket`` ou ``RedisTokenBucket``.
+    """
+
+    does_io = False  # Consultas vão a disco/rede: quem roda num event loop usa o executor
+
+    def __init__(self, rate_per_minute: float, burst: int = 1,
+                 clock: Callable[[], float] = time.monotonic):
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute deve ser maior que zero")
+        self.rate = rate_per_minute / 60.0  # fichas por segundo
+        self.capacity = max(1, int(burst))
+        self.clock = clock
+        self._tokens = float(self.capacity)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def try_acquire(self) -> float:
+        """
+        Tenta consumir uma ficha sem bloquear
+
+        Returns:
+            0 se a ficha foi consumida; caso contrário, segundos até haver uma
+        """
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def available_in(self) -> float:
+        """Segundos até haver uma ficha, sem consumir (0 = disponível agora)"""
+        with self._lock:
+            self._refill(self.clock())
+            return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """
+        Bloqueia até consumir uma ficha
+
+        Returns:
+            True se consumiu, False se ``timeout`` segundos se passaram antes
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait <= 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+class SQLiteTokenBucket(TokenBucket):
+    """
+    Token bucket com estado numa tabela SQLite, compartilhado por todos os
+    processos que usam o mesmo arquivo e a mesma ``key`` (uma por instância
+    do gateway). Cada tentativa é uma transação ``BEGIN IMMEDIATE``, que
+    serializa os processos concorrentes. Usa o relógio de parede, comum a
+    todos os processos da máquina.
+    """
+
+    does_io = True
+
+    def __init__(self, key: str, rate_per_minute: float, burst: int = 1,
+                 path: str = DEFAULT_RATE_LIMIT_FILE):
+        super().__init__(rate_per_minute, burst, clock=time.time)
+        self.key = key
+        self.path = path
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('CREATE TABLE IF NOT EXISTS buckets '
+                         '(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)')
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def _take(self, consume: bool) -> float:
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            now = self.clock()
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (self.key,)).fetchone()
+            tokens = float(self.capacity) if row is None else \
+                min(self.capacity, row[0] + max(0.0, now - row[1]) * self.rate)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+            if consume and wait == 0:
+                tokens -= 1
+            conn.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)',
+                         (self.key, tokens, now))
+            conn.execute('COMMIT')
+            return wait
+        except BaseException:
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def try_acquire(self) -> float:
+        return self._take(consume=True)
+
+    def available_in(self) -> float:
+        """Só leitura (sem ``BEGIN IMMEDIATE``): no WAL não espera pelos processos que consomem fichas"""
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (self.key,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return 0.0
+        tokens = min(self.capacity, row[0] + max(0.0, self.clock() - row[1]) * self.rate)
+        return 0.0 if tokens >= 1 else (1 - tokens) / self.rate
+
+
+# KEYS[1] = chave do bucket; ARGV = capacidade, fichas/s, consumir (1/0)
+# Usa o relógio do servidor Redis (TIME), comum a todos os clientes
+REDIS_TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local consume = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(state[1])
+local updated = tonumber(state[2])
+if tokens == nil then
+    tokens = capacity
+else
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+end
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+elseif consume == 1 then
+    tokens = tokens - 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 60)
+return tostring(wait)
+"""
+
+
+class RedisTokenBucket(TokenBucket):
+    """
+    Token bucket atômico no Redis (script Lua), para processos em máquinas
+    diferentes. Usa o Redis do docker-compose por padrão.
+    """
+
+    does_io = True
+
+    def __init__(self, key: str, rate_per_minute: float, burst: int = 1,
+                 url: str = 'redis://localhost:6379/0'):
+        super().__init__(rate_per_minute, burst)
+        import redis  # dependência opcional: só necessária com rate_limit_backend = "redis"
+        self.key = f"whatsapp_sender:rate:{key}"
+        self.client = redis.Redis.from_url(url)
+        self._script = self.client.register_script(REDIS_TOKEN_BUCKET_SCRIPT)
+
+    def _take(self, consume: bool) -> float:
+        return float(self._script(keys=[self.key], args=[self.capacity, self.rate, int(consume)]))
+
+    def try_acquire(self) -> float:
+        return self._take(consume=True)
+
+    def available_in(self) -> float:
+        return self._take(consume=False)
+
+
+def rate_limit_key(config: Dict[str, Any]) -> str:
+    """Identifica a instância do gateway: todos os processos que enviam por ela dividem o limite"""
+    if config.get('rate_limit_key'):
+        return str(config['rate_limit_key'])
+    return ':'.join([config.get('provider', ''), config.get('base_url', '').rstrip('/'),
+                     str(config.get('instance_id', ''))])
+
+
+def create_rate_limiter(config: Dict[str, Any]) -> Optional[TokenBucket]:
+    """
+    Cria o limitador a partir do config.json
+
+    Chaves: ``rate_limit_per_minute`` (0/ausente = sem limite),
+    ``rate_limit_burst``, ``rate_limit_backend`` ("sqlite" padrão, "redis"
+    ou "memory"), ``rate_limit_file``, ``rate_limit_redis_url`` e
+    ``rate_limit_key``.
+
+    Returns:
+        TokenBucket, ou None se nenhum limite estiver configurado
+    """
+    rate = float(config.get('rate_limit_per_minute') or 0)
+    if rate <= 0:
+        return None
+    burst = int(config.get('rate_limit_burst', 1))
+    backend = config.get('rate_limit_backend', 'sqlite').lower()
+
+    if backend == 'memory':
+        return TokenBucket(rate, burst)
+    if backend == 'redis':
+        try:
+            return RedisTokenBucket(rate_limit_key(config), rate, burst,
+                                    config.get('rate_limit_redis_url', 'redis://localhost:6379/0'))
+        except ImportError:
+            logger.warning("Pacote redis não instalado; usando limitador SQLite")
+    return SQLiteTokenBucket(rate_limit_key(config), rate, burst,
+                             config.get('rate_limit_file', DEFAULT_RATE_LIMIT_FILE))
@@ -0,0 +1,113 @@
+"""
+WhatsApp API Sender - Send Watchdog Module
+Vigia envios em andamento e abandona os que excedem o orçamento de tempo
+"""
+
+import time
+import logging
+import threading
+import itertools
+from typing import Any, Callable, Dict, List, Optional
+
+
+class SendStuckError(Exception):
+    """Envio excedeu o orçamento de tempo e foi abandonado (entrega não confirmada)"""
+
+    def __init__(self, description: str, budget: float):
+        super().__init__(f"{description} excedeu o orçamento de {budget:.0f}s")
+        self.description = description
+        self.budget = budget
+
+
+class SendAbandonedError(Exception):
+    """Levantada na thread de um envio já abandonado: nenhuma nova requisição sai dele"""
+
+
+class SendWatchdog:
+    """
+    Executa cada envio numa thread própria e espera no máximo ``budget``
+    segundos. Se o envio não terminar a tempo, ele é abandonado e conta como
+    falha (métrica ``stuck``). A requisição que já estava no ar não pode ser
+    desfeita: a thread termina quando o timeout de leitura do requests
+    disparar, mas ``on_abandon`` permite ao chamador bloquear novas
+    tentativas e descartar o resultado tardio. Envios abandonados não são
+    reenviados aqui: a mensagem pode ou não ter chegado, então o chamador
+    os marca como retentáveis e o reenvio fica a critério do usuário.
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._in_flight: Dict[int, Dict[str, Any]] = {}
+        self.metrics = {
+            'sends': 0,
+            'stuck': 0,
+            'abandoned_running': 0
+        }
+
+    def run(self, fn: Callable, budget: float, description: str, *args,
+            on_abandon: Optional[Callable[[], bool]] = None, **kwargs):
+        """
+        Executa ``fn(*args, **kwargs)`` respeitando o orçamento
+
+        Args:
+            on_abandon: Chamado ao estourar o orçamento; se devolver False (o
+                envio já registrou o resultado), o watchdog espera o fim em
+                vez de abandonar
+
+        Raises:
+            SendStuckError: Se o envio não terminar dentro de ``budget`` segundos
+        """
+        send_id = next(self._ids)
+        outcome: Dict[str, Any] = {}
+        done = threading.Event()
+
+        def target():
+            try:
+                outcome['result'] = fn(*args, **kwargs)
+            except BaseException as e:  # repassado para quem chamou
+                outcome['error'] = e
+            finally:
+                done.set()
+                with self._lock:
+                    if self._in_flight.pop(send_id, None) is None:
+                        # Já tinha sido abandonado pelo watchdog
+                        self.metrics['abandoned_running'] -= 1
+
+        with self._lock:
+            self.metrics['sends'] += 1
+            self._in_flight[send_id] = {
+                'description': description,
+                'started_at': time.time(),
+                'budget': budget
+            }
+
+        threading.Thread(target=target, name=f"send-{send_id}", daemon=True).start()
+
+        if not done.wait(budget):
+            if on_abandon is not None and not on_abandon():
+                done.wait()
+            else:
+                with self._lock:
+                    entry = self._in_flight.pop(send_id, None)
+                    if entry is not None:
+                        self.metrics['abandoned_running'] += 1
+                    # Com on_abandon o resultado tardio já foi descartado, mesmo que a thread tenha acabado agora
+                    abandoned = entry is not None or on_abandon is not None
+                    if abandoned:
+                        self.metrics['stuck'] += 1
+                if abandoned:
+                    self.logger.warning(f"⏱️ Envio travado abandonado: {description} (>{budget:.0f}s)")
+                    raise SendStuckError(description, budget)
+
+        if 'error' in outcome:
+            raise outcome['error']
+        return outcome.get('result')
+
+    def in_flight(self) -> List[Dict[str, Any]]:
+        """Envios em andamento, com o tempo decorrido de cada um"""
+        now = time.time()
+        with self._lock:
+            return [{**entry, 'elapsed': round(now - entry['started_at'], 1)}
+                    for entry in self._in_flight.values()]
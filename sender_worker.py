@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""
+WhatsApp API Sender - Sender Worker
+Processo dedicado que consome campanhas da fila local e reporta progresso ao servidor web
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import sqlite3
+import signal
+import asyncio
+import logging
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+from utils import setup_logging
+from api_sender import WhatsAppAPISender
+from campaign_queue import (CampaignQueue, DEFAULT_QUEUE_FILE, WORKER_STALE_AFTER,
+                            QUEUED, STOPPED, COMPLETED, FAILED)
+from campaign_supervisor import CampaignSupervisor
+from sequence_compiler import SequenceCompileError
+from media_store import MediaStore, DEFAULT_MEDIA_ROOT
+
+POLL_INTERVAL = 0.2  # segundos entre leituras de comando/gravações de progresso
+
+
+class SenderWorker:
+    """
+    Consome campanhas da ``CampaignQueue`` uma de cada vez.
+
+    Enquanto a campanha roda, a cada ``poll_interval`` o worker aplica o
+    comando gravado pela interface (pausar/retomar/parar), grava progresso e
+    posição de retomada (só quando mudaram) e renova o heartbeat. Ao receber
+    SIGTERM/SIGINT, para a campanha depois do envio em andamento e a devolve
+    para a fila, para que o próximo worker continue de onde parou.
+
+    Todo acesso à fila roda numa thread própria, fora do loop dos envios: o
+    lock de escrita do SQLite disputado com o servidor web não segura a
+    campanha. É uma thread só, então logs e estados são gravados na ordem.
+    """
+
+    def __init__(self, queue: CampaignQueue, name: str = None, poll_interval: float = POLL_INTERVAL):
+        self.logger = logging.getLogger(__name__)
+        self.queue = queue
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_interval = poll_interval
+        self._shutdown = asyncio.Event()
+        self._db_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='queue-db')
+        self._saved_state = None  # Último estado gravado, para não regravar o que não mudou
+        self._saved_at = 0.0
+
+    async def _db(self, fn: Callable, *args) -> Any:
+        """Executa uma chamada da fila na thread do SQLite"""
+        return await asyncio.get_running_loop().run_in_executor(self._db_executor, fn, *args)
+
+    def _append_log(self, campaign_id: int, message: str) -> None:
+        """Callback de log do runner: enfileira a gravação sem esperar por ela"""
+        self._db_executor.submit(self._write_log, campaign_id, message)
+
+    def _write_log(self, campaign_id: int, message: str) -> None:
+        try:
+            self.queue.append_log(campaign_id, message)
+        except sqlite3.Error as e:
+            self.logger.warning(f"⚠️ Log da campanha {campaign_id} não gravado: {e}")
+
+    async def _save_state(self, campaign_id: int, supervisor: CampaignSupervisor) -> None:
+        """
+        Grava progresso e ponto de retomada se mudaram desde a última gravação.
+        Sem mudança, regrava só a cada ``WORKER_STALE_AFTER`` segundos: é o
+        ``updated_at`` da campanha que impede outro worker de reivindicá-la
+        """
+        control = supervisor.control
+        state = (supervisor.progress(), control.position, dict(control.pending), supervisor.is_paused)
+        snapshot = json.dumps(state, ensure_ascii=False, sort_keys=True, default=str)
+        now = time.monotonic()
+        if snapshot == self._saved_state and now - self._saved_at < WORKER_STALE_AFTER:
+            return
+        await self._db(self.queue.save_state, campaign_id, *state)
+        self._saved_state = snapshot
+        self._saved_at = now
+
+    def request_shutdown(self) -> None:
+        self._shutdown.set()
+
+    async def run(self) -> None:
+        self.logger.info(f"🛠️ sender_worker {self.name} aguardando campanhas em {self.queue.path}")
+        try:
+            while not self._shutdown.is_set():
+                await self._db(self.queue.heartbeat, self.name)
+                job = await self._db(self.queue.claim, self.name)
+                if job is None:
+                    try:
+                        await asyncio.wait_for(self._shutdown.wait(), self.poll_interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
+                await self._run_campaign(job)
+        finally:
+            await self._db(self.queue.remove_worker, self.name)
+            self._db_executor.shutdown(wait=True)
+
+    async def _run_campaign(self, job: Dict[str, Any]) -> None:
+        campaign_id = job['id']
+        payload = job['payload']
+        supervisor = CampaignSupervisor(lambda message: self._append_log(campaign_id, message))
+        self._saved_state = None
+
+        self.logger.info(f"📨 Campanha {campaign_id} iniciada")
+        try:
+            supervisor.start(payload['contacts'], payload['sequence'], payload['config'],
+                             payload['message_config'], WhatsAppAPISender(payload['config']),
+                             job['position'], job['pending'], job['progress'])
+        except Exception as e:
+            # Sem isso a campanha ficaria "running" e o próximo worker quebraria do mesmo jeito
+            problems = e.problems if isinstance(e, SequenceCompileError) else [f"Erro ao iniciar a campanha: {e}"]
+            for problem in problems:
+                self._append_log(campaign_id, f"❌ {problem}")
+            await self._db(self.queue.save_state, campaign_id, job['progress'], job['position'],
+                           job['pending'], False, FAILED)
+            self.logger.error(f"📨 Campanha {campaign_id} não iniciada: {e}")
+            await self._db(self._release_media, campaign_id)
+            return
+        applied = 'running'
+
+        while supervisor.is_running:
+            if self._shutdown.is_set():
+                await self._drain(campaign_id, supervisor)
+                break
+
+            desired = await self._db(self.queue.desired, campaign_id)
+            if desired != applied:
+                if desired == 'paused':
+                    supervisor.pause()
+                elif desired == 'running' and supervisor.is_paused:
+                    supervisor.resume()
+                elif desired == STOPPED:
+                    supervisor.stop()
+                applied = desired
+
+            await self._save_state(campaign_id, supervisor)
+            await self._db(self.queue.heartbeat, self.name)
+            await asyncio.wait([supervisor.task], timeout=self.poll_interval)
+
+        control = supervisor.control
+        if supervisor.resume_point is None:
+            status = COMPLETED
+        elif self._shutdown.is_set() and applied != STOPPED:
+            status = QUEUED  # Worker encerrado: outro worker continua a campanha
+        else:
+            status = STOPPED
+        await self._db(self.queue.save_state, campaign_id, supervisor.progress(), control.position,
+                       control.pending, False, status)
+        self.logger.info(f"📨 Campanha {campaign_id} finalizada com status {status}")
+        if status == COMPLETED:
+            await self._db(self._release_media, campaign_id)
+
+    async def _drain(self, campaign_id: int, supervisor: CampaignSupervisor) -> None:
+        """
+        Espera o envio em andamento terminar (``supervisor.shutdown``) sem
+        parar de gravar estado e heartbeat: sem isso, ``claim()`` de outro
+        worker consideraria a campanha abandonada no meio da espera e a
+        retomaria em paralelo, duplicando envios
+        """
+        drain = asyncio.ensure_future(supervisor.shutdown())
+        while not drain.done():
+            await self._save_state(campaign_id, supervisor)
+            await self._db(self.queue.heartbeat, self.name)
+            await asyncio.wait([drain], timeout=self.poll_interval)
+        drain.result()
+
+    def _release_media(self, campaign_id: int) -> None:
+        """Libera as mídias da campanha para a limpeza (campanhas paradas continuam retomáveis)"""
+        if os.path.isdir(DEFAULT_MEDIA_ROOT):
+            MediaStore(DEFAULT_MEDIA_ROOT).set_refs(f'campaign:{campaign_id}', [])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker de envio de campanhas do WhatsApp API Sender")
+    parser.add_argument('--queue', default=DEFAULT_QUEUE_FILE, help="Arquivo SQLite da fila de campanhas")
+    parser.add_argument('--name', default=None, help="Nome do worker (padrão: host-pid)")
+    parser.add_argument('--poll-interval', type=float, default=POLL_INTERVAL,
+                        help="Intervalo em segundos para ler comandos e gravar progresso")
+    args = parser.parse_args()
+
+    setup_logging(logging.INFO)
+
+    async def run():
+        worker = SenderWorker(CampaignQueue(args.queue), args.name, args.poll_interval)
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            try:
+                loop.add_signal_handler(sig, worker.request_shutdown)
+            except NotImplementedError:  # Windows
+                signal.signal(sig, lambda *_: loop.call_soon_threadsafe(worker.request_shutdown))
+        await worker.run()
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
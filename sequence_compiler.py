@@ -0,0 +1,268 @@
+"""
+WhatsApp API Sender - Sequence Compiler Module
+Resolve a sequência de mensagens uma única vez antes do envio: endpoints,
+mídias verificadas (tamanho/MIME), templates de texto e campos fixos do payload
+"""
+
+import os
+import mimetypes
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+MAX_MEDIA_MB = 64  # Limite amplo aceito pelos gateways
+
+
+class SequenceCompileError(ValueError):
+    """Sequência inválida para envio; ``problems`` lista um erro por passo"""
+
+    def __init__(self, problems: List[str]):
+        super().__init__('; '.join(problems))
+        self.problems = problems
+
+
+class MessageTemplate:
+    """Texto com ``{nome}`` pré-separado: renderizar é só um ``join``"""
+
+    __slots__ = ('source', '_parts')
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts = source.split('{nome}')
+
+    def render(self, nome: str) -> str:
+        if len(self._parts) == 1:
+            return self.source
+        return nome.join(self._parts)
+
+    def length(self, nome: str) -> int:
+        return len(self.source) + (len(self._parts) - 1) * (len(nome) - len('{nome}'))
+
+
+class CompiledStep:
+    """
+    Passo da sequência pronto para envio. Por contato só falta preencher o
+    número (``number_field``) e o texto (``text_field``) no payload.
+    """
+
+    __slots__ = ('index', 'kind', 'template', 'url', 'number_field', 'text_field', 'static',
+                 'path', 'filename', 'size', 'mime_type', 'media_type', 'file_field')
+
+    def __init__(self, index: int, kind: str, template: MessageTemplate, url: str,
+                 number_field: str, text_field: str, static: Dict[str, Any]):
+        self.index = index
+        self.kind = kind
+        self.template = template
+        self.url = url
+        self.number_field = number_field
+        self.text_field = text_field
+        self.static = static
+        self.path = ''
+        self.filename = ''
+        self.size = 0
+        self.mime_type: Optional[str] = None
+        self.media_type = ''
+        self.file_field = ''
+
+    @property
+    def is_media(self) -> bool:
+        return self.kind == 'media'
+
+    def payload(self, number: str, text: str) -> Dict[str, Any]:
+        """Campos fixos + número e texto do contato"""
+        return {**self.static, self.number_field: number, self.text_field: text}
+
+
+def _waha_media(mime_type: Optional[str]) -> Tuple[str, str]:
+    if mime_type and mime_type.startswith('image/'):
+        return '/api/sendImage', 'image'
+    if mime_type and mime_type.startswith('video/'):
+        return '/api/sendVideo', 'video'
+    if mime_type and mime_type.startswith('audio/'):
+        return '/api/sendVoice', 'audio'
+    return '/api/sendFile', 'document'
+
+
+def _evolution_media(mime_type: Optional[str]) -> Tuple[str, str]:
+    if mime_type and mime_type.startswith('image/'):
+        return '/message/sendMedia/{instance_id}', 'image'
+    if mime_type and mime_type.startswith('video/'):
+        return '/message/sendMedia/{instance_id}', 'video'
+    if mime_type and mime_type.startswith('audio/'):
+        return '/message/sendWhatsAppAudio/{instance_id}', 'audio'
+    return '/message/sendMedia/{instance_id}', 'document'
+
+
+def _fixed(endpoint: str) -> Callable[[Optional[str]], Tuple[str, str]]:
+    return lambda mime_type: (endpoint, 'document')
+
+
+# Como cada provider recebe os envios (espelha os métodos _send_via_* do sender)
+PROVIDERS: Dict[str, Dict[str, Any]] = {
+    'waha': {
+        'text_endpoint': '/api/sendText',
+        'text_fields': ('chatId', 'text'),
+        'media_endpoint': _waha_media,
+        'media_fields': ('chatId', 'caption'),
+        'file_field': 'file',
+        'number_format': '{numero}@c.us',
+        'static': lambda config: {'session': config.get('instance_id', '')},
+        'success': lambda status, result: status == 201 or (status == 200 and result.get('success', False))
+    },
+    'evolution-api': {
+        'text_endpoint': '/message/sendText/{instance_id}',
+        'text_fields': ('number', 'text'),
+        'media_endpoint': _evolution_media,
+        'media_fields': ('number', 'caption'),
+        'file_field': 'attachment',
+        'media_type_field': 'mediatype',
+        'media_attempts': 3,
+        'success': lambda status, result: status in (200, 201) and bool(
+            result.get('key') or result.get('messageId') or result.get('id'))
+    },
+    'chat-api': {
+        'text_endpoint': '/sendMessage',
+        'text_fields': ('phone', 'body'),
+        'media_endpoint': _fixed('/sendFile'),
+        'media_fields': ('phone', 'body'),
+        'file_field': 'file',
+        'success': lambda status, result: status == 200 and result.get('sent', False)
+    },
+    'z-api': {
+        'text_endpoint': '/instances/{instance_id}/token/{token}/send-text',
+        'text_fields': ('phone', 'message'),
+        'media_endpoint': _fixed('/instances/{instance_id}/token/{token}/send-document'),
+        'media_fields': ('phone', 'message'),
+        'file_field': 'file',
+        'success': lambda status, result: status == 200 and result.get('success', False)
+    },
+    'ultramsg': {
+        'text_endpoint': '/messages/chat',
+        'text_fields': ('to', 'body'),
+        'media_endpoint': _fixed('/messages/document'),
+        'media_fields': ('to', 'caption'),
+        'file_field': 'document',
+        'static': lambda config: {'token': config.get('token', '')},
+        'success': lambda status, result: status == 200 and result.get('sent', False)
+    }
+}
+
+GENERIC_PROVIDER = {
+    'text_fields': ('phone', 'message'),
+    'media_fields': ('phone', 'message'),
+    'file_field': 'file',
+    'success': lambda status, result: status == 200
+}
+
+
+def provider_spec(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Especificação do provider configurado (genérico usa text_endpoint/media_endpoint do config)"""
+    provider = config.get('provider', '').lower()
+    spec = PROVIDERS.get(provider)
+    if spec is None:
+        spec = dict(GENERIC_PROVIDER)
+        spec['text_endpoint'] = config.get('text_endpoint', '/send-message')
+        spec['media_endpoint'] = _fixed(config.get('media_endpoint', '/send-media'))
+    return spec
+
+
+class CompiledSequence:
+    """Sequência compilada para um provider; ``steps[i]`` corresponde a ``sequence[i]``"""
+
+    def __init__(self, steps: List[CompiledStep], provider: str, spec: Dict[str, Any]):
+        self.steps = steps
+        self.provider = provider
+        self.number_format = spec.get('number_format', '{numero}')
+        self.is_success = spec['success']
+        self.media_attempts = spec.get('media_attempts', 1)
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def __getitem__(self, index: int) -> CompiledStep:
+        return self.steps[index]
+
+    def format_number(self, numero: str) -> str:
+        numero_limpo = numero.replace('+', '').replace('-', '').replace(' ', '')
+        return self.number_format.format(numero=numero_limpo)
+
+    def summary(self) -> Dict[str, Any]:
+        media = [step for step in self.steps if step.is_media]
+        return {
+            'provider': self.provider,
+            'steps': len(self.steps),
+            'media_steps': len(media),
+            'media_bytes': sum(step.size for step in media)
+        }
+
+
+def compile_sequence(sequence: List[Dict[str, Any]], config: Dict[str, Any]) -> CompiledSequence:
+    """
+    Compila a sequência para o provider do ``config``
+
+    Args:
+        sequence: Sequência de mensagens (``type`` text/media)
+        config: config.json (provider, base_url, instance_id, token)
+
+    Returns:
+        CompiledSequence
+
+    Raises:
+        SequenceCompileError: Passo inválido, mídia inexistente, ilegível ou grande demais
+    """
+    spec = provider_spec(config)
+    base_url = config.get('base_url', '').rstrip('/')
+    url_params = {'instance_id': config.get('instance_id', ''), 'token': config.get('token', '')}
+    static = spec['static'](config) if 'static' in spec else {}
+
+    steps = []
+    problems = []
+    for index, message in enumerate(sequence):
+        kind = message.get('type')
+        label = f"Mensagem {index + 1}"
+
+        if kind == 'text':
+            content = message.get('content', '')
+            if not content.strip():
+                problems.append(f"{label}: texto vazio")
+                continue
+            number_field, text_field = spec['text_fields']
+            url = base_url + spec['text_endpoint'].format(**url_params)
+            steps.append(CompiledStep(index, kind, MessageTemplate(content), url,
+                                      number_field, text_field, dict(static)))
+
+        elif kind == 'media':
+            path = message.get('path', '')
+            if not path or not os.path.isfile(path):
+                problems.append(f"{label}: arquivo de mídia não encontrado ({path or 'sem caminho'})")
+                continue
+            if not os.access(path, os.R_OK):
+                problems.append(f"{label}: sem permissão de leitura em {path}")
+                continue
+            size = os.path.getsize(path)
+            if size > MAX_MEDIA_MB * 1024 * 1024:
+                problems.append(f"{label}: arquivo muito grande ({size / 1024 / 1024:.1f}MB, "
+                                f"máximo {MAX_MEDIA_MB}MB)")
+                continue
+
+            mime_type, _ = mimetypes.guess_type(path)
+            endpoint, media_type = spec['media_endpoint'](mime_type)
+            number_field, text_field = spec['media_fields']
+            step_static = dict(static)
+            if 'media_type_field' in spec:
+                step_static[spec['media_type_field']] = media_type
+            step = CompiledStep(index, kind, MessageTemplate(message.get('caption') or ''),
+                                base_url + endpoint.format(**url_params), number_field, text_field,
+                                step_static)
+            step.path = os.path.abspath(path)
+            step.filename = os.path.basename(path)
+            step.size = size
+            step.mime_type = mime_type
+            step.media_type = media_type
+            step.file_field = spec['file_field']
+            steps.append(step)
+
+        else:
+            problems.append(f"{label}: tipo desconhecido ({kind})")
+
+    if problems:
+        raise SequenceCompileError(problems)
+    return CompiledSequence(steps, config.get('provider', '').lower() or 'generic', spec)
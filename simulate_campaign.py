@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+WhatsApp API Sender - Campaign Simulation
+Executa uma campanha completa contra um gateway simulado em relógio virtual:
+horas de envio em segundos, com gerador aleatório semeado e linha do tempo completa
+"""
+
+import sys
+import json
+import math
+import random
+import asyncio
+import argparse
+import selectors
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from rate_limiter import TokenBucket
+from campaign_control import AsyncCampaignControl
+from campaign_runner import CampaignRunner, BEHAVIOR_PROFILES
+from adaptive_concurrency import AIMDConcurrencyLimiter, DEFAULT_MAX_IN_FLIGHT, DEFAULT_TARGET_P95
+from campaign_planner import plan_campaign
+
+DEFAULT_SEQUENCE = [
+    {'type': 'text', 'content': 'Olá {nome}! Tudo bem? Temos uma novidade para você.'},
+    {'type': 'text', 'content': 'Posso te mandar mais detalhes?'}
+]
+
+
+class _VirtualSelector(selectors.DefaultSelector):
+    """Em vez de bloquear até o próximo timer, avança o relógio virtual do loop"""
+
+    def __init__(self):
+        super().__init__()
+        self.loop: Optional['VirtualTimeLoop'] = None
+
+    def select(self, timeout=None):
+        events = super().select(0)
+        if events or timeout == 0:
+            return events
+        if timeout is None:
+            raise RuntimeError("Simulação travada: nada agendado e nenhuma tarefa pronta")
+        self.loop.virtual_time += timeout
+        return []
+
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    """
+    Loop asyncio cujo ``time()`` é virtual: quando só há timers pendentes o
+    relógio salta direto para o próximo, então ``asyncio.sleep``/``wait_for``
+    não esperam de verdade. Não use executor (threads) neste loop.
+    """
+
+    def __init__(self):
+        selector = _VirtualSelector()
+        super().__init__(selector)
+        selector.loop = self
+        self.virtual_time = 0.0
+
+    def time(self) -> float:
+        return self.virtual_time
+
+
+class _Watchdog:
+    def __init__(self):
+        self.metrics = {'stuck': 0}
+
+
+class SimulatedGateway:
+    """
+    Gateway local substituto do ``WhatsAppAPISender``: latência aleatória
+    (log-normal), falhas, timeouts e 5xx quando há envios simultâneos demais.
+    Guarda o limite de taxa da instância (consumido pelo runner) e registra cada
+    envio na linha do tempo.
+    """
+
+    def __init__(self, rng: random.Random, clock, latency: float = 1.5, latency_sigma: float = 0.4,
+                 media_latency: float = 4.0, failure_rate: float = 0.0, timeout_rate: float = 0.0,
+                 capacity: int = 8, rate_limit_per_minute: float = 0, rate_limit_burst: int = 1):
+        self.rng = rng
+        self.clock = clock
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.media_latency = media_latency
+        self.failure_rate = failure_rate
+        self.timeout_rate = timeout_rate
+        self.capacity = capacity
+        self.watchdog = _Watchdog()
+        self.rate_limiter = TokenBucket(rate_limit_per_minute, rate_limit_burst, clock=clock) \
+            if rate_limit_per_minute > 0 else None
+        self.in_flight = 0
+        self.sends: List[Dict[str, Any]] = []
+
+    def _sample_latency(self, media: bool) -> float:
+        mean = self.media_latency if media else self.latency
+        # Log-normal com média ``mean``
+        mu = math.log(mean) - self.latency_sigma ** 2 / 2
+        return self.rng.lognormvariate(mu, self.latency_sigma)
+
+    async def send_message_async(self, numero: str, texto: str, caminho_midia: str) -> Tuple[bool, Dict[str, Any]]:
+        # A ficha do limite de taxa já foi consumida pelo runner, como com o sender real
+        started = self.clock()
+        self.in_flight += 1
+        outcome = {'status': 200, 'timed_out': False, 'abandoned': False, 'retryable': False}
+        try:
+            latency = self._sample_latency(bool(caminho_midia))
+            if self.in_flight > self.capacity:
+                outcome['status'] = 503
+            elif self.rng.random() < self.timeout_rate:
+                latency = 30.0
+                outcome.update(status=None, timed_out=True, abandoned=True, retryable=True)
+                self.watchdog.metrics['stuck'] += 1
+            elif self.rng.random() < self.failure_rate:
+                outcome['status'] = 500
+            await asyncio.sleep(latency)
+        finally:
+            self.in_flight -= 1
+
+        success = outcome['status'] == 200
+        self.sends.append({
+            'numero': numero,
+            'media': bool(caminho_midia),
+            'started': started,
+            'finished': self.clock(),
+            'status': outcome['status'],
+            'success': success
+        })
+        return success, outcome
+
+
+def _stats(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {'count': 0, 'mean': None, 'min': None, 'max': None, 'p95': None}
+    ordered = sorted(values)
+    return {
+        'count': len(values),
+        'mean': round(sum(values) / len(values), 2),
+        'min': round(ordered[0], 2),
+        'max': round(ordered[-1], 2),
+        'p95': round(ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)], 2)
+    }
+
+
+def simulate_campaign(contacts: List[Dict[str, Any]], sequence: List[Dict[str, Any]],
+                      config: Dict[str, Any], message_config: Dict[str, Any], seed: int = 0,
+                      start: Optional[datetime] = None, profile: Optional[str] = None,
+                      gateway: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Roda a campanha inteira em relógio virtual
+
+    Args:
+        contacts: Contatos (``numero`` e ``nome``)
+        sequence: Sequência de mensagens
+        config: config.json (intervalos, ``max_active_contacts``, limites)
+        message_config: Intervalo entre mensagens da sequência
+        seed: Semente do gerador aleatório (mesma semente = mesma linha do tempo)
+        start: Data/hora de parede simulada do início (afeta horários de refeição)
+        profile: Força um perfil de comportamento (padrão: sorteado pela semente)
+        gateway: Parâmetros extras de ``SimulatedGateway``
+
+    Returns:
+        Dict com ``timeline`` (envios e logs em segundos virtuais), ``stats`` e ``plan``
+    """
+    start = start or datetime.now().replace(microsecond=0)
+    rng = random.Random(seed)
+    loop = VirtualTimeLoop()
+    timeline: List[Dict[str, Any]] = []
+
+    def now() -> datetime:
+        return start + timedelta(seconds=loop.time())
+
+    def log(message: str) -> None:
+        timeline.append({'t': round(loop.time(), 3), 'event': 'log', 'message': message})
+
+    gateway_options = {
+        'rate_limit_per_minute': float(config.get('rate_limit_per_minute') or 0),
+        'rate_limit_burst': int(config.get('rate_limit_burst', 1)),
+        **(gateway or {})
+    }
+
+    async def run() -> Tuple[bool, Dict[str, Any], SimulatedGateway, Dict[str, Any]]:
+        sender = SimulatedGateway(rng, loop.time, **gateway_options)
+        concurrency = AIMDConcurrencyLimiter(int(config.get('max_in_flight', DEFAULT_MAX_IN_FLIGHT)),
+                                             float(config.get('target_latency_p95', DEFAULT_TARGET_P95)),
+                                             clock=loop.time)
+        control = AsyncCampaignControl()
+        runner = CampaignRunner(contacts, sequence, config, message_config, sender, control,
+                                log=log, now=now, rng=rng, concurrency=concurrency)
+        if profile:
+            runner.profile_name, runner.profile = profile, BEHAVIOR_PROFILES[profile]
+        completed = await runner.run()
+        return completed, runner.progress, sender, {'profile': runner.profile_name}
+
+    try:
+        completed, progress, sender, info = loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    for send in sender.sends:
+        timeline.append({
+            't': round(send['started'], 3), 'event': 'send', 'numero': send['numero'],
+            'media': send['media'], 'latency': round(send['finished'] - send['started'], 3),
+            'status': send['status'], 'success': send['success']
+        })
+    timeline.sort(key=lambda entry: entry['t'])
+    for entry in timeline:
+        entry['at'] = (start + timedelta(seconds=entry['t'])).isoformat(timespec='seconds')
+
+    # Intervalos entre mensagens do mesmo contato e entre o início de contatos
+    by_contact: Dict[str, List[float]] = {}
+    for send in sender.sends:
+        by_contact.setdefault(send['numero'], []).append(send['started'])
+    step_gaps = [b - a for times in by_contact.values() for a, b in zip(times, times[1:])]
+    first_sends = sorted(times[0] for times in by_contact.values())
+    contact_gaps = [b - a for a, b in zip(first_sends, first_sends[1:])]
+
+    duration = max((send['finished'] for send in sender.sends), default=0.0)
+    total = len(sender.sends)
+    stats = {
+        'completed': completed,
+        'profile': info['profile'],
+        'seed': seed,
+        'messages': total,
+        'success': progress['success'],
+        'error': progress['error'],
+        'duration_seconds': round(duration, 1),
+        'messages_per_hour': round(total / duration * 3600, 1) if duration else None,
+        'send_latency': _stats([send['finished'] - send['started'] for send in sender.sends]),
+        'step_interval': _stats(step_gaps),
+        'contact_interval': _stats(contact_gaps),
+        'meal_pauses': sum(1 for entry in timeline if entry['event'] == 'log' and '🍽️' in entry['message']),
+        'concurrency': progress.get('concurrency')
+    }
+    plan = plan_campaign(len(contacts), sequence, config, message_config, start,
+                         latency={'text': gateway_options.get('latency', 1.5),
+                                  'media': gateway_options.get('media_latency', 4.0)})
+    if plan['estimated_seconds'] and duration:
+        stats['plan_ratio'] = round(duration / plan['estimated_seconds'], 3)
+    return {'timeline': timeline, 'stats': stats, 'plan': plan}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simula uma campanha em relógio virtual")
+    parser.add_argument('--contacts', type=int, default=50, help="Quantidade de contatos simulados")
+    parser.add_argument('--sequence', help="JSON com a sequência (lista ou message_config com 'sequence')")
+    parser.add_argument('--config', default=None, help="config.json com intervalos e limites")
+    parser.add_argument('--interval', type=int, default=None, help="Intervalo entre mensagens da sequência")
+    parser.add_argument('--max-active', type=int, default=None, help="max_active_contacts")
+    parser.add_argument('--rate-limit', type=float, default=None, help="rate_limit_per_minute")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--start', default=None, help="Início simulado (ISO 8601), ex.: 2025-01-06T11:30")
+    parser.add_argument('--profile', choices=list(BEHAVIOR_PROFILES), default=None)
+    parser.add_argument('--latency', type=float, default=1.5, help="Latência média do gateway (texto)")
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--timeout-rate', type=float, default=0.0)
+    parser.add_argument('--capacity', type=int, default=8, help="Envios simultâneos antes de 503")
+    parser.add_argument('--timeline', default=None, help="Grava a linha do tempo completa (JSON) neste arquivo")
+    args = parser.parse_args()
+
+    config: Dict[str, Any] = {}
+    if args.config:
+        with open(args.config, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    if args.max_active is not None:
+        config['max_active_contacts'] = args.max_active
+    if args.rate_limit is not None:
+        config['rate_limit_per_minute'] = args.rate_limit
+
+    message_config: Dict[str, Any] = {'sequence': DEFAULT_SEQUENCE, 'interval': 10}
+    if args.sequence:
+        with open(args.sequence, 'r', encoding='utf-8') as f:
+            loaded = json.load(f)
+        message_config = loaded if isinstance(loaded, dict) else {**message_config, 'sequence': loaded}
+    if args.interval is not None:
+        message_config['interval'] = args.interval
+
+    contacts = [{'numero': f"55119{i:08d}", 'nome': f"Contato {i + 1}"} for i in range(args.contacts)]
+    start = datetime.fromisoformat(args.start) if args.start else None
+
+    result = simulate_campaign(contacts, message_config['sequence'], config, message_config,
+                               seed=args.seed, start=start, profile=args.profile,
+                               gateway={'latency': args.latency, 'failure_rate': args.failure_rate,
+                                        'timeout_rate': args.timeout_rate, 'capacity': args.capacity})
+
+    if args.timeline:
+        with open(args.timeline, 'w', encoding='utf-8') as f:
+            json.dump(result['timeline'], f, ensure_ascii=False, indent=2)
+        print(f"📝 Linha do tempo gravada em {args.timeline} ({len(result['timeline'])} eventos)", file=sys.stderr)
+
+    print(json.dumps({'stats': result['stats'], 'plan': result['plan']}, ensure_ascii=False, indent=2))
+    return 0 if result['stats']['completed'] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+"""
+WhatsApp API Sender - Template Repository Module
+Índice em memória dos templates salvos (nome → arquivo e metadados),
+atualizado de forma incremental pelo mtime do diretório e dos arquivos
+"""
+
+import os
+import time
+import asyncio
+import logging
+import unicodedata
+from typing import Any, Dict, List, Optional, Tuple
+
+from async_storage import AsyncStorage, storage as default_storage
+
+MTIME_SETTLE_SECONDS = 2.0  # Mudanças mais recentes que isso podem não ter alterado o mtime ainda
+FULL_RESCAN_SECONDS = 30.0  # Edições no lugar não mudam o mtime do diretório: reconfere os arquivos
+
+
+def _fold(text: str) -> str:
+    """Minúsculas e sem acentos, para a busca ('promoção' encontra 'Promocao')"""
+    normalized = unicodedata.normalize('NFKD', text.casefold())
+    return ''.join(c for c in normalized if not unicodedata.combining(c))
+
+
+def _file_state(path: str) -> Tuple[int, int]:
+    info = os.stat(path)
+    return info.st_mtime_ns, info.st_size
+
+
+def _scan(folder: str) -> Dict[str, Tuple[int, int]]:
+    """(mtime_ns, tamanho) de cada .json da pasta"""
+    entries = {}
+    try:
+        with os.scandir(folder) as it:
+            for entry in it:
+                if entry.name.endswith('.json') and entry.is_file():
+                    info = entry.stat()
+                    entries[entry.name] = (info.st_mtime_ns, info.st_size)
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+class TemplateRepository:
+    """
+    Listagem, busca e carga de templates sem reler a pasta a cada clique.
+
+    O índice guarda, por arquivo, nome, data, quantidade de mensagens e o
+    (mtime, tamanho) lido. ``refresh()`` só relista a pasta quando o mtime
+    do diretório muda (criar, apagar ou substituir via rename altera o
+    diretório) ou a cada ``FULL_RESCAN_SECONDS``, e só relê os arquivos cujo
+    (mtime, tamanho) mudou. Gravações feitas por ``save()`` atualizam o
+    índice direto.
+
+    Um template editado no lugar fora do servidor (sem rename) só muda o
+    próprio mtime: ``get()`` confere o (mtime, tamanho) do arquivo antes de
+    responder, e a listagem se atualiza no próximo rescan periódico.
+    """
+
+    def __init__(self, folder: str, storage: Optional[AsyncStorage] = None):
+        self.logger = logging.getLogger(__name__)
+        self.folder = folder
+        self.storage = storage or default_storage
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._by_name: Dict[str, Dict[str, Any]] = {}
+        self._broken: Dict[str, Tuple[int, int]] = {}  # Arquivos inválidos: só relidos se mudarem
+        self._ordered: List[Dict[str, Any]] = []
+        self._dir_mtime: Optional[int] = None
+        self._scanned_at = 0.0
+        self._refresh_lock = asyncio.Lock()
+
+    def _dir_state(self) -> Optional[int]:
+        try:
+            return os.stat(self.folder).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    async def refresh(self, force: bool = False) -> None:
+        """Atualiza o índice com o que mudou na pasta desde a última consulta"""
+        dir_mtime = await self.storage.run(self._dir_state)
+        if not force and dir_mtime is not None and dir_mtime == self._dir_mtime \
+                and time.monotonic() - self._scanned_at < FULL_RESCAN_SECONDS:
+            return
+        async with self._refresh_lock:
+            await self._rescan(dir_mtime)
+
+    async def _rescan(self, dir_mtime: Optional[int]) -> None:
+
+        scanned = await self.storage.run(_scan, self.folder)
+        changed = False
+        for filename in set(self._files) - set(scanned):
+            del self._files[filename]
+            changed = True
+        for filename in set(self._broken) - set(scanned):
+            del self._broken[filename]
+        for filename, state in scanned.items():
+            entry = self._files.get(filename)
+            if (entry is not None and entry['_state'] == state) or self._broken.get(filename) == state:
+                continue
+            path = os.path.join(self.folder, filename)
+            self.storage.invalidate(path)  # Arquivo alterado fora do servidor
+            try:
+                data = await self.storage.read_json(path)
+            except Exception as e:
+                self.logger.warning(f"⚠️ Erro ao ler template {filename}: {e}")
+                self._broken[filename] = state
+                self._files.pop(filename, None)
+                changed = True
+                continue
+            self._files[filename] = self._entry(filename, data, state)
+            self._broken.pop(filename, None)
+            changed = True
+
+        if changed or not self._ordered:
+            self._rebuild()
+        self._scanned_at = time.monotonic()
+        # Mudança no mesmo instante da leitura pode não ter alterado o mtime: confere de novo depois
+        if dir_mtime is not None and time.time() - dir_mtime / 1e9 > MTIME_SETTLE_SECONDS:
+            self._dir_mtime = dir_mtime
+        else:
+            self._dir_mtime = None
+
+    def _entry(self, filename: str, data: Dict[str, Any], state: Tuple[int, int]) -> Dict[str, Any]:
+        name = data.get('name', filename[:-5])
+        return {
+            'name': name,
+            'created_at': data.get('created_at', ''),
+            'message_count': len(data.get('sequence', [])),
+            'filename': filename,
+            '_folded': _fold(name),
+            '_state': state
+        }
+
+    def _rebuild(self) -> None:
+        # Mais recente primeiro; com nome repetido vale o template mais recente
+        self._ordered = sorted(self._files.values(), key=lambda e: e['created_at'], reverse=True)
+        self._by_name = {}
+        for entry in self._ordered:
+            self._by_name.setdefault(entry['name'], entry)
+
+    @staticmethod
+    def _public(entry: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: entry[key] for key in ('name', 'created_at', 'message_count')}
+
+    async def list(self, query: str = '', offset: int = 0, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Templates (mais recentes primeiro), filtrados por ``query`` no nome
+
+        Returns:
+            ``templates`` da página, ``total`` de resultados, ``offset`` e ``limit``
+        """
+        await self.refresh()
+        entries = self._ordered
+        if query:
+            folded = _fold(query.strip())
+            entries = [entry for entry in entries if folded in entry['_folded']]
+        page = entries[offset:offset + limit] if limit is not None else entries[offset:]
+        return {
+            'templates': [self._public(entry) for entry in page],
+            'total': len(entries),
+            'offset': offset,
+            'limit': limit
+        }
+
+    async def get(self, name: str) -> Optional[Dict[str, Any]]:
+        """Conteúdo do template pelo nome (None se não existir)"""
+        await self.refresh()
+        entry = self._by_name.get(name)
+        if entry is None:
+            return None
+        path = os.path.join(self.folder, entry['filename'])
+        try:
+            state = await self.storage.run(_file_state, path)
+            if state != entry['_state']:
+                # Editado no lugar: o rescan relê o arquivo e descarta o JSON do cache
+                await self.refresh(force=True)
+                entry = self._by_name.get(name)
+                if entry is None:
+                    return None
+                path = os.path.join(self.folder, entry['filename'])
+            return await self.storage.read_json(path)
+        except FileNotFoundError:
+            await self.refresh(force=True)
+            return None
+
+    async def save(self, filename: str, data: Dict[str, Any]) -> None:
+        """Grava o template e atualiza o índice sem relistar a pasta"""
+        path = os.path.join(self.folder, filename)
+        await self.storage.write_json(path, data)
+        state = await self.storage.run(_file_state, path)
+        self._files[filename] = self._entry(filename, data, state)
+        self._rebuild()
@@ -9,8 +9,9 @@ import json
 import random
 import time
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable, Iterator
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
 
 import openpyxl
 from openpyxl import load_workbook
@@ -83,97 +84,176 @@ def load_config(config_file: str = 'config.json') -> Dict[str, Any]:
         raise json.JSONDecodeError(f"Erro ao decodificar JSON do arquivo {config_file}: {e}")
 
 
-def load_contacts_from_excel(file_path: str) -> List[Dict[str, str]]:
+def _read_contacts(sheet, sheet_name: Optional[str] = None) -> Iterator[Dict[str, str]]:
+    """Contatos de uma aba, linha a linha (cabeçalho na primeira linha de cada aba)"""
+    logger = logging.getLogger(__name__)
+
+    # Encontrar cabeçalhos
+    headers = {}
+    first_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True), None)
+    if not first_row:
+        raise ValueError(f"Aba '{sheet_name or sheet.title}' está vazia.")
+    logger.info(f"Cabeçalho bruto lido da planilha: {first_row}")
+
+    for idx, header in enumerate(first_row):
+        if header:
+            header_lower = str(header).lower().strip()
+            logger.info(f"Processando cabeçalho: '{header}' -> '{header_lower}'")
+            if 'nome' in header_lower:
+                headers['nome'] = idx
+            elif 'numero' in header_lower or 'telefone' in header_lower or 'phone' in header_lower:
+                headers['numero'] = idx
+
+    logger.info(f"Mapeamento de cabeçalhos final: {headers}")
+
+    # Verificar se campos obrigatórios foram encontrados
+    if 'numero' not in headers:
+        logger.error("A coluna 'Numero' é obrigatória e não foi encontrada nos cabeçalhos.")
+        raise ValueError("Coluna 'Numero' não encontrada na planilha. Verifique se o nome da coluna está correto.")
+
+    logger.info(f"Cabeçalhos encontrados com sucesso: {headers}")
+
+    # Ler dados
+    for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
+        logger.debug(f"[DEBUG] Lendo linha {row_idx}: {row}")
+
+        # Pular linhas completamente vazias
+        if not any(row):
+            logger.debug(f"Linha {row_idx} ignorada: completamente vazia.")
+            continue
+
+        try:
+            # Extrair dados da linha
+            raw_numero = row[headers['numero']]
+            logger.debug(f"[DEBUG] Linha {row_idx} - Valor bruto de 'numero': '{raw_numero}' (Tipo: {type(raw_numero)})")
+
+            numero = str(raw_numero).strip() if raw_numero is not None else ''
+            logger.debug(f"[DEBUG] Linha {row_idx} - Valor de 'numero' após strip: '{numero}'")
+
+            # Pular linhas onde o número é efetivamente vazio
+            if not numero:
+                logger.warning(f"Linha {row_idx} ignorada: 'numero' está vazio ou contém apenas espaços.")
+                continue
+
+            contact = {
+                'numero': numero
+            }
+
+            # Campo opcional: nome
+            if 'nome' in headers and row[headers.get('nome')] is not None:
+                contact['nome'] = str(row[headers['nome']]).strip()
+
+            # Aba de origem, para segmentar por filial/turma
+            if sheet_name is not None:
+                contact['aba'] = sheet_name
+
+            # debug: em planilhas grandes um log INFO por linha domina o tempo de leitura
+            logger.debug(f"[SUCCESS] Contato adicionado da linha {row_idx}: {contact}")
+            yield contact
+
+        except Exception as e:
+            logger.error(f"Erro ao processar linha {row_idx}: {row}. Erro: {e}", exc_info=True)
+            continue
+
+
+def excel_sheet_names(file_path: str) -> List[str]:
+    """Nomes das abas da planilha, na ordem do arquivo"""
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        return list(workbook.sheetnames)
+    finally:
+        workbook.close()
+
+
+def resolve_sheet_names(file_path: str, sheets: Optional[List[str]] = None) -> List[str]:
+    """Abas a importar: ``sheets`` conferidas contra o arquivo, ou todas"""
+    available = excel_sheet_names(file_path)
+    if not sheets:
+        return available
+    missing = [name for name in sheets if name not in available]
+    if missing:
+        raise ValueError(f"Aba(s) não encontrada(s) na planilha: {', '.join(missing)}")
+    return list(sheets)
+
+
+def load_sheet_contacts(file_path: str, sheet_name: str) -> List[Dict[str, str]]:
+    """
+    Contatos de uma única aba. Roda nos processos do pool de importação:
+    cada processo abre o arquivo em modo read-only e lê só a sua aba.
+    """
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        return list(_read_contacts(workbook[sheet_name], sheet_name))
+    finally:
+        workbook.close()
+
+
+def load_contacts_from_excel(file_path: str, sheets: Optional[List[str]] = None,
+                             max_workers: Optional[int] = None) -> List[Dict[str, str]]:
     """
     Carrega os contatos de uma planilha Excel
     
-    Colunas esperadas:
+    Colunas esperadas (em cada aba):
     - Nome (opcional)
     - Numero (obrigatório)
     
+    Com várias abas, cada uma é lida em um processo separado e tem o seu
+    próprio cabeçalho; o resultado segue a ordem das abas e cada contato
+    recebe ``aba`` com o nome de origem. Abas sem a coluna Numero são
+    ignoradas (com aviso), a menos que nenhuma aba tenha contatos.
+    
+    Bloqueia até ler todas as abas: para scripts e CLI. No servidor use
+    ``JobManager.load_contacts``, que aguarda o pool sem travar o loop.
+    
     Args:
         file_path: Caminho para o arquivo Excel
+        sheets: Abas a importar (padrão: todas)
+        max_workers: Processos para leitura das abas (padrão: um por CPU)
         
     Returns:
         Lista de dicionários com os contatos
         
     Raises:
         FileNotFoundError: Se o arquivo não for encontrado
+        ValueError: Aba inexistente ou nenhuma aba com a coluna Numero
         Exception: Para outros erros de leitura
     """
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"Arquivo Excel não encontrado: {file_path}")
     
-    contacts = []
-    debug_logs = []
     logger = logging.getLogger(__name__)
     
     try:
-        workbook = load_workbook(file_path, read_only=True)
-        sheet = workbook.active
-        
-        # Encontrar cabeçalhos
-        headers = {}
-        first_row = next(sheet.iter_rows(min_row=1, max_row=1, values_only=True))
-        logger.info(f"Cabeçalho bruto lido da planilha: {first_row}")
-
-        for idx, header in enumerate(first_row):
-            if header:
-                header_lower = str(header).lower().strip()
-                logger.info(f"Processando cabeçalho: '{header}' -> '{header_lower}'")
-                if 'nome' in header_lower:
-                    headers['nome'] = idx
-                elif 'numero' in header_lower or 'telefone' in header_lower or 'phone' in header_lower:
-                    headers['numero'] = idx
-        
-        logger.info(f"Mapeamento de cabeçalhos final: {headers}")
-
-        # Verificar se campos obrigatórios foram encontrados
-        if 'numero' not in headers:
-            logger.error("A coluna 'Numero' é obrigatória e não foi encontrada nos cabeçalhos.")
-            raise ValueError("Coluna 'Numero' não encontrada na planilha. Verifique se o nome da coluna está correto.")
-        
-        logger.info(f"Cabeçalhos encontrados com sucesso: {headers}")
-        
-        # Ler dados
-        for row_idx, row in enumerate(sheet.iter_rows(min_row=2, values_only=True), start=2):
-            logger.debug(f"[DEBUG] Lendo linha {row_idx}: {row}")
-
-            # Pular linhas completamente vazias
-            if not any(row):
-                logger.debug(f"Linha {row_idx} ignorada: completamente vazia.")
-                continue
-
+        sheet_names = resolve_sheet_names(file_path, sheets)
+        results: Dict[str, Any] = {}
+        if len(sheet_names) == 1:
             try:
-                # Extrair dados da linha
-                raw_numero = row[headers['numero']]
-                logger.debug(f"[DEBUG] Linha {row_idx} - Valor bruto de 'numero': '{raw_numero}' (Tipo: {type(raw_numero)})")
-
-                numero = str(raw_numero).strip() if raw_numero is not None else ''
-                logger.debug(f"[DEBUG] Linha {row_idx} - Valor de 'numero' após strip: '{numero}'")
-                
-                # Pular linhas onde o número é efetivamente vazio
-                if not numero:
-                    logger.warning(f"Linha {row_idx} ignorada: 'numero' está vazio ou contém apenas espaços.")
-                    continue
-                
-                contact = {
-                    'numero': numero
-                }
-                
-                # Campo opcional: nome
-                if 'nome' in headers and row[headers.get('nome')] is not None:
-                    contact['nome'] = str(row[headers['nome']]).strip()
-                
-                contacts.append(contact)
-                logger.info(f"[SUCCESS] Contato adicionado da linha {row_idx}: {contact}")
-                
-            except Exception as e:
-                logger.error(f"Erro ao processar linha {row_idx}: {row}. Erro: {e}", exc_info=True)
+                results[sheet_names[0]] = load_sheet_contacts(file_path, sheet_names[0])
+            except ValueError as e:
+                results[sheet_names[0]] = e
+        else:
+            workers = min(len(sheet_names), max_workers or os.cpu_count() or 1)
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                futures = {name: pool.submit(load_sheet_contacts, file_path, name) for name in sheet_names}
+                for name, future in futures.items():
+                    try:
+                        results[name] = future.result()
+                    except ValueError as e:
+                        results[name] = e
+
+        contacts = []
+        errors = []
+        for name in sheet_names:
+            if isinstance(results[name], ValueError):
+                logger.warning(f"Aba '{name}' ignorada: {results[name]}")
+                errors.append(results[name])
                 continue
-        
-        workbook.close()
-        logger.info(f"Carregados {len(contacts)} contatos da planilha")
+            contacts.extend(results[name])
+            logger.info(f"Aba '{name}': {len(results[name])} contatos")
+
+        if errors and len(errors) == len(sheet_names):
+            raise errors[0]
+        logger.info(f"Carregados {len(contacts)} contatos da planilha ({len(sheet_names)} aba(s))")
         return contacts
         
     except Exception as e:
@@ -181,6 +261,44 @@ def load_contacts_from_excel(file_path: str) -> List[Dict[str, str]]:
         raise
 
 
+def iter_contact_batches(file_path: str, batch_size: int = 1000,
+                         on_total: Optional[Callable[[int], None]] = None,
+                         sheet_name: Optional[str] = None) -> Iterator[List[Dict[str, str]]]:
+    """
+    Lê uma aba da planilha em lotes, sem montar a lista inteira em memória
+    
+    Args:
+        file_path: Caminho para o arquivo Excel
+        batch_size: Contatos por lote
+        on_total: Recebe o total estimado de linhas de dados (dimensão da aba), se conhecido
+        sheet_name: Aba a ler (padrão: a aba ativa, sem ``aba`` nos contatos)
+        
+    Yields:
+        Listas de até ``batch_size`` contatos
+        
+    Raises:
+        FileNotFoundError: Se o arquivo não for encontrado
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Arquivo Excel não encontrado: {file_path}")
+
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        sheet = workbook[sheet_name] if sheet_name is not None else workbook.active
+        if on_total is not None and sheet.max_row:
+            on_total(max(sheet.max_row - 1, 0))
+        batch = []
+        for contact in _read_contacts(sheet, sheet_name):
+            batch.append(contact)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    finally:
+        workbook.close()
+
+
 def validate_phone_number(phone: str) -> Optional[str]:
     """
     Valida e formata um número de telefone para o padrão E.164 (+55DDDNumero).
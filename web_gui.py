@@ -6,15 +6,13 @@ Interface web moderna para envio em massa de mensagens com suporte a sequências
 
 import os
 import json
-import threading
 import logging
-import random
-import time
 from datetime import datetime
 from pathlib import Path
 import webbrowser
 
-from quart import Quart, render_template, request, jsonify, send_file, flash, redirect, url_for
+from quart import Quart, render_template, request, jsonify, send_file, flash, redirect, url_for, make_response
+from quart.utils import run_sync
 from werkzeug.utils import secure_filename
 
 # Configuração de logging no início do arquivo
@@ -24,12 +22,23 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(level
 from utils import (
     load_config,
     setup_logging,
-    load_contacts_from_excel,
     validate_phone_number,
     create_sample_excel
 )
-from api_sender import WhatsAppAPISender
 from whatsapp_web import whatsapp_manager
+from campaign_queue import CampaignQueue, CampaignQueueClient
+from campaign_planner import plan_campaign, historical_latency
+from sequence_compiler import compile_sequence, SequenceCompileError
+from media_optimizer import MediaOptimizer, optimization_summary
+from media_store import MediaStore
+from chunked_upload import ChunkedUploadManager, UploadError, MEDIA_EXTENSIONS
+from background_jobs import JobManager
+from loop_monitor import loop_monitor
+from async_storage import storage
+from template_repository import TemplateRepository
+from contact_table import ContactTable, VALID, INVALID, STATUS_LABELS, STATUS_CLASSES
+from browser_pool import waha_dashboard_pool
+from monitor_history import MonitorHistoryStore, DEFAULT_HISTORY_FILE
 import base64
 import asyncio
 import aiohttp
@@ -43,27 +52,27 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max
 # Criar pasta de uploads se não existir
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Mídias endereçadas por conteúdo (sha256), com referências de templates e campanhas
+media_store = MediaStore(os.path.join(app.config['UPLOAD_FOLDER'], 'media'))
+MEDIA_GC_INTERVAL = 3600  # segundos entre limpezas de mídias sem referência
+
+# Uploads em partes (planilhas e mídias grandes), retomáveis após queda de conexão
+upload_manager = ChunkedUploadManager(os.path.join(app.config['UPLOAD_FOLDER'], 'incoming'))
+
+# Importação/validação de contatos em processos separados (?async=1)
+job_manager = JobManager()
+
 # Criar pasta para templates se não existir
 TEMPLATES_FOLDER = 'templates_saved'
 os.makedirs(TEMPLATES_FOLDER, exist_ok=True)
+template_repository = TemplateRepository(TEMPLATES_FOLDER, storage)
 
 # Variáveis globais para estado da aplicação
 app_state = {
     'config': None,
-    'contacts': [],
-    'valid_contacts': [],
-    'invalid_contacts': [],
+    'contacts': ContactTable(),  # Contatos carregados; válidos/inválidos pelo status de cada linha
     'sender': None,
-    'sending_active': False,
-    'send_progress': {
-        'current': 0,
-        'total': 0,
-        'success': 0,
-        'error': 0,
-        'current_contact': '',
-        'current_message': 1,
-        'sequence_length': 1
-    },
+    'start_job': None,  # Job que otimiza as mídias antes de enfileirar a campanha
     'logs': [],
     'message_config': {
         'sequence': [],
@@ -136,16 +145,37 @@ async def debug_status():
 
 @app.route('/api/whatsapp/status')
 async def whatsapp_status():
-    """Verifica e retorna o status da conexão com o WhatsApp Web."""
+    """Retorna o status da conexão com o WhatsApp Web (leitura do estado em cache)."""
     try:
-        # Chama o método que verifica o estado da conexão
-        status = await whatsapp_manager.check_connection_status_periodically()
-        return jsonify(status)
+        # O observador em segundo plano mantém o estado atualizado
+        return jsonify(whatsapp_manager.get_connection_status())
     except Exception as e:
-        logger.error(f"Error checking WhatsApp status: {e}", exc_info=True)
+        logging.error(f"Error checking WhatsApp status: {e}", exc_info=True)
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@app.route('/api/whatsapp/status/stream')
+async def whatsapp_status_stream():
+    """Server-Sent Events com cada mudança de status do WhatsApp Web."""
+    queue = whatsapp_manager.subscribe()
+
+    async def event_stream():
+        try:
+            yield f"data: {json.dumps(whatsapp_manager.get_connection_status())}\n\n"
+            while True:
+                event = await queue.get()
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            whatsapp_manager.unsubscribe(queue)
+
+    response = await make_response(event_stream(), {
+        'Content-Type': 'text/event-stream',
+        'Cache-Control': 'no-cache'
+    })
+    response.timeout = None
+    return response
+
+
 @app.route('/api/status')
 def api_status():
     """Retorna status atual do sistema"""
@@ -155,10 +185,9 @@ def api_status():
         status = {
             'config_ok': app_state['config'] is not None,
             'contacts_loaded': len(app_state['contacts']),
-            'contacts_valid': len(app_state['valid_contacts']),
+            'contacts_valid': app_state['contacts'].valid_count,
             'message_configured': len(sequence) > 0,
-            'sending_active': app_state['sending_active'],
-            'send_progress': app_state['send_progress'],
+            **campaign_queue.status(),
             'sequence_length': len(sequence)
         }
         
@@ -171,20 +200,20 @@ def api_status():
 def api_contacts_preview():
     """Retorna preview dos contatos com informações de sequência e status."""
     # Inicializar stats para garantir que exista mesmo em caso de erro
+    table = app_state['contacts']
     stats = {
-        'loaded': len(app_state.get('contacts', [])),
-        'valid': len(app_state.get('valid_contacts', [])),
-        'invalid': len(app_state.get('invalid_contacts', []))
+        'loaded': len(table),
+        'valid': table.valid_count,
+        'invalid': table.invalid_count
     }
 
     try:
-        # Se a validação já ocorreu, usar a lista de válidos, senão, a lista completa
-        if app_state['valid_contacts'] or app_state['invalid_contacts']:
-            contacts_to_show = sorted(app_state['valid_contacts'], key=lambda c: c.get('id', 0))
+        # Se a validação já ocorreu, usar os válidos (já em ordem de id), senão, todos
+        validated = table.validated
+        if validated:
+            contacts_to_show = list(table.indices(VALID))
         else:
-            contacts_to_show = app_state.get('contacts', [])
-            stats['valid'] = 0
-            stats['invalid'] = 0
+            contacts_to_show = range(len(table))
         
         # Obter sequência de mensagens
         sequence = app_state.get('message_config', {}).get('sequence', [])
@@ -204,16 +233,16 @@ def api_contacts_preview():
             caminho_midia = ""
         
         preview_contacts = []
-        limit = None if (app_state['valid_contacts'] or app_state['invalid_contacts']) else 20
+        limit = None if validated else 20
         
-        for contact in contacts_to_show[:limit]:
-            nome = contact.get('nome', fallback_name)
-            numero = contact.get('numero', '')
-            status = contact.get('status', 'Não Validado')
-            status_class = contact.get('status_class', 'warning')
+        for index in contacts_to_show[:limit]:
+            nome = table.nome(index) or fallback_name
+            numero = table.numero(index)
+            status = STATUS_LABELS[table.status(index)]
+            status_class = STATUS_CLASSES[table.status(index)]
             preview_message = preview_content.replace('{{nome}}', nome).replace('{nome}', nome)
             preview_contacts.append({
-                'id': contact.get('id'),
+                'id': index,
                 'nome': nome,
                 'numero': numero,
                 'mensagem': preview_message,
@@ -267,6 +296,7 @@ async def api_save_message():
             'fallback_name': data.get('fallback_name', 'amigo(a)')
         }
         
+        await storage.run(media_store.set_sequence_refs, 'sequence:current', sequence)
         add_log(f"💬 Sequência de {len(sequence)} mensagens salva")
         
         return jsonify({'success': True, 'message': f'Sequência de {len(sequence)} mensagens salva com sucesso!'})
@@ -302,9 +332,8 @@ async def api_save_config():
             if not config_data.get(field):
                 return jsonify({'success': False, 'error': f'Campo {field} é obrigatório'})
         
-        # Salvar no config.json
-        with open('config.json', 'w', encoding='utf-8') as f:
-            json.dump(config_data, f, indent=2, ensure_ascii=False)
+        # Salvar no config.json (gravação atômica, fora do event loop)
+        await storage.write_json('config.json', config_data)
         
         # Atualizar estado
         app_state['config'] = config_data
@@ -354,11 +383,9 @@ async def get_qr_code():
 
 @app.route('/api/whatsapp/status')
 async def get_whatsapp_status():
-    """Verifica e retorna o status da conexão com o WhatsApp Web."""
+    """Retorna o status da conexão com o WhatsApp Web (leitura do estado em cache)."""
     try:
-        # This now calls the periodic check, which updates the status internally
-        status = await whatsapp_manager.check_connection_status_periodically()
-        return jsonify(status)
+        return jsonify(whatsapp_manager.get_connection_status())
     except Exception as e:
         logging.error(f"Erro ao verificar status do WhatsApp: {e}")
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -372,6 +399,84 @@ async def api_config():
         return await api_save_config()
 
 
+def _requested_sheets(value):
+    """Abas pedidas pelo cliente (lista ou texto separado por vírgulas); None = todas"""
+    if isinstance(value, str):
+        value = value.split(',')
+    sheets = [str(name).strip() for name in value or [] if str(name).strip()]
+    return sheets or None
+
+
+def _build_contacts(rows):
+    """Montagem da tabela e do JSON de resposta: roda fora do event loop"""
+    contacts = ContactTable(rows)
+    return contacts, contacts.to_dicts()
+
+
+async def _load_contacts_file(filepath: Path, filename: str, sheets=None):
+    """Carrega os contatos da planilha já gravada em disco e remove o arquivo"""
+    try:
+        # Limpar completamente o estado dos contatos antes de carregar novos
+        app_state['contacts'] = ContactTable()
+
+        # Processar contatos: abas lidas em paralelo no pool de processos, sem travar o loop
+        rows = await job_manager.load_contacts(str(filepath), sheets)
+        contacts, contact_dicts = await asyncio.get_running_loop().run_in_executor(None, _build_contacts, rows)
+
+        app_state['contacts'] = contacts
+        add_log(f"📋 {len(contacts)} contatos carregados da planilha: {filename}")
+        logging.debug("Finalizado o upload de contatos.")
+
+        return jsonify({
+            'success': True,
+            'message': f'{len(contacts)} contatos carregados com sucesso!',
+            'contacts': contact_dicts,
+            'stats': {
+                'total': len(contacts),
+                'valid': 0,  # Validação ainda não foi feita
+                'invalid': 0,
+                'sheets': contacts.sheet_counts()
+            }
+        })
+    except FileNotFoundError:
+        error_msg = f"Erro ao processar planilha: Arquivo Excel não encontrado em {filepath}"
+        add_log(f"❌ {error_msg}")
+        return jsonify({'success': False, 'error': error_msg})
+    except Exception as e:
+        # Captura outras exceções, incluindo erros de openpyxl
+        error_msg = f"Erro ao processar planilha: {str(e)}"
+        add_log(f"❌ {error_msg}")
+        return jsonify({'success': False, 'error': error_msg})
+    finally:
+        # Garantir que o arquivo temporário seja removido após o processamento
+        if filepath.exists():
+            os.remove(filepath)
+
+
+def _start_import_job(filepath: Path, filename: str, sheets=None):
+    """Importa a planilha em segundo plano; os contatos entram no estado em lotes"""
+    app_state['contacts'] = ContactTable()
+
+    async def work(job):
+        try:
+            result = await job_manager.import_contacts(job, str(filepath), app_state['contacts'].extend, sheets)
+        except Exception as e:
+            add_log(f"❌ Erro ao processar planilha: {str(e)}")
+            raise
+        finally:
+            if filepath.exists():
+                os.remove(filepath)
+        for name, error in result['skipped'].items():
+            add_log(f"⚠️ Aba '{name}' ignorada: {error}")
+        add_log(f"📋 {result['total']} contatos carregados da planilha: {filename}")
+        return {'total': result['total'], 'valid': 0, 'invalid': 0,
+                'sheets': result['sheets'], 'skipped': result['skipped']}
+
+    job = job_manager.submit('import_contacts', work, filename)
+    add_log(f"⏳ Importação de {filename} iniciada em segundo plano")
+    return jsonify({'success': True, 'job_id': job.id, 'message': 'Importação iniciada'})
+
+
 @app.route('/api/upload_contacts', methods=['POST'])
 async def api_upload_contacts():
     logging.debug("Iniciando o upload de contatos...")
@@ -403,45 +508,12 @@ async def api_upload_contacts():
             add_log(f"❌ {error_msg}")
             return jsonify({'success': False, 'error': error_msg})
 
-        try:
-            # Limpar completamente o estado dos contatos antes de carregar novos
-            app_state['contacts'] = []
-            app_state['valid_contacts'] = []
-            app_state['invalid_contacts'] = []
-
-            # Processar contatos
-            contacts = load_contacts_from_excel(str(filepath))
-
-            app_state['contacts'] = contacts
-            add_log(f"📋 {len(contacts)} contatos carregados da planilha: {filename}")
-            logging.debug("Finalizado o upload de contatos.")
-
-            return jsonify({
-                'success': True,
-                'message': f'{len(contacts)} contatos carregados com sucesso!',
-                'contacts': contacts,
-                'stats': {
-                    'total': len(contacts),
-                    'valid': 0,  # Validação ainda não foi feita
-                    'invalid': 0
-                }
-            })
-        except FileNotFoundError:
-            error_msg = f"Erro ao processar planilha: Arquivo Excel não encontrado em {filepath}"
-            add_log(f"❌ {error_msg}")
-            return jsonify({'success': False, 'error': error_msg})
-        except Exception as e:
-            # Captura outras exceções, incluindo erros de openpyxl
-            error_msg = f"Erro ao processar planilha: {str(e)}"
-            add_log(f"❌ {error_msg}")
-            return jsonify({'success': False, 'error': error_msg})
-        finally:
-            # Garantir que o arquivo temporário seja removido após o processamento
-            if filepath.exists():
-                os.remove(filepath)
-        
+        # Abas a importar (?sheets=Turma A,Turma B); padrão: todas
+        sheets = _requested_sheets(request.args.get('sheets'))
+        if request.args.get('async') == '1':
+            return _start_import_job(filepath, filename, sheets)
+        return await _load_contacts_file(filepath, filename, sheets)
 
-        
     except Exception as e:
         error_msg = f"Erro ao processar planilha: {str(e)}"
         add_log(f"❌ {error_msg}")
@@ -459,45 +531,27 @@ async def api_update_valid_contact(contact_id):
         if not new_name or not new_number:
             return jsonify({'success': False, 'error': 'Nome e número são obrigatórios.'}), 400
 
-        # Encontrar o contato na lista principal (fonte da verdade)
-        contact_to_update = next((c for c in app_state['contacts'] if c.get('id') == contact_id), None)
-
-        if not contact_to_update:
+        # Encontrar o contato na tabela (id = posição)
+        table = app_state['contacts']
+        if contact_id not in table:
             return jsonify({'success': False, 'error': 'Contato não encontrado.'}), 404
 
-        # Atualizar dados no contato principal
-        contact_to_update['nome'] = new_name
-        contact_to_update['numero'] = new_number
-
-        # Revalidar o número
-        is_valid_now = validate_phone_number(new_number)
+        # Atualizar dados e revalidar o número
+        table.update(contact_id, new_name, new_number)
+        table.set_validation(contact_id, validate_phone_number(new_number))
 
-        # Atualizar as listas de válidos e inválidos
-        app_state['valid_contacts'] = [c for c in app_state['valid_contacts'] if c.get('id') != contact_id]
-        app_state['invalid_contacts'] = [c for c in app_state['invalid_contacts'] if c.get('id') != contact_id]
-
-        if is_valid_now:
-            contact_to_update['status'] = 'Válido'
-            contact_to_update['status_class'] = 'success'
-            app_state['valid_contacts'].append(contact_to_update)
+        if table.status(contact_id) == VALID:
             add_log(f"🔄 Contato ID {contact_id} atualizado e validado com sucesso.")
         else:
-            contact_to_update['status'] = 'Inválido'
-            contact_to_update['status_class'] = 'danger'
-            app_state['invalid_contacts'].append(contact_to_update)
             add_log(f"🔄 Contato ID {contact_id} atualizado e agora é inválido.")
 
-        # Ordenar listas para manter consistência, se necessário (opcional)
-        app_state['valid_contacts'].sort(key=lambda c: c.get('id', 0))
-        app_state['invalid_contacts'].sort(key=lambda c: c.get('id', 0))
-
         return jsonify({
             'success': True,
-            'contact': contact_to_update,
+            'contact': table.to_dict(contact_id),
             'stats': {
-                'total': len(app_state['contacts']),
-                'valid': len(app_state['valid_contacts']),
-                'invalid': len(app_state['invalid_contacts'])
+                'total': len(table),
+                'valid': table.valid_count,
+                'invalid': table.invalid_count
             }
         })
 
@@ -507,58 +561,66 @@ async def api_update_valid_contact(contact_id):
         return jsonify({'success': False, 'error': error_msg}), 500
 
 
+def _start_validation_job():
+    """Valida os números no pool de processos, aplicando o resultado em lotes"""
+    table = app_state['contacts']
+    table.reset_validation()
+
+    def apply(start, formatted_numbers):
+        for offset, formatted_number in enumerate(formatted_numbers):
+            table.set_validation(start + offset, formatted_number)
+
+    async def work(job):
+        await job_manager.validate_numbers(job, table.raw_numbers(), apply)
+        add_log(f"✅ Validação e formatação concluídas: {table.valid_count} válidos, {table.invalid_count} inválidos")
+        return {'total': len(table), 'valid': table.valid_count, 'invalid': table.invalid_count}
+
+    job = job_manager.submit('validate_contacts', work, f"{len(table)} contatos")
+    return jsonify({'success': True, 'job_id': job.id, 'message': 'Validação iniciada'})
+
+
 @app.route('/api/validate_contacts', methods=['POST'])
-def api_validate_contacts():
+async def api_validate_contacts():
+    """Validar e formatar números de telefone (?async=1 roda como job em segundo plano)"""
+    if request.args.get('async') == '1':
+        if not app_state['contacts']:
+            return jsonify({'success': False, 'error': 'Nenhum contato carregado para validar.'})
+        return _start_validation_job()
+    return await run_sync(_validate_contacts)()
+
+
+def _validate_contacts():
     """Validar e formatar números de telefone, e atualizar estado global"""
+    table = app_state['contacts']
     try:
-        if not app_state.get('contacts'):
+        if not table:
             return jsonify({'success': False, 'error': 'Nenhum contato carregado para validar.'})
 
-        app_state['valid_contacts'] = []
-        app_state['invalid_contacts'] = []
-
-        for index, contact in enumerate(app_state['contacts']):
-            contact['id'] = index
-            original_number = str(contact.get('numero', ''))
-            
-            formatted_number = validate_phone_number(original_number)
-            
-            if formatted_number:
-                contact['numero'] = formatted_number
-                contact['status'] = 'Válido'
-                contact['status_class'] = 'success'
-                app_state['valid_contacts'].append(contact)
-            else:
-                contact['status'] = 'Inválido'
-                contact['status_class'] = 'danger'
-                app_state['invalid_contacts'].append(contact)
+        table.reset_validation()
+        for index, number in enumerate(table.raw_numbers()):
+            table.set_validation(index, validate_phone_number(number))
         
-        valid_count = len(app_state['valid_contacts'])
-        invalid_count = len(app_state['invalid_contacts'])
+        valid_count = table.valid_count
+        invalid_count = table.invalid_count
         
         add_log(f"✅ Validação e formatação concluídas: {valid_count} válidos, {invalid_count} inválidos")
         
-        # Retornar todos os contatos com o novo status para a UI
-        all_contacts = app_state['valid_contacts'] + app_state['invalid_contacts']
-        # Ordenar por ID para manter a ordem original
-        all_contacts.sort(key=lambda x: x['id'])
-
+        # Retornar todos os contatos com o novo status para a UI (em ordem de id)
         return jsonify({
             'success': True,
             'stats': {
-                'total': len(app_state['contacts']),
+                'total': len(table),
                 'valid': valid_count,
                 'invalid': invalid_count
             },
-            'contacts': all_contacts,
+            'contacts': table.to_dicts(),
             'message': f'Validação concluída: {valid_count} válidos, {invalid_count} inválidos.'
         })
         
     except Exception as e:
         error_msg = f"Erro durante a validação dos contatos: {str(e)}"
         add_log(f"❌ {error_msg}")
-        app_state['valid_contacts'] = []
-        app_state['invalid_contacts'] = []
+        table.reset_validation()
         return jsonify({'success': False, 'error': error_msg})
 
 
@@ -576,38 +638,28 @@ async def api_update_contact():
         if contact_id is None:
             return jsonify({'success': False, 'error': 'ID do contato não fornecido'}), 400
 
-        # Encontrar o contato na lista principal
-        contact_to_update = next((c for c in app_state['contacts'] if c.get('id') == contact_id), None)
-
-        if not contact_to_update:
+        # Encontrar o contato na tabela (id = posição)
+        table = app_state['contacts']
+        if contact_id not in table:
             return jsonify({'success': False, 'error': 'Contato não encontrado'}), 404
 
-        # Atualizar dados
-        contact_to_update['nome'] = new_name
-        contact_to_update['numero'] = new_number
-
-        # Revalidar o contato
+        # Atualizar dados e revalidar o contato
+        table.update(contact_id, new_name, new_number)
         is_valid_now = validate_phone_number(new_number)
-
-        # Atualizar listas de válidos/inválidos
-        # Remover de ambas as listas primeiro para evitar duplicatas
-        app_state['valid_contacts'] = [c for c in app_state['valid_contacts'] if c.get('id') != contact_id]
-        app_state['invalid_contacts'] = [c for c in app_state['invalid_contacts'] if c.get('id') != contact_id]
+        table.set_validation(contact_id, is_valid_now)
 
         if is_valid_now:
-            app_state['valid_contacts'].append(contact_to_update)
             add_log(f"🔄 Contato {contact_id} atualizado e agora é VÁLIDO.")
         else:
-            app_state['invalid_contacts'].append(contact_to_update)
             add_log(f"🔄 Contato {contact_id} atualizado e continua INVÁLIDO.")
 
         return jsonify({
             'success': True,
             'is_valid': is_valid_now,
             'stats': {
-                'total': len(app_state['contacts']),
-                'valid': len(app_state['valid_contacts']),
-                'invalid': len(app_state['invalid_contacts'])
+                'total': len(table),
+                'valid': table.valid_count,
+                'invalid': table.invalid_count
             }
         })
 
@@ -623,12 +675,126 @@ def api_get_invalid_contacts():
     try:
         return jsonify({
             'success': True,
-            'contacts': app_state.get('invalid_contacts', [])
+            'contacts': app_state['contacts'].to_dicts(app_state['contacts'].indices(INVALID))
         })
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
+def _select_contacts(contact_ids):
+    """Índices dos contatos válidos com os IDs informados (todos os válidos se nenhum ID for informado)"""
+    table = app_state['contacts']
+    if not contact_ids:
+        return list(table.indices(VALID))
+    # Converter contact_ids para inteiros para comparação correta
+    selected = []
+    for cid in contact_ids:
+        try:
+            index = int(cid)
+        except (ValueError, TypeError):
+            continue
+        if index in table and table.status(index) == VALID:
+            selected.append(index)
+    return sorted(set(selected))
+
+
+def _parse_plan_time(value):
+    """Aceita ISO 8601 ou "HH:MM" (hoje); None se vazio"""
+    if not value:
+        return None
+    if len(value) <= 5 and ':' in value:
+        hour, minute = value.split(':')
+        return datetime.now().replace(hour=int(hour), minute=int(minute), second=0, microsecond=0)
+    return datetime.fromisoformat(value)
+
+
+def _plan_blocking(contacts, start=None, window_end=None):
+    config = app_state['config']
+    return plan_campaign(len(contacts), app_state['message_config'].get('sequence', []), config,
+                         app_state['message_config'], start, window_end,
+                         historical_latency(config, campaign_queue.queue))
+
+
+async def _plan_for(contacts, start=None, window_end=None):
+    """Estimativa da campanha com a latência medida nas campanhas anteriores (SQLite e cálculo fora do loop)"""
+    return await asyncio.get_running_loop().run_in_executor(None, _plan_blocking, contacts, start, window_end)
+
+
+@app.route('/api/campaigns/plan', methods=['GET', 'POST'])
+async def api_campaign_plan():
+    """Estimar duração, término e mensagens/hora antes de iniciar o envio"""
+    try:
+        data = (await request.get_json(silent=True)) or {}
+        params = {**request.args.to_dict(), **data}
+
+        if not app_state['config']:
+            return jsonify({'success': False, 'error': 'Configure a API primeiro'})
+        if not app_state['message_config'].get('sequence'):
+            return jsonify({'success': False, 'error': 'Configure a sequência de mensagens primeiro'})
+
+        contact_ids = params.get('contact_ids')
+        if isinstance(contact_ids, str):
+            contact_ids = contact_ids.split(',')
+        contacts = _select_contacts(contact_ids)
+
+        try:
+            start = _parse_plan_time(params.get('start_at'))
+            window_end = _parse_plan_time(params.get('window_end'))
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Horário inválido (use ISO 8601 ou HH:MM)'}), 400
+
+        plan = await _plan_for(contacts, start, window_end)
+        return jsonify({'success': True, 'plan': plan})
+
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+async def _optimize_sequence(optimizer, sequence):
+    """
+    Otimiza as mídias (pool de processos, aguardado numa thread) e registra
+    os derivados no MediaStore: referenciados pela campanha, eles são
+    limpos pelo gc() como as demais mídias
+    """
+    loop = asyncio.get_running_loop()
+    sequence = await loop.run_in_executor(None, optimizer.optimize_sequence, sequence)
+    for message in sequence:
+        if message.get('original_path') and message['path'] != message['original_path']:
+            record = await loop.run_in_executor(None, media_store.register, message['path'])
+            message['path'] = record['path']
+    saved = optimization_summary(sequence)
+    if saved['original_bytes']:
+        add_log(f"🗜️ Mídias otimizadas: {saved['original_bytes'] / 1024 / 1024:.1f}MB → "
+                f"{saved['optimized_bytes'] / 1024 / 1024:.1f}MB por contato")
+    return sequence
+
+
+async def _enqueue_campaign(contacts, sequence):
+    """
+    Valida a sequência, estima e enfileira a campanha para o sender_worker
+
+    Raises:
+        SequenceCompileError: Sequência inválida (mídias, textos, endpoints)
+    """
+    compiled = compile_sequence(sequence, app_state['config'])
+
+    # A campanha é enfileirada com a estimativa para comparação
+    plan = await _plan_for(contacts)
+    campaign_id = await storage.run(campaign_queue.start, contacts, sequence, app_state['config'],
+                                    app_state['message_config'], plan)
+    # Mídias da campanha não podem ser limpas enquanto ela existir; o worker libera ao concluir
+    await storage.run(media_store.set_sequence_refs, f'campaign:{campaign_id}', sequence)
+
+    add_log(f"🚀 Iniciando envio: {len(sequence)} mensagens para {len(contacts)} contatos selecionados")
+    summary = compiled.summary()
+    if summary['media_steps']:
+        add_log(f"📎 {summary['media_steps']} mídia(s) verificada(s), "
+                f"{summary['media_bytes'] / 1024 / 1024:.1f}MB por contato")
+    add_log(f"🧮 Estimativa: {plan['estimated_duration']} ({plan['messages_per_hour']} msg/h), "
+            f"término previsto {plan['estimated_completion'][11:16]}")
+    return plan
+
+
 @app.route('/api/start_sending', methods=['POST'])
 async def api_start_sending():
     """Iniciar envio de sequência de mensagens para contatos selecionados"""
@@ -639,343 +805,123 @@ async def api_start_sending():
         if not app_state['config']:
             return jsonify({'success': False, 'error': 'Configure a API primeiro'})
 
-        if not app_state['valid_contacts']:
+        if not app_state['contacts'].valid_count:
             return jsonify({'success': False, 'error': 'Carregue e valide os contatos primeiro'})
 
         sequence = app_state['message_config'].get('sequence', [])
         if not sequence:
             return jsonify({'success': False, 'error': 'Configure a sequência de mensagens primeiro'})
 
-        if app_state['sending_active']:
+        start_job = app_state['start_job']
+        if (start_job is not None and not start_job.finished) or \
+                await storage.run(lambda: campaign_queue.is_running):
             return jsonify({'success': False, 'error': 'Envio já está em andamento'})
 
-        # Filtrar contatos a serem enviados
-        if contact_ids:
-            # Converter contact_ids para inteiros para comparação correta
-            contact_ids_int = []
-            for cid in contact_ids:
-                try:
-                    contact_ids_int.append(int(cid))
-                except (ValueError, TypeError):
-                    continue
-            contacts_to_send = [c for c in app_state['valid_contacts'] if c.get('id') in contact_ids_int]
-        else:
-            # Se nenhum ID for fornecido, enviar para todos os válidos (comportamento padrão)
-            contacts_to_send = app_state['valid_contacts']
-
+        contacts_to_send = _select_contacts(contact_ids)
         if not contacts_to_send:
             return jsonify({'success': False, 'error': 'Nenhum contato válido selecionado para envio.'})
 
-        total_messages = len(contacts_to_send) * len(sequence)
-
-        app_state['send_progress'] = {
-            'current': 0,
-            'total': total_messages,
-            'success': 0,
-            'error': 0,
-            'current_contact': '',
-            'current_message': 1,
-            'sequence_length': len(sequence)
-        }
+        # Otimização opcional das mídias (ffmpeg pode levar minutos): job em segundo
+        # plano, e a campanha só entra na fila quando ela termina
+        optimizer = MediaOptimizer.from_config(app_state['config'])
+        if optimizer is not None:
+            contacts = app_state['contacts'].campaign_contacts(contacts_to_send)
 
-        app_state['sending_active'] = True
+            async def work(job):
+                try:
+                    optimized = await _optimize_sequence(optimizer, sequence)
+                    plan = await _enqueue_campaign(contacts, optimized)
+                except SequenceCompileError as e:
+                    for problem in e.problems:
+                        add_log(f"❌ {problem}")
+                    raise
+                except Exception as e:
+                    add_log(f"❌ Erro ao preparar o envio: {str(e)}")
+                    raise
+                return {'plan': plan}
 
-        # Passar a lista de contatos para a thread
-        send_thread = threading.Thread(target=send_messages_thread, args=(contacts_to_send,))
-        send_thread.daemon = True
-        send_thread.start()
+            app_state['start_job'] = job_manager.submit('start_campaign', work, f"{len(contacts)} contatos")
+            add_log("🗜️ Otimizando mídias; o envio começa em seguida")
+            return jsonify({'success': True, 'message': 'Otimizando mídias; o envio começa em seguida',
+                            'job_id': app_state['start_job'].id})
 
-        add_log(f"🚀 Iniciando envio: {len(sequence)} mensagens para {len(contacts_to_send)} contatos selecionados")
+        try:
+            plan = await _enqueue_campaign(app_state['contacts'].campaign_contacts(contacts_to_send), sequence)
+        except SequenceCompileError as e:
+            for problem in e.problems:
+                add_log(f"❌ {problem}")
+            return jsonify({'success': False, 'error': f'Sequência inválida: {e}', 'problems': e.problems})
 
-        return jsonify({'success': True, 'message': 'Envio iniciado!'})
+        return jsonify({'success': True, 'message': 'Envio iniciado!', 'plan': plan})
 
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
 @app.route('/api/stop_sending', methods=['POST'])
-def api_stop_sending():
-    """Parar envio"""
+async def api_stop_sending():
+    """Parar envio (a posição atual fica salva para retomada)"""
     try:
-        app_state['sending_active'] = False
+        await storage.run(campaign_queue.stop)
+        add_log("⏹️ Envio parado pelo usuário")
+        return jsonify({'success': True, 'message': 'Envio parado'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
+@app.route('/api/pause_sending', methods=['POST'])
+async def api_pause_sending():
+    """Pausar envio sem encerrar a campanha"""
+    try:
+        if not await storage.run(campaign_queue.pause):
+            return jsonify({'success': False, 'error': 'Nenhum envio em andamento'})
         add_log("⏸️ Envio pausado pelo usuário")
         return jsonify({'success': True, 'message': 'Envio pausado'})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
+@app.route('/api/resume_sending', methods=['POST'])
+async def api_resume_sending():
+    """Retomar envio pausado ou parado a partir do (contato, passo) onde parou"""
+    try:
+        position = await storage.run(campaign_queue.resume)
+        if position is None:
+            return jsonify({'success': False, 'error': 'Nenhum envio para retomar'})
+        contact_idx, step_idx = position
+        add_log(f"▶️ Envio retomado do contato {contact_idx + 1}, mensagem {step_idx + 1}")
+        return jsonify({'success': True, 'message': 'Envio retomado'})
+    except Exception as e:
+        return jsonify({'success': False, 'error': str(e)})
+
+
 @app.route('/api/logs')
 def api_logs():
     """Obter logs do sistema"""
     try:
+        campaign_queue.pull_logs()
         return jsonify({'success': True, 'logs': app_state['logs']})
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
 @app.route('/api/create_sample')
-def api_create_sample():
+async def api_create_sample():
     """Criar planilha de exemplo"""
     try:
         sample_path = 'sample_contacts.xlsx'
-        create_sample_excel(sample_path)
+        await storage.write_file(sample_path, create_sample_excel)
         
         add_log("📋 Planilha de exemplo criada")
         
-        return send_file(sample_path, as_attachment=True, download_name='sample_contacts.xlsx')
+        return await send_file(sample_path, as_attachment=True, attachment_filename='sample_contacts.xlsx')
     except Exception as e:
         return jsonify({'success': False, 'error': str(e)})
 
 
-def send_messages_thread(contacts_to_send):
-    """Thread para envio de sequência de mensagens com intervalos ultra-humanizados"""
-    try:
-        app_state['sender'] = WhatsAppAPISender(app_state['config'])
-        
-        sequence = app_state['message_config'].get('sequence', [])
-        base_sequence_interval = int(app_state['message_config'].get('interval', 10))
-        
-        if not sequence:
-            add_log("❌ Nenhuma sequência de mensagens configurada")
-            app_state['sending_active'] = False
-            return
-        
-        total_messages = len(contacts_to_send) * len(sequence)
-        
-        add_log(f"🚀 Thread de envio iniciada para {len(contacts_to_send)} contatos.")
-        
-        # Perfis de comportamento humano
-        behavior_profiles = {
-            'conservador': {'base_mult': 1.5, 'variance': 0.4, 'fatigue_factor': 1.1},
-            'normal': {'base_mult': 1.0, 'variance': 0.6, 'fatigue_factor': 1.2},
-            'agressivo': {'base_mult': 0.7, 'variance': 0.8, 'fatigue_factor': 1.3}
-        }
-        
-        # Selecionar perfil aleatório
-        profile_name = random.choice(list(behavior_profiles.keys()))
-        profile = behavior_profiles[profile_name]
-        add_log(f"🎭 Perfil de comportamento: {profile_name}")
-        
-        message_count = 0
-        session_start_time = time.time()
-        
-        for contact_idx, contact in enumerate(contacts_to_send):
-            if not app_state['sending_active']:
-                add_log("⏸️ Envio pausado pelo usuário")
-                break
-            
-            numero = contact['numero']
-            nome = contact.get('nome', app_state['message_config']['fallback_name'])
-            
-            add_log(f"👤 Processando {nome} ({numero}) - Sequência de {len(sequence)} mensagens")
-            
-            # Simular "pensamento" antes de iniciar contato
-            if contact_idx > 0:  # Não na primeira vez
-                thinking_time = random.uniform(1, 4)
-                add_log(f"🤔 Preparando próximo contato... {thinking_time:.1f}s")
-                time.sleep(thinking_time)
-            
-            # Enviar cada mensagem da sequência para este contato
-            for msg_idx, message in enumerate(sequence):
-                if not app_state['sending_active']:
-                    break
-                
-                message_count += 1
-                
-                # Atualizar progresso
-                app_state['send_progress']['current'] = message_count
-                app_state['send_progress']['current_contact'] = f"{nome} ({numero})"
-                app_state['send_progress']['current_message'] = msg_idx + 1
-                
-                # Simular "digitação" ou "preparação" da mensagem
-                if msg_idx > 0:  # Não na primeira mensagem do contato
-                    prep_time = random.uniform(0.5, 2.5)
-                    if random.random() < 0.15:  # 15% chance de pausar mais (hesitação)
-                        prep_time += random.uniform(1, 3)
-                        add_log(f"⏸️ Hesitando... {prep_time:.1f}s")
-                    time.sleep(prep_time)
-                
-                try:
-                    success = False
-                    
-                    if message['type'] == 'text':
-                        # Mensagem de texto
-                        texto = message['content'].replace('{nome}', nome)
-                        add_log(f"📤 Enviando mensagem {msg_idx + 1}/{len(sequence)} (texto) para {nome}")
-                        
-                        # Simular tempo de digitação baseado no tamanho da mensagem
-                        typing_time = len(texto) * random.uniform(0.02, 0.08)  # ~20-80ms por caractere
-                        typing_time = min(typing_time, 5)  # Máximo 5 segundos
-                        if typing_time > 1:
-                            add_log(f"⌨️ Digitando... {typing_time:.1f}s")
-                            time.sleep(typing_time)
-                        
-                        success = app_state['sender'].send_message(numero, texto, '')
-                        
-                    elif message['type'] == 'media':
-                        # Mensagem de mídia
-                        caminho_midia = message['path']
-                        legenda = message.get('caption', '').replace('{nome}', nome) if message.get('caption') else ''
-                        
-                        add_log(f"📤 Enviando mensagem {msg_idx + 1}/{len(sequence)} ({message['mediaType']}) para {nome}")
-                        
-                        # Simular tempo de seleção/upload de mídia
-                        media_time = random.uniform(2, 6)
-                        add_log(f"📎 Preparando mídia... {media_time:.1f}s")
-                        time.sleep(media_time)
-                        
-                        success = app_state['sender'].send_message(numero, legenda, caminho_midia)
-                    
-                    if success:
-                        app_state['send_progress']['success'] += 1
-                        add_log(f"✅ Mensagem {msg_idx + 1} enviada para {nome}")
-                    else:
-                        app_state['send_progress']['error'] += 1
-                        add_log(f"❌ Falha na mensagem {msg_idx + 1} para {nome}")
-                
-                except Exception as e:
-                    app_state['send_progress']['error'] += 1
-                    add_log(f"❌ Erro na mensagem {msg_idx + 1} para {nome}: {str(e)}")
-                
-                # Sistema avançado de intervalos humanizados
-                if app_state['sending_active']:
-                    
-                    # Calcular fadiga da sessão (intervalos aumentam com o tempo)
-                    session_duration = (time.time() - session_start_time) / 60  # em minutos
-                    fatigue_multiplier = 1 + (session_duration * profile['fatigue_factor'] * 0.1)
-                    
-                    if msg_idx < len(sequence) - 1:
-                        # ===== INTERVALO ENTRE MENSAGENS DA SEQUÊNCIA =====
-                        # Usar perfil de comportamento
-                        base_time = base_sequence_interval * profile['base_mult']
-                        
-                        # Variação principal (±variance%)
-                        variance = random.uniform(-profile['variance'], profile['variance'])
-                        varied_time = base_time * (1 + variance)
-                        
-                        # Aplicar fadiga
-                        fatigued_time = varied_time * fatigue_multiplier
-                        
-                        # Adicionar micro-variações (simulando inconsistência humana)
-                        micro_variation = random.uniform(-0.3, 0.3)
-                        final_time = fatigued_time * (1 + micro_variation)
-                        
-                        # Ocasionalmente pausas mais longas (pessoa se distrai)
-                        if random.random() < 0.12:  # 12% chance
-                            distraction_time = random.uniform(5, 15)
-                            final_time += distraction_time
-                            add_log(f"😴 Pausa de distração... {distraction_time:.1f}s extra")
-                        
-                        # Mínimo e máximo realistas
-                        wait_time = max(1, min(final_time, 120))  # Entre 1s e 2min
-                        
-                        add_log(f"⏳ Aguardando {wait_time:.1f}s antes da próxima mensagem...")
-                        time.sleep(wait_time)
-            
-            # INTERVALO ENTRE CONTATOS (após completar toda a sequência)
-            if app_state['sending_active'] and contact_idx < len(contacts_to_send) - 1:
-                # ===== INTERVALO ENTRE CONTATOS =====
-                config_min = int(app_state['config'].get('min_interval_seconds', 15))
-                config_max = int(app_state['config'].get('max_interval_seconds', 30))
-                
-                # Calcular fadiga da sessão
-                session_duration = (time.time() - session_start_time) / 60  # em minutos
-                fatigue_multiplier = 1 + (session_duration * profile['fatigue_factor'] * 0.1)
-                
-                # Perfil de comportamento para intervalos entre contatos
-                profile_min = config_min * profile['base_mult']
-                profile_max = config_max * profile['base_mult']
-                
-                # Variação principal
-                variance = random.uniform(-profile['variance'] * 0.5, profile['variance'])
-                varied_min = profile_min * (1 + variance)
-                varied_max = profile_max * (1 + variance)
-                
-                # Garantir ordem lógica
-                if varied_min > varied_max:
-                    varied_min, varied_max = varied_max, varied_min
-                
-                # Aplicar fadiga
-                fatigued_min = varied_min * fatigue_multiplier
-                fatigued_max = varied_max * fatigue_multiplier
-                
-                # Selecionar tempo aleatório no range
-                wait_time = random.uniform(fatigued_min, fatigued_max)
-                
-                # Padrões especiais de comportamento humano
-                random_behavior = random.random()
-                
-                if random_behavior < 0.05:  # 5% - Pressa súbita
-                    wait_time *= random.uniform(0.3, 0.6)
-                    add_log(f"🏃‍♂️ Acelerando ritmo...")
-                elif random_behavior < 0.15:  # 10% - Pausa longa
-                    extra_time = random.uniform(20, 60)
-                    wait_time += extra_time
-                    add_log(f"☕ Pausa longa... +{extra_time:.1f}s")
-                elif random_behavior < 0.25:  # 10% - Ritmo irregular
-                    wait_time *= random.uniform(0.7, 1.4)
-                    add_log(f"🎲 Ritmo irregular...")
-                
-                # Pausas por "blocos de tempo" (simula horários de trabalho)
-                hour = datetime.now().hour
-                if hour in [12, 13] or hour in [17, 18, 19]:  # Horário de almoço/jantar
-                    if random.random() < 0.3:  # 30% chance
-                        meal_pause = random.uniform(10, 30)
-                        wait_time += meal_pause
-                        add_log(f"🍽️ Pausa para refeição... +{meal_pause:.1f}s")
-                
-                # Limites finais
-                wait_time = max(3, min(wait_time, 300))  # Entre 3s e 5min
-                
-                # Log final com contexto
-                log_msg = f"⏳ Aguardando {wait_time:.1f}s antes do próximo contato"
-                if fatigue_multiplier > 1.3:
-                    log_msg += " (fadiga detectada)"
-                add_log(log_msg)
-                
-                time.sleep(wait_time)
-        
-        # Finalizar envio
-        app_state['sending_active'] = False
-        
-        success_count = app_state['send_progress']['success']
-        error_count = app_state['send_progress']['error']
-        total_count = app_state['send_progress']['total']
-        
-        success_rate = (success_count / total_count) * 100 if total_count > 0 else 0
-        
-        session_duration = (time.time() - session_start_time) / 60
-        
-        add_log("=" * 50)
-        add_log("🎉 SEQUÊNCIA CONCLUÍDA!")
-        add_log(f"✅ Sucessos: {success_count}")
-        add_log(f"❌ Erros: {error_count}")
-        add_log(f"📈 Taxa de sucesso: {success_rate:.1f}%")
-        add_log(f"⏱️ Duração da sessão: {session_duration:.1f} minutos")
-        add_log(f"🎭 Perfil usado: {profile_name}")
-        
-    except Exception as e:
-        app_state['sending_active'] = False
-        add_log(f"💥 Erro crítico no envio: {str(e)}")
-        
-    finally:
-        app_state['send_progress']['current_contact'] = 'Envio finalizado'
-
-
-def get_media_icon(media_type):
-    """Retorna ícone para tipo de mídia"""
-    icons = {
-        'image': '📷',
-        'video': '🎥',
-        'audio': '🎵',
-        'document': '📄'
-    }
-    return icons.get(media_type, '📎')
-
-
-def add_log(message):
+def add_log(message, timestamp=None):
     """Adicionar mensagem ao log"""
-    timestamp = datetime.now().strftime("%H:%M:%S")
+    timestamp = timestamp or datetime.now().strftime("%H:%M:%S")
     log_entry = {
         'timestamp': timestamp,
         'message': message
@@ -987,6 +933,10 @@ def add_log(message):
         app_state['logs'] = app_state['logs'][-500:]  # Reduzir para 500
 
 
+# Campanhas rodam no sender_worker; o servidor só enfileira e observa
+campaign_queue = CampaignQueueClient(CampaignQueue(), add_log)
+
+
 def load_initial_config():
     """Carregar configuração inicial"""
     try:
@@ -1001,6 +951,22 @@ def open_browser():
     webbrowser.open('http://127.0.0.1:5000')
 
 
+def _media_response(record, original_name: str):
+    """Resposta de upload de mídia a partir do registro do MediaStore"""
+    if record['deduplicated']:
+        add_log(f"📁 Arquivo já existente reutilizado: {original_name}")
+    else:
+        add_log(f"📁 Arquivo enviado: {original_name}")
+
+    return jsonify({
+        'success': True,
+        'filepath': record['path'],
+        'filename': os.path.basename(record['path']),
+        'original_name': original_name,
+        'media': {k: record[k] for k in ('sha256', 'size', 'mime_type', 'width', 'height', 'duration')}
+    })
+
+
 @app.route('/api/upload_media', methods=['POST'])
 async def upload_media():
     """Upload de arquivo de mídia"""
@@ -1014,49 +980,124 @@ async def upload_media():
             return jsonify({'success': False, 'message': 'Nenhum arquivo selecionado'})
         
         # Validar tipo de arquivo
-        allowed_extensions = {
-            'image': ['jpg', 'jpeg', 'png', 'gif', 'webp'],
-            'video': ['mp4', 'avi', 'mov', 'wmv', 'flv', 'mkv'],
-            'audio': ['mp3', 'wav', 'ogg', 'aac', 'm4a', 'flac'],
-            'document': ['pdf', 'doc', 'docx', 'xls', 'xlsx', 'txt', 'rtf']
-        }
-        
         file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
-        is_valid = any(file_ext in extensions for extensions in allowed_extensions.values())
+        is_valid = any(file_ext in extensions for extensions in MEDIA_EXTENSIONS.values())
         
         if not is_valid:
             return jsonify({'success': False, 'message': 'Tipo de arquivo não suportado'})
         
-        # Gerar nome único para o arquivo
+        # Grava pelo sha256 calculado durante a cópia; arquivo repetido não ocupa espaço de novo
         filename = secure_filename(file.filename)
-        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        name, ext = os.path.splitext(filename)
-        unique_filename = f"{timestamp}_{name}{ext}"
-        
-        # Salvar arquivo
-        media_folder = os.path.join(app.config['UPLOAD_FOLDER'], 'media')
-        os.makedirs(media_folder, exist_ok=True)
-        
-        filepath = os.path.join(media_folder, unique_filename)
-        await file.save(str(filepath))
-        
-        # Retornar caminho relativo
-        relative_path = os.path.join('uploads', 'media', unique_filename).replace('\\', '/')
-        
-        add_log(f"📁 Arquivo enviado: {unique_filename}")
-        
-        return jsonify({
-            'success': True,
-            'filepath': relative_path,
-            'filename': unique_filename,
-            'original_name': file.filename
-        })
+        record = await asyncio.get_running_loop().run_in_executor(
+            None, media_store.put_stream, file.stream, filename
+        )
+        return _media_response(record, file.filename)
         
     except Exception as e:
         add_log(f"❌ Erro no upload: {str(e)}")
         return jsonify({'success': False, 'message': str(e)})
 
 
+def _upload_error(e: UploadError):
+    body = {'success': False, 'error': str(e)}
+    if e.offset is not None:
+        body['offset'] = e.offset
+    return jsonify(body), e.status
+
+
+@app.route('/api/uploads', methods=['POST'])
+async def api_upload_init():
+    """
+    Abre um upload em partes
+
+    JSON: ``kind`` (contacts/media), ``filename``, ``size`` e ``sha256`` opcional.
+    Depois: PUT /api/uploads/<id>?offset=N com os bytes da parte, GET para
+    saber o offset após uma queda e POST /api/uploads/<id>/complete.
+    """
+    data = await request.get_json() or {}
+    # Limites por tipo em MB (config.json: upload_limits_mb)
+    upload_manager.limits_mb = (app_state['config'] or {}).get('upload_limits_mb', {})
+    try:
+        upload = upload_manager.init(data.get('kind', ''), data.get('filename', ''),
+                                     int(data.get('size') or 0), data.get('sha256'))
+    except UploadError as e:
+        return _upload_error(e)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Tamanho do arquivo inválido'}), 400
+    return jsonify({'success': True, **upload})
+
+
+@app.route('/api/uploads/<upload_id>', methods=['GET'])
+async def api_upload_status(upload_id):
+    try:
+        return jsonify({'success': True, **upload_manager.status(upload_id)})
+    except UploadError as e:
+        return _upload_error(e)
+
+
+@app.route('/api/uploads/<upload_id>', methods=['PUT'])
+async def api_upload_chunk(upload_id):
+    """Recebe uma parte; o offset vem de ?offset= ou do cabeçalho Content-Range"""
+    offset = request.args.get('offset')
+    content_range = request.headers.get('Content-Range', '')
+    if offset is None and content_range.startswith('bytes '):
+        offset = content_range[len('bytes '):].split('-', 1)[0]
+    try:
+        offset = int(offset or 0)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Offset inválido'}), 400
+
+    try:
+        upload = await upload_manager.write_chunk(upload_id, offset, request.body)
+    except UploadError as e:
+        return _upload_error(e)
+    return jsonify({'success': True, **upload})
+
+
+@app.route('/api/uploads/<upload_id>/complete', methods=['POST'])
+async def api_upload_complete(upload_id):
+    """Conclui o upload: planilha é carregada direto do arquivo gravado, mídia vai para o MediaStore"""
+    data = await request.get_json(silent=True) or {}
+    try:
+        upload = await upload_manager.complete(upload_id, data.get('sha256'))
+    except UploadError as e:
+        return _upload_error(e)
+
+    filename = secure_filename(upload['filename'])
+    try:
+        if upload['kind'] == 'contacts':
+            if data.get('async') or request.args.get('async') == '1':
+                # O job lê o arquivo depois que o upload é descartado: tira da pasta de entrada antes
+                filepath = Path(app.config['UPLOAD_FOLDER']).resolve() / f"{upload_id}-{filename}"
+                os.replace(upload['path'], filepath)
+                return _start_import_job(filepath, filename, _requested_sheets(data.get('sheets')))
+            return await _load_contacts_file(Path(upload['path']), filename, _requested_sheets(data.get('sheets')))
+
+        record = await asyncio.get_running_loop().run_in_executor(
+            None, media_store.adopt, upload['path'], filename, upload['sha256'], upload['size']
+        )
+        return _media_response(record, upload['filename'])
+    except Exception as e:
+        add_log(f"❌ Erro no upload: {str(e)}")
+        return jsonify({'success': False, 'error': str(e)})
+    finally:
+        upload_manager.discard(upload_id)
+
+
+@app.route('/api/jobs', methods=['GET'])
+async def api_jobs():
+    return jsonify({'success': True, 'jobs': job_manager.list()})
+
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+async def api_job_status(job_id):
+    """Progresso e resultado de um job de importação/validação"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Job não encontrado'}), 404
+    return jsonify({'success': True, **job.to_dict()})
+
+
 @app.route('/api/save_template', methods=['POST'])
 async def save_template():
     """Salvar template de sequência"""
@@ -1074,7 +1115,6 @@ async def save_template():
         # Sanitizar nome do arquivo
         safe_name = "".join(c for c in template_name if c.isalnum() or c in (' ', '-', '_')).rstrip()
         filename = f"{safe_name}.json"
-        filepath = os.path.join(TEMPLATES_FOLDER, filename)
         
         # Preparar dados do template
         template_data = {
@@ -1086,8 +1126,8 @@ async def save_template():
         }
         
         # Salvar arquivo
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(template_data, f, ensure_ascii=False, indent=2)
+        await template_repository.save(filename, template_data)
+        await storage.run(media_store.set_sequence_refs, f'template:{filename}', template_data['sequence'])
         
         add_log(f"💾 Template salvo: {template_name}")
         
@@ -1099,31 +1139,18 @@ async def save_template():
 
 
 @app.route('/api/get_templates', methods=['GET'])
-def get_templates():
-    """Obter lista de templates salvos"""
+async def get_templates():
+    """Obter lista de templates salvos (?q= busca no nome, ?offset=&limit= paginam)"""
     try:
-        templates = []
-        
-        if os.path.exists(TEMPLATES_FOLDER):
-            for filename in os.listdir(TEMPLATES_FOLDER):
-                if filename.endswith('.json'):
-                    filepath = os.path.join(TEMPLATES_FOLDER, filename)
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            template_data = json.load(f)
-                            templates.append({
-                                'name': template_data.get('name', filename[:-5]),
-                                'created_at': template_data.get('created_at', ''),
-                                'message_count': len(template_data.get('sequence', []))
-                            })
-                    except Exception as e:
-                        add_log(f"⚠️ Erro ao ler template {filename}: {str(e)}")
-                        continue
+        limit = request.args.get('limit', type=int)
+        result = await template_repository.list(
+            request.args.get('q', ''),
+            max(request.args.get('offset', 0, type=int), 0),
+            max(limit, 1) if limit is not None else None
+        )
         
-        # Ordenar por data de criação (mais recente primeiro)
-        templates.sort(key=lambda x: x.get('created_at', ''), reverse=True)
-        
-        return jsonify({'success': True, 'templates': templates})
+        # Ordenados por data de criação (mais recente primeiro)
+        return jsonify({'success': True, **result})
         
     except Exception as e:
         add_log(f"❌ Erro ao listar templates: {str(e)}")
@@ -1131,23 +1158,11 @@ def get_templates():
 
 
 @app.route('/api/load_template/<template_name>', methods=['GET'])
-def load_template(template_name):
+async def load_template(template_name):
     """Carregar template específico"""
     try:
-        # Procurar arquivo do template
-        template_file = None
-        if os.path.exists(TEMPLATES_FOLDER):
-            for filename in os.listdir(TEMPLATES_FOLDER):
-                if filename.endswith('.json'):
-                    filepath = os.path.join(TEMPLATES_FOLDER, filename)
-                    try:
-                        with open(filepath, 'r', encoding='utf-8') as f:
-                            template_data = json.load(f)
-                            if template_data.get('name') == template_name:
-                                template_file = template_data
-                                break
-                    except Exception:
-                        continue
+        # Busca pelo índice de nomes (sem percorrer a pasta)
+        template_file = await template_repository.get(template_name)
         
         if not template_file:
             return jsonify({'success': False, 'message': 'Template não encontrado'})
@@ -1395,6 +1410,8 @@ async def start_waha_session():
                 response_data = await response.json()
                 
                 if response.status in [200, 201]:
+                    # Nova sessão gera um novo QR; descartar captura em cache
+                    waha_dashboard_pool.invalidate()
                     return jsonify({
                         'success': True,
                         'message': 'Sessão iniciada com sucesso',
@@ -1412,14 +1429,56 @@ async def start_waha_session():
             'error': f'Erro ao iniciar sessão: {str(e)}'
         }), 500
 
+@app.route('/api/monitor/history', methods=['GET'])
+async def get_monitor_history():
+    """Histórico do monitor (agregado para gráficos) lido do arquivo circular"""
+    bucket = request.args.get('bucket', type=float)
+    if 'bucket' in request.args and (bucket is None or not 0 < bucket < float('inf')):
+        return jsonify({'success': False, 'error': 'bucket deve ser um número de segundos maior que zero'}), 400
+
+    path = (app_state['config'] or {}).get('monitor_historico_arquivo', DEFAULT_HISTORY_FILE)
+    try:
+        # Leitura do mmap e agregação do período inteiro: fora do event loop
+        history = await asyncio.get_running_loop().run_in_executor(
+            None, _read_monitor_history, path, request.args.get('start', type=float),
+            request.args.get('end', type=float), request.args.get('key') or None, bucket
+        )
+    except FileNotFoundError:
+        return jsonify({'success': False, 'error': 'Nenhum histórico do monitor gravado ainda'}), 404
+    except ValueError as e:
+        # Arquivo vazio, truncado ou de outra versão
+        return jsonify({'success': False, 'error': str(e)}), 409
+    return jsonify({'success': True, **history})
+
+
+def _read_monitor_history(path, start, end, key, bucket):
+    store = MonitorHistoryStore(path, readonly=True)
+    try:
+        first, last = store.time_span()
+        if start is None:
+            start = first
+
+        # Sem bucket explícito, mirar em ~500 pontos no período pedido
+        if bucket is None:
+            span = ((end or last or 0) - (start or 0)) if first is not None else 0
+            bucket = max(60.0, span / 500)
+
+        return {
+            'keys': store.keys(),
+            'bucket_seconds': bucket,
+            'series': store.downsample(bucket, start=start, end=end, key=key)
+        }
+    finally:
+        store.close()
+
+
 # WhatsApp Web (Playwright) Routes
 @app.route('/api/whatsapp/qr_code', methods=['POST'])
 async def get_whatsapp_qr_code():
-    # Garante que a sessão esteja iniciada apenas se não estiver ativa
-    if not whatsapp_manager.browser:
-        success = await whatsapp_manager.start_session()
-        if not success:
-            return jsonify({'success': False, 'error': 'Failed to start WhatsApp Web session.'}), 500
+    # Inicia a sessão sob o lock do manager: a restauração do startup pode estar abrindo o mesmo perfil
+    await whatsapp_manager.ensure_browser_is_running()
+    if not whatsapp_manager.is_running():
+        return jsonify({'success': False, 'error': 'Failed to start WhatsApp Web session.'}), 500
 
     qr_base64, error = await whatsapp_manager.get_qr_code()
     if error:
@@ -1430,99 +1489,19 @@ async def get_whatsapp_qr_code():
 
 @app.route('/api/waha/qr_screenshot', methods=['POST'])
 async def get_waha_qr_screenshot():
-    """Captura screenshot do QR code do dashboard WAHA usando Playwright"""
+    """Captura screenshot do QR code do dashboard WAHA usando o pool de navegador"""
     try:
-        from playwright.async_api import async_playwright
-        
-        async with async_playwright() as p:
-            # Usar Chromium em modo headless
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context(
-                viewport={'width': 1280, 'height': 720}
-            )
-            page = await context.new_page()
-            
-            try:
-                # Navegar para o dashboard WAHA
-                await page.goto('http://localhost:3000/dashboard/', wait_until='networkidle')
-                
-                # Aguardar mais tempo para a SPA carregar completamente
-                await page.wait_for_timeout(8000)
-                
-                # Aguardar que o loading desapareça
-                try:
-                    await page.wait_for_selector('#loading-body', state='hidden', timeout=10000)
-                except:
-                    pass  # Se não encontrar o loading, continua
-                
-                # Aguardar mais um pouco após o loading
-                await page.wait_for_timeout(3000)
-                
-                # Tentar encontrar o QR code usando diferentes seletores
-                qr_selectors = [
-                    'canvas',  # QR code geralmente é renderizado em canvas
-                    '[data-testid="qr-code"]',
-                    '.qr-code',
-                    '#qr-code',
-                    'img[alt*="QR"]',
-                    'img[src*="qr"]',
-                    'svg',  # QR code pode ser SVG
-                    '.p-image',  # PrimeVue image component
-                    '[role="img"]'  # Elementos com role de imagem
-                ]
-                
-                qr_element = None
-                for selector in qr_selectors:
-                    try:
-                        qr_element = await page.wait_for_selector(selector, timeout=3000)
-                        if qr_element:
-                            break
-                    except:
-                        continue
-                
-                if qr_element:
-                    # Capturar screenshot do elemento QR code
-                    screenshot_bytes = await qr_element.screenshot()
-                    qr_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-                    
-                    await browser.close()
-                    return jsonify({
-                        'success': True,
-                        'qr_code': qr_base64
-                    })
-                else:
-                    # Se não encontrar QR code específico, capturar página completa para debug
-                    full_screenshot = await page.screenshot(full_page=True)
-                    
-                    # Salvar screenshot completo para debug
-                    with open('debug_full_page.png', 'wb') as f:
-                        f.write(full_screenshot)
-                    
-                    # Capturar área central da página
-                    screenshot_bytes = await page.screenshot(
-                        clip={'x': 400, 'y': 200, 'width': 400, 'height': 400}
-                    )
-                    qr_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-                    
-                    # Obter HTML da página para debug
-                    page_content = await page.content()
-                    with open('debug_page_content.html', 'w', encoding='utf-8') as f:
-                        f.write(page_content)
-                    
-                    await browser.close()
-                    return jsonify({
-                        'success': True,
-                        'qr_code': qr_base64,
-                        'note': 'QR code específico não encontrado, capturada área central. Debug: debug_full_page.png e debug_page_content.html salvos'
-                    })
-                    
-            except Exception as e:
-                await browser.close()
-                return jsonify({
-                    'success': False,
-                    'error': f'Erro ao capturar QR code: {str(e)}'
-                }), 500
-                
+        force = request.args.get('force', '').lower() in ('1', 'true', 'yes')
+        qr_base64, note = await waha_dashboard_pool.capture_qr(force=force)
+
+        response = {
+            'success': True,
+            'qr_code': qr_base64
+        }
+        if note:
+            response['note'] = note
+        return jsonify(response)
+
     except ImportError:
         return jsonify({
             'success': False,
@@ -1531,10 +1510,92 @@ async def get_waha_qr_screenshot():
     except Exception as e:
         return jsonify({
             'success': False,
-            'error': f'Erro interno: {str(e)}'
+            'error': f'Erro ao capturar QR code: {str(e)}'
         }), 500
 
 
+async def _media_gc_loop():
+    """Remove periodicamente as mídias sem referência e os uploads em partes abandonados"""
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, media_store.gc)
+            await loop.run_in_executor(None, upload_manager.cleanup)
+        except Exception as e:
+            logging.getLogger(__name__).warning(f"Falha na limpeza de mídias: {e}")
+        await asyncio.sleep((app_state['config'] or {}).get('media_gc_interval_seconds', MEDIA_GC_INTERVAL))
+
+
+@app.before_request
+async def track_loop_route():
+    # Rota da requisição em execução, para atribuir travamentos do event loop
+    loop_monitor.track(f"{request.method} {request.path}")
+
+
+@app.teardown_request
+async def untrack_loop_route(exc):
+    loop_monitor.untrack()
+
+
+@app.route('/debug/loop')
+async def debug_loop():
+    """Atraso do event loop: histograma, piores rotas e amostras de pilha"""
+    return jsonify(loop_monitor.snapshot(int(request.args.get('top', 10))))
+
+
+@app.before_serving
+async def build_template_index():
+    await template_repository.refresh()
+
+
+@app.before_serving
+async def start_loop_monitor():
+    config = app_state['config'] or {}
+    loop_monitor.threshold = config.get('loop_monitor_threshold_ms', loop_monitor.threshold * 1000) / 1000
+    loop_monitor.start()
+
+
+@app.after_serving
+async def stop_loop_monitor():
+    loop_monitor.stop()
+
+
+@app.before_serving
+async def start_media_gc():
+    app.media_gc_task = asyncio.get_running_loop().create_task(_media_gc_loop())
+
+
+@app.after_serving
+async def stop_media_gc():
+    app.media_gc_task.cancel()
+
+
+@app.after_serving
+async def shutdown_jobs():
+    """Cancela jobs em andamento e encerra o pool de processos"""
+    job_manager.shutdown()
+    storage.shutdown()
+
+
+@app.after_serving
+async def shutdown_browser_pool():
+    """Encerra o navegador compartilhado ao parar o servidor"""
+    await waha_dashboard_pool.close()
+
+
+@app.before_serving
+async def restore_whatsapp_web():
+    """Reabre a sessão salva do WhatsApp Web em segundo plano (o servidor não espera a página carregar)"""
+    app.whatsapp_restore_task = asyncio.get_running_loop().create_task(whatsapp_manager.restore_session())
+
+
+@app.after_serving
+async def shutdown_whatsapp_web():
+    """Fecha o WhatsApp Web gravando o perfil persistente em disco"""
+    app.whatsapp_restore_task.cancel()
+    await whatsapp_manager.close_session()
+
+
 
 
 
@@ -1,42 +1,144 @@
 import asyncio
 import base64
 import logging
+import os
+import time
 from playwright.async_api import async_playwright
 
 # Configuração do logger
 logger = logging.getLogger(__name__)
 
+WHATSAPP_WEB_URL = "https://web.whatsapp.com"
+SESSIONS_FOLDER = "whatsapp_sessions"
+
+# Tipos de recurso que não precisamos carregar no WhatsApp Web
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media"}
+
+# Elementos que só existem com a conta já conectada
+LOGGED_IN_SELECTORS = 'div[data-testid="search-input-container"], #pane-side'
+
+# Tempo máximo de cada espera do observador antes de revalidar a página
+WATCH_POLL_TIMEOUT = 60000
+
+
+def _env_flag(name, default):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() not in ("0", "false", "no", "off")
+
+
 class WhatsAppWebManager:
-    def __init__(self):
+    def __init__(self, session_name="default", sessions_folder=SESSIONS_FOLDER, headless=None):
+        self.session_name = session_name
+        self.user_data_dir = os.path.abspath(os.path.join(sessions_folder, session_name))
+        # Headless por padrão; WHATSAPP_WEB_HEADLESS=0 abre a janela para depuração
+        self.headless = _env_flag("WHATSAPP_WEB_HEADLESS", True) if headless is None else headless
         self.playwright = None
         self.browser = None
         self.page = None
         self.context = None
         self.connection_status = "disconnected"
         self.lock = asyncio.Lock()
+        self.status_updated_at = time.time()
+        self._watcher_task = None
+        self._navigated = asyncio.Event()
+        self._subscribers = set()
+
+    def is_running(self):
+        return bool(self.context and self.page and not self.page.is_closed())
+
+    def has_saved_profile(self):
+        return os.path.isdir(self.user_data_dir) and bool(os.listdir(self.user_data_dir))
+
+    async def restore_session(self):
+        """
+        Reabre a sessão do perfil salvo ao iniciar o servidor, sem esperar o
+        connect/QR manual. Sem perfil salvo (ou com WHATSAPP_WEB_RESTORE=0)
+        nenhum navegador é aberto.
+        """
+        if not _env_flag("WHATSAPP_WEB_RESTORE", True):
+            return False
+        if not await asyncio.get_running_loop().run_in_executor(None, self.has_saved_profile):
+            logger.info("No saved WhatsApp Web profile; session will start on first connect.")
+            return False
+        logger.info(f"Restoring saved WhatsApp Web session '{self.session_name}'...")
+        await self.ensure_browser_is_running()
+        return self.is_running()
 
     async def ensure_browser_is_running(self):
         async with self.lock:
-            if not self.browser or not self.browser.is_connected():
+            if not self.is_running():
                 logger.info("Browser not running. Starting new session...")
                 await self.start_session()
 
     async def start_session(self):
-        logger.info("Attempting to start Playwright session...")
+        logger.info(f"Attempting to start Playwright session '{self.session_name}'...")
+        if self.playwright or self.context:
+            # Página/contexto morreu: o driver antigo (e um Chromium ainda vivo com o
+            # lock do user_data_dir) precisa sair antes do launch_persistent_context
+            logger.info("Tearing down previous Playwright session before relaunching...")
+            await self._teardown()
         try:
-            self.playwright = await async_playwright().start()
-            self.browser = await self.playwright.chromium.launch(headless=False)
-            self.context = await self.browser.new_context()
-            self.page = await self.context.new_page()
-            self.connection_status = "pending_qr"
-            logger.info("Playwright session started successfully.")
+            os.makedirs(self.user_data_dir, exist_ok=True)
+            launch = asyncio.ensure_future(self._launch())
+            try:
+                await asyncio.shield(launch)
+            except asyncio.CancelledError:
+                # Cancelado no meio (ex.: servidor encerrando durante a restauração): o driver
+                # não pode ficar órfão, então o launch termina e o _teardown fecha tudo
+                await asyncio.wait([launch])
+                if not launch.cancelled() and launch.exception() is not None:
+                    logger.warning(f"Playwright launch failed during cancellation: {launch.exception()}")
+                raise
+            await self.context.route("**/*", self._block_heavy_resources)
+            self.page = self.context.pages[0] if self.context.pages else await self.context.new_page()
+            self.page.on("framenavigated", self._on_navigated)
+            await self._open_whatsapp_web()
+            self._start_watcher()
+            logger.info(f"Playwright session started successfully (status: {self.connection_status}).")
             return True
         except Exception as e:
-            self.connection_status = "error"
+            self._set_status("error")
             logger.error(f"Error starting Playwright session: {e}", exc_info=True)
-            await self.close_session() # Garante que tudo seja limpo em caso de falha
+            await self._teardown() # Garante que tudo seja limpo em caso de falha
             return False
 
+    async def _launch(self):
+        self.playwright = await async_playwright().start()
+        # Contexto persistente: cookies e IndexedDB do WhatsApp sobrevivem a reinícios
+        self.context = await self.playwright.chromium.launch_persistent_context(
+            self.user_data_dir,
+            headless=self.headless,
+            viewport={"width": 1280, "height": 800},
+        )
+        self.browser = self.context.browser
+
+    async def _block_heavy_resources(self, route):
+        if route.request.resource_type in BLOCKED_RESOURCE_TYPES:
+            await route.abort()
+        else:
+            await route.continue_()
+
+    async def _open_whatsapp_web(self):
+        """Navega para o WhatsApp Web apenas se a página ainda não estiver lá."""
+        if not self.page.url.startswith(WHATSAPP_WEB_URL):
+            logger.info("Navigating to WhatsApp Web...")
+            await self.page.goto(WHATSAPP_WEB_URL, timeout=60000, wait_until="domcontentloaded")
+
+        # Com a sessão salva, a interface principal aparece sem QR code
+        try:
+            await self.page.wait_for_selector(f"canvas, {LOGGED_IN_SELECTORS}", timeout=60000)
+        except Exception as e:
+            logger.warning(f"WhatsApp Web did not render QR or chat list: {e}")
+            self._set_status("pending_qr")
+            return
+        if await self.page.query_selector(LOGGED_IN_SELECTORS):
+            self._set_status("connected")
+            logger.info("Saved session restored; already connected.")
+        else:
+            self._set_status("pending_qr")
+
     async def get_qr_code(self):
         logger.info("Attempting to get QR code...")
         await self.ensure_browser_is_running()
@@ -44,9 +146,13 @@ class WhatsAppWebManager:
             logger.warning("get_qr_code called but page is not initialized.")
             return None, "Session not started."
 
+        if self.connection_status == "connected":
+            return None, "Already connected."
+
         try:
-            logger.info("Navigating to WhatsApp Web...")
-            await self.page.goto("https://web.whatsapp.com", timeout=60000)
+            await self._open_whatsapp_web()
+            if self.connection_status == "connected":
+                return None, "Already connected."
             logger.info("Page loaded. Waiting for QR code selector...")
             # Tentar múltiplos seletores para o QR Code
             qr_selectors = [
@@ -79,57 +185,129 @@ class WhatsAppWebManager:
             logger.info("Taking screenshot of QR code...")
             screenshot_bytes = await qr_element.screenshot()
             qr_base64 = base64.b64encode(screenshot_bytes).decode('utf-8')
-            self.connection_status = "waiting_scan"
+            self._set_status("waiting_scan")
             logger.info("QR code generated successfully.")
             return qr_base64, None
         except Exception as e:
-            self.connection_status = "error"
+            self._set_status("error")
             logger.error(f"Error getting QR code: {e}", exc_info=True)
             return None, f"Error getting QR code: {e}"
 
+    def _set_status(self, status):
+        if status == self.connection_status:
+            return
+        logger.info(f"Connection status: '{self.connection_status}' -> '{status}'.")
+        self.connection_status = status
+        self.status_updated_at = time.time()
+        event = self.get_connection_status()
+        for queue in list(self._subscribers):
+            if queue.full():
+                queue.get_nowait() # Assinante lento: descarta o evento mais antigo
+            queue.put_nowait(event)
+
+    def subscribe(self, maxsize=10):
+        """Retorna uma fila que recebe cada mudança de status."""
+        queue = asyncio.Queue(maxsize=maxsize)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
     def get_connection_status(self):
         # This method should be lightweight and not perform async operations.
         # It just returns the current state.
-        return {'status': self.connection_status}
+        return {'status': self.connection_status, 'updated_at': self.status_updated_at}
 
     async def check_connection_status_periodically(self):
-        if self.page and self.connection_status == "waiting_scan":
-            logger.info("Checking connection status...")
-            try:
-                # Wait for the QR code canvas to disappear.
-                logger.info("Waiting for QR code canvas to disappear...")
-                await self.page.wait_for_selector('canvas', state='hidden', timeout=10000)
-                logger.info("QR code canvas is hidden. Checking for main chat interface...")
-
-                # Check if the main chat interface is loaded by looking for a stable element.
-                # Using the search input container as it's usually reliable.
-                await self.page.wait_for_selector('div[data-testid="search-input-container"]', timeout=15000)
-                self.connection_status = "connected"
-                logger.info("Connection status is now 'connected'.")
-            except Exception as e:
-                logger.warning(f"Failed to confirm connection: {e}")
-                # If it fails, we check if we are still on the main page or if there was a redirect/error.
-                if "https://web.whatsapp.com/" in self.page.url:
-                    # Still on the main page, maybe the QR code just timed out and will refresh.
-                    self.connection_status = "pending_qr" # Reset to allow getting a new QR
-                    logger.info("QR code likely timed out. Resetting status to 'pending_qr'.")
-                else:
-                    self.connection_status = "timeout"
-                    logger.warning("Page URL changed or timed out. Status set to 'timeout'.")
+        # Mantido por compatibilidade: o observador em segundo plano já
+        # atualiza o estado, então isto é apenas uma leitura do cache.
         return self.get_connection_status()
 
+    def _on_navigated(self, frame):
+        if self.page and frame == self.page.main_frame:
+            self._navigated.set()
+
+    def _start_watcher(self):
+        if self._watcher_task is None or self._watcher_task.done():
+            self._watcher_task = asyncio.create_task(self._watch_connection())
+
+    async def _stop_watcher(self):
+        task, self._watcher_task = self._watcher_task, None
+        if task and not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+    async def _watch_connection(self):
+        """Observa o DOM e as navegações da página e mantém connection_status."""
+        logger.info("Connection watcher started.")
+        while self.page and not self.page.is_closed():
+            if self.connection_status == "connected":
+                # Conectado: espera a interface da conta sumir (outros canvas da
+                # página não importam, e a espera não volta enquanto ela existir)
+                state, new_status = "detached", "pending_qr"
+            else:
+                state, new_status = "attached", "connected"
+
+            self._navigated.clear()
+            element_wait = asyncio.create_task(
+                self.page.wait_for_selector(LOGGED_IN_SELECTORS, state=state, timeout=WATCH_POLL_TIMEOUT)
+            )
+            navigation_wait = asyncio.create_task(self._navigated.wait())
+            try:
+                done, _ = await asyncio.wait(
+                    {element_wait, navigation_wait}, return_when=asyncio.FIRST_COMPLETED
+                )
+            finally:
+                for task in (element_wait, navigation_wait):
+                    if not task.done():
+                        task.cancel()
+
+            if element_wait in done and element_wait.exception() is None:
+                if new_status == "pending_qr" and await self._still_logged_in():
+                    continue # Interface só foi redesenhada, ainda conectado
+                self._set_status(new_status)
+            elif navigation_wait in done and not self.page.url.startswith(WHATSAPP_WEB_URL):
+                self._set_status("timeout")
+                await asyncio.sleep(1)
+        if self.connection_status != "disconnected":
+            self._set_status("disconnected")
+        logger.info("Connection watcher stopped.")
+
+    async def _still_logged_in(self):
+        """Depois que a interface da conta sumiu: ela voltou (re-render) ou apareceu o QR code?"""
+        try:
+            await self.page.wait_for_selector(f"canvas, {LOGGED_IN_SELECTORS}", state="attached",
+                                              timeout=WATCH_POLL_TIMEOUT)
+        except Exception:
+            pass
+        return await self.page.query_selector(LOGGED_IN_SELECTORS) is not None
+
     async def close_session(self):
         async with self.lock:
-            if self.browser and self.browser.is_connected():
-                await self.browser.close()
-            if self.playwright:
+            await self._teardown()
+
+    async def _teardown(self):
+        await self._stop_watcher()
+        if self.context:
+            try:
+                await self.context.close() # Persiste o perfil em disco
+            except Exception as e:
+                logger.warning(f"Error closing browser context: {e}")
+        if self.playwright:
+            try:
                 await self.playwright.stop() # Encerra o processo do Playwright
-            self.browser = None
-            self.page = None
-            self.context = None
-            self.playwright = None
-            self.connection_status = "disconnected"
-            logger.info("Playwright session closed.")
+            except Exception as e:
+                logger.warning(f"Error stopping Playwright: {e}")
+        self.browser = None
+        self.page = None
+        self.context = None
+        self.playwright = None
+        self._set_status("disconnected")
+        logger.info("Playwright session closed.")
 
 # Singleton instance
 whatsapp_manager = WhatsAppWebManager()
\ No newline at end of file